@@ -4,6 +4,11 @@
 Preprocess appropriately formatted csv data into PreprocessedData object
 """
 import copy
+import hashlib
+import json
+import os
+import shutil
+import tempfile
 
 import numpy as np
 import pandas as pd
@@ -12,9 +17,66 @@ import theano
 
 from .preprocessed_data import PreprocessedData
 
+# bump this whenever preprocess_data changes its output, to invalidate existing cache entries
+_CACHE_VERSION = 2
+
+
+def _load_region_day_arrays(df, regions, Ds, CMs):
+    """
+    Pull (region, day) arrays out of the long-format dataframe in a single vectorised pass.
+
+    Rows are selected for every (region, day) pair at once, so the resulting arrays are simple reshapes of the selected
+    columns. A KeyError is raised if any (region, day) pair is missing from the data.
+
+    :param df: dataframe indexed by ["Country Code", "Date"]
+    :param regions: ordered list of region codes
+    :param Ds: ordered list of days
+    :param CMs: list of NPI columns
+    :return: (Confirmed, Deaths, Active, ActiveCMs, region names) tuple. The first three have shape (nRs, nDs),
+             ActiveCMs has shape (nRs, nCMs, nDs). Region names are taken from the first day.
+    """
+    nRs = len(regions)
+    nDs = len(Ds)
+    nCMs = len(CMs)
+
+    rows = df.loc[pd.MultiIndex.from_product([regions, Ds])]
+
+    Confirmed = rows['Confirmed'].to_numpy(dtype=np.float64).reshape((nRs, nDs))
+    Deaths = rows['Deaths'].to_numpy(dtype=np.float64).reshape((nRs, nDs))
+    Active = rows['Active'].to_numpy(dtype=np.float64).reshape((nRs, nDs))
+    # (nRs * nDs, nCMs) --> (nRs, nCMs, nDs)
+    ActiveCMs = np.ascontiguousarray(
+        rows[CMs].to_numpy(dtype=np.float64).reshape((nRs, nDs, nCMs)).transpose((0, 2, 1)))
+    region_names = rows['Region Name'].to_numpy().reshape((nRs, nDs))[:, 0]
+
+    return Confirmed, Deaths, Active, ActiveCMs, region_names
+
+
+def _cache_path(cache_dir, data_path, preprocessing_args, mmap=False):
+    """
+    Path of the cache entry for a given .csv file and set of preprocessing arguments.
+
+    The key is the hash of the .csv file contents together with all preprocessing arguments, so changing either gives a
+    different entry.
+
+    :param cache_dir: cache directory
+    :param data_path: path of .csv file
+    :param preprocessing_args: dictionary of all preprocess_data arguments (other than data_path and cache_dir)
+    :param mmap: if True, path of a directory entry for memory-mapping, else path of an .npz entry
+    :return: path of cache entry
+    """
+    h = hashlib.sha256()
+    with open(data_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+
+    h.update(json.dumps({'version': _CACHE_VERSION, **preprocessing_args}, sort_keys=True, default=str).encode('utf8'))
+    return os.path.join(cache_dir, h.hexdigest() if mmap else f'{h.hexdigest()}.npz')
+
 
 def preprocess_data(data_path, last_day=None, schools_unis='two_separate', drop_features=None, min_confirmed=100,
-                    min_deaths=10, smoothing=1, mask_zero_deaths=False, mask_zero_cases=False):
+                    min_deaths=10, smoothing=1, mask_zero_deaths=False, mask_zero_cases=False, cache_dir=None,
+                    mmap=False, active_cms_storage='float'):
     """
     Preprocess data .csv file, in our post-merge format, with different options.
 
@@ -33,8 +95,28 @@ def preprocess_data(data_path, last_day=None, schools_unis='two_separate', drop_
     :param smoothing: number of days over which to smooth. This should be an odd number. If 1, no smoothing occurs.
     :param mask_zero_deaths: bool, whether to ignore (i.e., mask) days with zero deaths.
     :param mask_zero_cases: bool, whether to ignore (i.e., mask) days with zero cases.
+    :param cache_dir: if not None, directory of an on-disk cache of preprocessed data. Entries are keyed on the .csv file
+                      contents and all other arguments, and are created on a cache miss.
+    :param mmap: bool, requires cache_dir. If True, cache entries are directories of .npy files which are memory-mapped
+                 (see PreprocessedData.load_mmap), so concurrent jobs using the same data share one read-only copy.
+    :param active_cms_storage: how to store ActiveCMs, one of 'float', 'uint8' or 'bits'. See
+                               PreprocessedData.compact_active_cms.
     :return: PreprocessedData object.
     """
+    if mmap and cache_dir is None:
+        raise ValueError('Memory-mapped preprocessed data requires cache_dir')
+
+    if cache_dir is not None:
+        cache_path = _cache_path(cache_dir, data_path, dict(
+            last_day=last_day, schools_unis=schools_unis, drop_features=drop_features, min_confirmed=min_confirmed,
+            min_deaths=min_deaths, smoothing=smoothing, mask_zero_deaths=mask_zero_deaths,
+            mask_zero_cases=mask_zero_cases, active_cms_storage=active_cms_storage
+        ), mmap)
+        if os.path.exists(cache_path):
+            print(f'Loading preprocessed data from {cache_path}')
+            if mmap:
+                return PreprocessedData.load_mmap(cache_path)
+            return PreprocessedData.load_npz(cache_path)
 
     # load data from our csv
     df = pd.read_csv(data_path, parse_dates=["Date"], infer_datetime_format=True).set_index(
@@ -72,22 +154,11 @@ def preprocess_data(data_path, last_day=None, schools_unis='two_separate', drop_
     CMs = list(df.columns[4:])
     nCMs = len(CMs)
 
-    ActiveCMs = np.zeros((nRs, nCMs, nDs))
-    Confirmed = np.zeros((nRs, nDs))
-    Deaths = np.zeros((nRs, nDs))
-    Active = np.zeros((nRs, nDs))
+    Confirmed, Deaths, Active, ActiveCMs, first_day_names = _load_region_day_arrays(df, sorted_regions, Ds, CMs)
+    region_names = list(first_day_names)
     NewDeaths = np.zeros((nRs, nDs))
     NewCases = np.zeros((nRs, nDs))
 
-    for r_i, r in enumerate(sorted_regions):
-        region_names[r_i] = df.loc[(r, Ds[0])]['Region Name']
-        for d_i, d in enumerate(Ds):
-            Confirmed[r_i, d_i] = df.loc[(r, d)]['Confirmed']
-            Deaths[r_i, d_i] = df.loc[(r, d)]['Deaths']
-            Active[r_i, d_i] = df.loc[(r, d)]['Active']
-
-            ActiveCMs[r_i, :, :] = df.loc[r].loc[Ds][CMs].values.T
-
     # compute new (daily) cases, after using thresholds
     Confirmed[Confirmed < min_confirmed] = np.nan
     Deaths[Deaths < min_deaths] = np.nan
@@ -175,7 +246,7 @@ def preprocess_data(data_path, last_day=None, schools_unis='two_separate', drop_
         CMs[school_index] = 'School and University Closure'
         CMs.remove('University Closure')
 
-    return PreprocessedData(Active,
+    data = PreprocessedData(Active,
                             Confirmed,
                             ActiveCMs,
                             CMs,
@@ -185,3 +256,26 @@ def preprocess_data(data_path, last_day=None, schools_unis='two_separate', drop_
                             NewDeaths,
                             NewCases,
                             region_full_names)
+    data.compact_active_cms(active_cms_storage)
+
+    if cache_dir is not None:
+        # write to a temporary file first, so concurrent jobs never read a partially written entry
+        os.makedirs(cache_dir, exist_ok=True)
+        if mmap:
+            tmp_dir = tempfile.mkdtemp(dir=cache_dir, suffix='.tmp')
+            data.save_mmap(tmp_dir)
+            try:
+                os.rename(tmp_dir, cache_path)
+            except OSError:
+                # another job created this entry in the meantime
+                shutil.rmtree(tmp_dir)
+            print(f'Saved preprocessed data to {cache_path}')
+            # return the memory-mapped copy, so this job shares memory with the others too
+            return PreprocessedData.load_mmap(cache_path)
+
+        with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as f:
+            data.save_npz(f)
+        os.replace(f.name, cache_path)
+        print(f'Saved preprocessed data to {cache_path}')
+
+    return data
@@ -4,6 +4,7 @@
 PreprocessedData Class definition.
 """
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 from matplotlib.font_manager import FontProperties
@@ -14,6 +15,9 @@ import os
 sns.set_style('ticks')
 fp2 = FontProperties(fname=os.path.join(os.path.dirname(__file__), "../../fonts/Font Awesome 5 Free-Solid-900.otf"))
 
+# masked (nRs, nDs) arrays held by PreprocessedData
+MASKED_ARRAY_NAMES = ['Active', 'Confirmed', 'Deaths', 'NewDeaths', 'NewCases']
+
 
 class PreprocessedData(object):
     """
@@ -64,6 +68,221 @@ class PreprocessedData(object):
         # 1-based day of the year. "January 1" is 1
         self.Ds_day_of_year = np.array([t.dayofyear for t in self.Ds], dtype=np.int32)
 
+    @property
+    def ActiveCMs(self):
+        """
+        NPI activation array, shape (nRs, nCMs, nDs).
+
+        If ActiveCMs is stored compactly (see compact_active_cms), a float64 array is produced from the stored integer
+        codes on first access and cached until the storage changes. This array is read-only: use set_active_cms (or
+        assign a new array to ActiveCMs) to edit it.
+
+        :return: float64 np.ndarray
+        """
+        if self.ActiveCMs_storage == 'float':
+            return self._ActiveCMs
+
+        # (stored codes, storage, scale, values), valid while the stored codes are unchanged
+        cached = getattr(self, '_ActiveCMs_cache', None)
+        if cached is None or cached[0] is not self._ActiveCMs or cached[1:3] != (self.ActiveCMs_storage,
+                                                                                   self.ActiveCMs_scale):
+            codes = self._ActiveCMs
+            if self.ActiveCMs_storage == 'bits':
+                codes = np.unpackbits(codes, axis=2, count=len(self.Ds))
+            values = codes.astype(np.float64) * self.ActiveCMs_scale
+            values.setflags(write=False)
+            cached = (self._ActiveCMs, self.ActiveCMs_storage, self.ActiveCMs_scale, values)
+            self._ActiveCMs_cache = cached
+
+        return cached[3]
+
+    @ActiveCMs.setter
+    def ActiveCMs(self, value):
+        self._ActiveCMs = value
+        self.ActiveCMs_storage = 'float'
+        self.ActiveCMs_scale = 1.0
+
+    def set_active_cms(self, index, value):
+        """
+        Set entries of ActiveCMs, i.e., ActiveCMs[index] = value, keeping its storage (see compact_active_cms). Occurs in
+        place.
+
+        e.g., data.set_active_cms((slice(None), npi_index, slice(None)), 0) deactivates an NPI everywhere.
+
+        :param index: index into ActiveCMs, shape (nRs, nCMs, nDs)
+        :param value: new values, broadcast to the indexed entries
+        """
+        storage = self.ActiveCMs_storage
+        values = np.array(self.ActiveCMs, dtype=np.float64)
+        values[index] = value
+        self.ActiveCMs = values
+        if storage != 'float':
+            self.compact_active_cms(storage)
+
+    def compact_active_cms(self, storage='uint8'):
+        """
+        Store ActiveCMs as integer codes with an explicit scale, i.e., ActiveCMs = codes * ActiveCMs_scale. Occurs in
+        place.
+
+        e.g., with schools_unis='one_tiered', NPI values 0, 0.5 and 1 are stored as codes 0, 1 and 2 with scale 0.5.
+
+        :param storage: | storage type. Options are:
+                        |   - float. Plain float64 array (i.e., the default, uncompressed storage).
+                        |   - uint8. One byte per entry.
+                        |   - bits. One bit per entry, packed along the days axis. Only possible for binary NPIs.
+        """
+        values = self.ActiveCMs
+
+        if storage == 'float':
+            self.ActiveCMs = values
+            return
+
+        nonzero = np.abs(values[values != 0])
+        scale = float(np.min(nonzero)) if nonzero.size > 0 else 1.0
+        codes = np.around(values / scale)
+
+        if np.any(codes < 0) or np.any(codes * scale != values):
+            raise ValueError('ActiveCMs can not be represented as non-negative integer multiples of a single scale')
+
+        if storage == 'uint8':
+            if np.max(codes, initial=0) > np.iinfo(np.uint8).max:
+                raise ValueError('ActiveCMs has too many levels for uint8 storage')
+            self._ActiveCMs = codes.astype(np.uint8)
+        elif storage == 'bits':
+            if np.max(codes, initial=0) > 1:
+                raise ValueError('Bit-packed storage requires binary ActiveCMs')
+            self._ActiveCMs = np.packbits(codes.astype(np.uint8), axis=2)
+        else:
+            raise ValueError(f'Unknown ActiveCMs storage {storage}')
+
+        self.ActiveCMs_storage = storage
+        self.ActiveCMs_scale = scale
+
+    def _to_array_dict(self):
+        """
+        Convert data to a dictionary of plain numpy arrays, for saving to disk.
+
+        Masked arrays are stored as a data plane and a mask plane. Days are stored as ISO strings.
+
+        :return: dictionary of arrays.
+        """
+        arrays = {
+            'ActiveCMs': np.asarray(self._ActiveCMs),
+            'ActiveCMs_storage': np.array(self.ActiveCMs_storage, dtype=np.str_),
+            'ActiveCMs_scale': np.array(self.ActiveCMs_scale, dtype=np.float64),
+            'CMs': np.array(self.CMs, dtype=np.str_),
+            'Rs': np.array(self.Rs, dtype=np.str_),
+            'Ds': np.array([d.isoformat() for d in self.Ds], dtype=np.str_),
+        }
+
+        for name in MASKED_ARRAY_NAMES:
+            array = getattr(self, name)
+            arrays[f'{name}_data'] = np.ma.getdata(array)
+            arrays[f'{name}_mask'] = np.ma.getmaskarray(array)
+
+        if isinstance(self.RNames, pd.Series):
+            # region names are kept as the series pulled from the .csv file, indexed by (region code, date)
+            arrays['RNames'] = self.RNames.to_numpy(dtype=np.str_)
+            arrays['RNames_codes'] = self.RNames.index.get_level_values(0).to_numpy(dtype=np.str_)
+            arrays['RNames_dates'] = np.array([d.isoformat() for d in self.RNames.index.get_level_values(1)],
+                                              dtype=np.str_)
+        else:
+            arrays['RNames'] = np.array(self.RNames, dtype=np.str_)
+
+        return arrays
+
+    @staticmethod
+    def _from_array_dict(arrays):
+        """
+        Construct PreprocessedData from a dictionary of arrays produced by _to_array_dict.
+
+        Numeric arrays are used as they are (i.e., not copied), so memory-mapped arrays stay memory-mapped.
+
+        :param arrays: dictionary (or other mapping, e.g., an NpzFile) of arrays.
+        :return: PreprocessedData object.
+        """
+        masked = {
+            name: np.ma.MaskedArray(arrays[f'{name}_data'], mask=arrays[f'{name}_mask'])
+            for name in MASKED_ARRAY_NAMES
+        }
+
+        if 'RNames_codes' in arrays:
+            RNames = pd.Series(
+                arrays['RNames'].astype(object),
+                index=pd.MultiIndex.from_arrays([arrays['RNames_codes'].astype(object),
+                                                 pd.to_datetime(arrays['RNames_dates'])],
+                                                names=['Country Code', 'Date']),
+                name='Region Name'
+            )
+        else:
+            RNames = arrays['RNames'].tolist()
+
+        data = PreprocessedData(masked['Active'],
+                                masked['Confirmed'],
+                                arrays['ActiveCMs'],
+                                arrays['CMs'].tolist(),
+                                arrays['Rs'].tolist(),
+                                list(pd.to_datetime(arrays['Ds'])),
+                                masked['Deaths'],
+                                masked['NewDeaths'],
+                                masked['NewCases'],
+                                RNames)
+
+        # ActiveCMs may hold compact integer codes rather than floats
+        data.ActiveCMs_storage = str(arrays['ActiveCMs_storage'])
+        data.ActiveCMs_scale = float(arrays['ActiveCMs_scale'])
+        return data
+
+    def save_npz(self, path):
+        """
+        Save data to a compressed .npz file, which can be read back with PreprocessedData.load_npz.
+
+        :param path: output path, or open binary file object.
+        """
+        np.savez_compressed(path, **self._to_array_dict())
+
+    @staticmethod
+    def load_npz(path):
+        """
+        Load data saved with PreprocessedData.save_npz.
+
+        :param path: input path, or open binary file object.
+        :return: PreprocessedData object.
+        """
+        with np.load(path, allow_pickle=False) as f:
+            return PreprocessedData._from_array_dict(f)
+
+    def save_mmap(self, directory):
+        """
+        Save data as a directory of uncompressed .npy files, which can be memory-mapped by PreprocessedData.load_mmap.
+
+        :param directory: output directory. Created if it does not exist.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, array in self._to_array_dict().items():
+            np.save(os.path.join(directory, f'{name}.npy'), array, allow_pickle=False)
+
+    @staticmethod
+    def load_mmap(directory):
+        """
+        Load data saved with PreprocessedData.save_mmap, memory-mapping the arrays rather than reading them.
+
+        Processes loading the same directory share the underlying pages. ActiveCMs and the data planes of the masked
+        arrays are mapped read-only, so writing to them raises an error. The mask planes are mapped copy-on-write: mask
+        edits (e.g., mask_reopenings, mask_region, mask_region_ends, or the masking in BaseCMModel) go to private,
+        per-process pages and are never written back to disk.
+
+        :param directory: directory written by PreprocessedData.save_mmap.
+        :return: PreprocessedData object.
+        """
+        arrays = {}
+        for fname in os.listdir(directory):
+            name, ext = os.path.splitext(fname)
+            if ext == '.npy':
+                mmap_mode = 'c' if name.endswith('_mask') else 'r'
+                arrays[name] = np.load(os.path.join(directory, fname), mmap_mode=mmap_mode, allow_pickle=False)
+
+        return PreprocessedData._from_array_dict(arrays)
 
     def reduce_regions_from_index(self, reduced_regions_indx):
         """
@@ -78,7 +297,8 @@ class PreprocessedData(object):
         self.Deaths = self.Deaths[reduced_regions_indx, :]
         self.NewDeaths = self.NewDeaths[reduced_regions_indx, :]
         self.NewCases = self.NewCases[reduced_regions_indx, :]
-        self.ActiveCMs = self.ActiveCMs[reduced_regions_indx, :, :]
+        # index the stored array, so compact storage is kept
+        self._ActiveCMs = self._ActiveCMs[reduced_regions_indx, :, :]
 
     def remove_regions_min_deaths(self, min_num_deaths=100):
         """
@@ -146,9 +366,9 @@ class PreprocessedData(object):
         ax = plt.gca()
         mat = np.zeros((nCMs, nCMs))
         for cm in range(nCMs):
-            mask = self.ActiveCMs[:, cm, :] * (data_mask == False)
+            mask = total_cms[:, cm, :] * (data_mask == False)
             for cm2 in range(nCMs):
-                mat[cm, cm2] = np.sum(mask * self.ActiveCMs[:, cm2, :]) / np.sum(mask)
+                mat[cm, cm2] = np.sum(mask * total_cms[:, cm2, :]) / np.sum(mask)
         im = plt.imshow(mat * 100, vmin=25, vmax=100, cmap='inferno', aspect="auto")
         ax.tick_params(axis="both", which="major", labelsize=8)
 
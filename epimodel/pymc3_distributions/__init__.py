@@ -1 +1,2 @@
-from . import asymmetric_laplace
\ No newline at end of file
+from . import asymmetric_laplace
+from . import masked_negative_binomial
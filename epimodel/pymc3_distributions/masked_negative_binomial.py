@@ -0,0 +1,174 @@
+"""
+:code:`masked_negative_binomial.py`
+
+Negative Binomial Distribution observing a tensor of expected values at a fixed set of (flat) indices, e.g. the
+observed days of ExpectedCases. This is the likelihood of the observation heads of our models.
+
+The log-likelihood and its gradient are computed together by a single Theano Op, which gathers the expected values at
+the indices itself. Terms depending only on the observed data (e.g. :code:`gammaln(y + 1)`) are computed once per
+dataset, and :code:`gammaln(y + alpha)` and its derivative are evaluated once per distinct observed count.
+"""
+import numpy as np
+import pymc3.distributions.discrete as discrete
+import theano
+import theano.tensor as tt
+from pymc3.distributions.distribution import draw_values
+from pymc3.theanof import floatX, intX
+from scipy.special import gammaln, psi
+
+try:
+    from theano.graph.basic import Apply
+    from theano.graph.op import Op
+except ImportError:
+    # Theano < 1.1
+    from theano.gof import Apply, Op
+
+# as in pymc3, the likelihood is Poisson above this dispersion
+POISSON_ALPHA = 1e10
+
+
+def _logpow(x, m):
+    """
+    m * log(x), with 0 ** 0 = 1, as pymc3.distributions.dist_math.logpow.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where((x == 0) & (m == 0), 0., m * np.log(x))
+
+
+class MaskedNegativeBinomialLogp(Op):
+    """
+    Elementwise log-likelihood of NegativeBinomial(mu.flatten()[indices], alpha) at observed, as in pymc3.
+
+    Outputs the log-likelihood and its derivatives with respect to the gathered expected values and the dispersion,
+    all of shape (len(indices),). The gradient of the log-likelihood is assembled from the derivatives, so evaluating
+    a model's logp and dlogp evaluates this Op once.
+    """
+    __props__ = ()
+
+    def __init__(self):
+        """
+        Constructor
+        """
+        # terms depending only on the observed values, keyed by their bytes, see _observed_terms
+        self._observed_cache = {}
+
+    def _observed_terms(self, observed):
+        """
+        Distinct observed values (with the index of each observation's value), gammaln(observed + 1) and whether each
+        observation is valid (non-negative).
+        """
+        observed = np.asarray(observed, dtype=np.float64)
+        key = observed.tobytes()
+        if key not in self._observed_cache:
+            if len(self._observed_cache) >= 8:
+                self._observed_cache.clear()
+            unique, inverse = np.unique(observed, return_inverse=True)
+            with np.errstate(invalid='ignore'):
+                self._observed_cache[key] = (unique, inverse, gammaln(observed + 1), observed >= 0)
+        return self._observed_cache[key]
+
+    def make_node(self, mu, alpha, indices, observed):
+        mu = tt.as_tensor_variable(mu)
+        alpha = tt.as_tensor_variable(alpha)
+        indices = tt.as_tensor_variable(indices)
+        observed = tt.as_tensor_variable(observed)
+        if alpha.ndim != 0:
+            raise ValueError('The dispersion must be a scalar')
+        if indices.ndim != 1 or observed.ndim != 1:
+            raise ValueError('The indices and observed values must be vectors')
+
+        dtype = theano.scalar.upcast(mu.dtype, alpha.dtype)
+        return Apply(self, [mu, alpha, indices, observed], [tt.vector(dtype=dtype) for _ in range(3)])
+
+    def perform(self, node, inputs, output_storage):
+        mu, alpha, indices, observed = inputs
+        mu = mu.reshape((-1,))[indices]
+        alpha = float(alpha)
+        if mu.shape != observed.shape:
+            raise ValueError(f'{mu.size} indices, but {observed.size} observed values')
+
+        unique, inverse, gammaln_observed, valid = self._observed_terms(observed)
+        y = np.asarray(observed, dtype=np.float64)
+
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            if alpha > POISSON_ALPHA:
+                valid = valid & (mu >= 0)
+                logp = _logpow(mu, y) - gammaln_observed - mu
+                mu_grad = np.where(y == 0, 0., y / mu) - 1
+                alpha_grad = np.zeros_like(mu)
+            else:
+                valid = valid & (mu > 0) & (alpha > 0)
+                log_mu_alpha = np.log(mu + alpha)
+                logp = (gammaln(unique + alpha)[inverse] - gammaln(alpha) - gammaln_observed
+                        + y * (np.log(mu) - log_mu_alpha) + alpha * (np.log(alpha) - log_mu_alpha))
+                mu_grad = y / mu - (y + alpha) / (mu + alpha)
+                alpha_grad = (psi(unique + alpha)[inverse] - psi(alpha) + np.log(alpha) - log_mu_alpha
+                              + (mu - y) / (mu + alpha))
+
+        dtype = node.outputs[0].dtype
+        output_storage[0][0] = np.where(valid, logp, -np.inf).astype(dtype)
+        output_storage[1][0] = np.where(valid, mu_grad, 0.).astype(dtype)
+        output_storage[2][0] = np.where(valid, alpha_grad, 0.).astype(dtype)
+
+    def infer_shape(self, *args):
+        # Theano < 1.1 doesn't pass fgraph
+        _, _, indices_shape, _ = args[-1]
+        return [indices_shape] * 3
+
+    def L_op(self, inputs, outputs, output_grads):
+        mu, alpha, indices, observed = inputs
+        _, mu_grad, alpha_grad = outputs
+        logp_grad = output_grads[0]
+
+        if not all(isinstance(g.type, theano.gradient.DisconnectedType) for g in output_grads[1:]):
+            return [theano.gradient.grad_not_implemented(self, i, inputs[i]) for i in range(len(inputs))]
+
+        # inc_subtensor, so that the gradients of repeated indices add up
+        mu_flat_grad = tt.inc_subtensor(tt.zeros_like(mu).flatten()[indices], logp_grad * mu_grad)
+        return [tt.cast(mu_flat_grad.reshape(mu.shape), mu.dtype),
+                tt.cast(tt.sum(logp_grad * alpha_grad), alpha.dtype),
+                theano.gradient.grad_undefined(self, 2, indices),
+                theano.gradient.grad_not_implemented(self, 3, observed)]
+
+
+class MaskedNegativeBinomial(discrete.Discrete):
+    """
+    Negative Binomial Distribution, parameterised as pymc3.NegativeBinomial, of mu.flatten()[indices].
+    """
+
+    def __init__(self, mu, alpha, indices, *args, **kwargs):
+        """
+        Constructor
+
+        :param mu: expected values, of any shape
+        :param alpha: dispersion (scalar)
+        :param indices: flat indices of mu observed, shape (n,). The distribution has shape (n,).
+        """
+        self.mu = tt.as_tensor_variable(floatX(mu))
+        self.alpha = tt.as_tensor_variable(floatX(alpha))
+        self.indices = np.asarray(indices, dtype=np.int64)
+        kwargs.setdefault('shape', (self.indices.size,))
+        super().__init__(*args, **kwargs)
+        self.mode = intX(tt.floor(self.mu.flatten()[self.indices]))
+
+    def random(self, point=None, size=None):
+        """
+        Draw random samples from this distribution, as a gamma-Poisson mixture.
+
+        :param point: values of the variables the distribution depends on
+        :param size: number of samples to draw
+        :return: samples, shape (size, n), or (n,) if size is None
+        """
+        mu, alpha = draw_values([self.mu, self.alpha], point=point, size=size)
+        mu = np.reshape(mu, np.shape(mu)[:np.ndim(mu) - self.mu.ndim] + (-1,))[..., self.indices]
+        alpha = np.reshape(alpha, np.shape(alpha) + (1,))
+        return np.random.poisson(np.random.gamma(alpha, mu / alpha))
+
+    def logp(self, value):
+        """
+        Compute logp.
+
+        :param value: evaluation point, shape (n,)
+        :return: log probability of each element of value
+        """
+        return MaskedNegativeBinomialLogp()(self.mu, self.alpha, self.indices, value)[0]
@@ -10,13 +10,32 @@ import matplotlib.pyplot as plt
 import numpy as np
 import pymc3 as pm
 import seaborn as sns
+import theano
+import theano.tensor as T
+import theano.tensor.signal.conv as C
 from matplotlib.font_manager import FontProperties
 from epimodel.pymc3_distributions.asymmetric_laplace import AsymmetricLaplace
+from epimodel.pymc3_distributions.masked_negative_binomial import MaskedNegativeBinomial
 from pymc3 import Model
+from pymc3.util import get_untransformed_name, is_transformed_name
+from theano.tensor import fft
 
 fp2 = FontProperties(fname=r"../../fonts/Font Awesome 5 Free-Solid-900.otf")
 sns.set_style("ticks")
 
+# longest series for which the automatic strategy uses the Toeplitz product. See causal_delay_convolution.
+TOEPLITZ_MAX_DAYS = 400
+
+# deterministics recorded by the 'summary' record policy: those without a days dimension. See
+# BaseCMModel.set_record_policy
+SUMMARY_DETERMINISTICS = ['CMReduction', 'CM_Beta', 'Beta_hat', 'RegionR', 'MeanRegionR', 'seasonality_max_R_day',
+                          'seasonality_local_beta1']
+
+# growth noise is left out of the first GROWTH_NOISE_START and the last GROWTH_NOISE_END days, which slightly reduces
+# runtime. See BaseCMModel.add_growth_noise
+GROWTH_NOISE_START = 30
+GROWTH_NOISE_END = 10
+
 
 def produce_CIs(array):
     """
@@ -94,6 +113,128 @@ def add_cms_to_plot(ax, ActiveCMs, country_indx, min_x, max_x, days, plot_style,
     return ax2
 
 
+def _toeplitz_indices(n_days):
+    """
+    Indices into the padded delay vector which produce the (n_days, n_days) delay matrix.
+
+    Entry (i, j) is the delay j - i from infection day i to report day j. Entries with j < i are -1, which picks the
+    final (zero) padding entry.
+
+    :param n_days: number of days
+    :return: integer np.ndarray, shape (n_days, n_days)
+    """
+    days = np.arange(n_days)
+    lags = days.reshape((1, n_days)) - days.reshape((n_days, 1))
+    lags[lags < 0] = -1
+    return lags
+
+
+def causal_delay_convolution(infected, delay, n_days, method='auto'):
+    """
+    Convolve infections with a delay distribution, keeping only the first n_days outputs.
+
+    This is equivalent to :code:`C.conv2d(infected, delay, border_mode='full')[:, :n_days]`. For the series lengths we
+    use (~150 days), the Toeplitz product computes the value and gradient ~4x faster than conv2d. Theano computes FFTs
+    with numpy outside the compiled graph, so the fft strategy is slower than the others at every length we tried; it
+    is kept for backends where that isn't the case.
+
+    :param infected: infections tensor, shape (nRs, n_days)
+    :param delay: delay pmf tensor, shape (1, n_delay) or (n_delay,). n_delay can take any value.
+    :param n_days: number of days
+    :param method: | strategy to use. Options are:
+                   |   - toeplitz. Multiply by the (n_days, n_days) delay matrix. Fastest for short series.
+                   |   - direct. conv2d, discarding the tail. Fastest for long series.
+                   |   - fft. Multiply in frequency space, after padding to a power of two.
+                   |   - auto. toeplitz if n_days <= TOEPLITZ_MAX_DAYS, otherwise direct.
+    :return: expected reports tensor, shape (nRs, n_days)
+    """
+    if method == 'auto':
+        method = 'toeplitz' if n_days <= TOEPLITZ_MAX_DAYS else 'direct'
+
+    # delays of n_days or more never contribute to the first n_days outputs
+    delay = delay.flatten()[:n_days]
+
+    if method == 'direct':
+        return C.conv2d(infected, delay.reshape((1, delay.shape[0])), border_mode='full')[:, :n_days]
+
+    elif method == 'toeplitz':
+        padded_delay = T.concatenate([delay, T.zeros((n_days + 1,), dtype=delay.dtype)])
+        delay_matrix = padded_delay[_toeplitz_indices(n_days)]
+        return T.dot(infected, delay_matrix)
+
+    elif method == 'fft':
+        # with at least 2 * n_days - 1 points, the circular convolution doesn't wrap onto the first n_days outputs
+        n_fft = int(2 ** np.ceil(np.log2(2 * n_days - 1)))
+
+        padded_infected = T.concatenate(
+            [infected, T.zeros((infected.shape[0], n_fft - n_days), dtype=infected.dtype)], axis=1)
+        padded_delay = T.concatenate([delay, T.zeros((n_fft,), dtype=delay.dtype)])[:n_fft].reshape((1, n_fft))
+
+        # the last axis holds real and imaginary parts
+        infected_f = fft.rfft(padded_infected)
+        delay_f = fft.rfft(padded_delay)[0]
+        product_f = T.stack([
+            infected_f[:, :, 0] * delay_f[:, 0] - infected_f[:, :, 1] * delay_f[:, 1],
+            infected_f[:, :, 0] * delay_f[:, 1] + infected_f[:, :, 1] * delay_f[:, 0],
+        ], axis=2)
+
+        return fft.irfft(product_f)[:, :n_days]
+
+    else:
+        raise ValueError(f'Unknown delay convolution method {method}')
+
+
+def _cardinal_b_spline(u, degree):
+    """
+    Cardinal B-spline of degree degree, supported on [0, degree + 1), evaluated at u.
+    """
+    if degree == 0:
+        return ((u >= 0) & (u < 1)).astype(np.float64)
+    return (u * _cardinal_b_spline(u, degree - 1) + (degree + 1 - u) * _cardinal_b_spline(u - 1, degree - 1)) / degree
+
+
+def get_growth_noise_basis(n_days, basis='full', knot_spacing=7, degree=3):
+    """
+    Basis mapping low-dimensional growth noise weights onto days.
+
+    The basis is scaled so that, with standard normal weights, the noise summed over all days (i.e. the noise of log
+    infections on the last day) has the variance it has with the full basis, n_days. For splines, the summed noise
+    then has about that variance on every day past the first few knots. The random walk's noise is itself a walk, so
+    its sum is an integrated random walk, whose variance is much smaller than the full basis' on earlier days (e.g.
+    15 rather than 50 on day 50 of 100).
+
+    :param n_days: number of days with growth noise
+    :param basis: | one of:
+                  |   - full. One independent weight per day, i.e. no basis.
+                  |   - spline. Uniform B-splines with knots every knot_spacing days. With knot_spacing=1 and degree=0,
+                  |     this is the full basis.
+                  |   - random_walk. A random walk over knots every knot_spacing days, linearly interpolated between
+                  |     them. Each weight is a step of the walk.
+    :param knot_spacing: days between knots
+    :param degree: spline degree. The random walk is always linear between knots.
+    :return: np.ndarray of shape (n_weights, n_days), or None for the full basis
+    """
+    if basis == 'full':
+        return None
+    elif basis == 'random_walk':
+        degree = 1
+    elif basis != 'spline':
+        raise ValueError(f'Unknown growth noise basis {basis}')
+
+    n_weights = (n_days - 1) // knot_spacing + 1 + degree
+    days = np.arange(n_days) / knot_spacing
+    # weight j's spline starts at knot j - degree
+    splines = np.stack([_cardinal_b_spline(days - (j - degree), degree) for j in range(n_weights)])
+    # splines vanishing on every day (the last one, if the last day is a knot)
+    splines = splines[np.any(splines > 0, axis=1)]
+    if basis == 'random_walk':
+        # knot values are the sums of the preceding steps
+        splines = np.triu(np.ones((splines.shape[0], splines.shape[0]))) @ splines
+
+    # the variance of the summed noise is the sum of the squared row sums
+    return splines * np.sqrt(n_days / np.sum(np.sum(splines, axis=1) ** 2))
+
+
 class BaseCMModel(Model):
     """
     BaseCMModel Class.
@@ -137,26 +278,36 @@ class BaseCMModel(Model):
         # don't observe deaths before ~22nd feb
         self.CMDelayCut = 30
 
+        # see causal_delay_convolution
+        self.delay_convolution_method = 'auto'
+
+        # see set_record_policy
+        self.record = 'full'
+        self.unrecorded_deterministics = {}
+        # compiled functions of recompute_deterministics, keyed by deterministic names
+        self.recompute_functions = {}
+        # see build_observation
+        self.observation_heads = {}
+
         # compute days to actually observe, looking at the data which is masked, and which isn't.
-        observed_active = []
-        observed_deaths = []
-        for r in range(self.nRs):
-            for d in range(self.nDs):
-                # if its not masked, after the cut, and not before 100 confirmed
-                if self.d.NewCases.mask[r, d] == False and d > self.CMDelayCut and not np.isnan(
-                        self.d.Confirmed.data[r, d]):
-                    observed_active.append(r * self.nDs + d)
-                else:
-                    self.d.NewCases.mask[r, d] = True
-
-                if self.d.NewDeaths.mask[r, d] == False and d > self.CMDelayCut and not np.isnan(
-                        self.d.Deaths.data[r, d]):
-                    observed_deaths.append(r * self.nDs + d)
-                else:
-                    self.d.NewDeaths.mask[r, d] = True
-
-        self.all_observed_active = np.array(observed_active)
-        self.all_observed_deaths = np.array(observed_deaths)
+        # observe if its not masked, after the cut, and not before 100 confirmed
+        after_cut = (np.arange(self.nDs) > self.CMDelayCut).reshape((1, self.nDs))
+        observed_active = np.logical_and(
+            np.logical_not(np.ma.getmaskarray(self.d.NewCases)) & np.logical_not(np.isnan(self.d.Confirmed.data)),
+            after_cut
+        )
+        observed_deaths = np.logical_and(
+            np.logical_not(np.ma.getmaskarray(self.d.NewDeaths)) & np.logical_not(np.isnan(self.d.Deaths.data)),
+            after_cut
+        )
+
+        # mask everything which isn't observed. This writes into the existing masks.
+        self.d.NewCases.mask[np.logical_not(observed_active)] = True
+        self.d.NewDeaths.mask[np.logical_not(observed_deaths)] = True
+
+        # flat indices r * nDs + d, ordered by region and then day
+        self.all_observed_active = np.nonzero(observed_active.ravel())[0]
+        self.all_observed_deaths = np.nonzero(observed_deaths.ravel())[0]
 
         # infection --> confirmed delay
         self.DelayProbCases = np.array([0., 0.0252817, 0.03717965, 0.05181224, 0.06274125,
@@ -211,6 +362,194 @@ class BaseCMModel(Model):
         """
         return len(self.d.CMs)
 
+    def convolve_delay(self, infected, delay):
+        """
+        Convolve daily infections with a delay distribution, producing expected daily reports.
+
+        :param infected: infections tensor, shape (nRs, nDs)
+        :param delay: delay pmf tensor, shape (1, n_delay)
+        :return: expected reports tensor, shape (nRs, nDs)
+        """
+        return causal_delay_convolution(infected, delay, self.nDs, self.delay_convolution_method)
+
+    def build_hyperparameter(self, name, value, as_data=False):
+        """
+        Build a model hyperparameter.
+
+        If as_data is True, the value is held in a pm.Data container, so it can be changed after the model has been
+        built (see set_hyperparameters) without changing the structure of the graph. Models which differ only in these
+        values then share their compiled Theano functions through the Theano compile cache. Otherwise, the value is
+        used as a constant.
+
+        :param name: name of data container
+        :param value: hyperparameter value
+        :param as_data: whether to use a pm.Data container
+        :return: pm.Data container, or the value itself.
+        """
+        if as_data:
+            with self.model:
+                return pm.Data(name, np.asarray(value, dtype=theano.config.floatX))
+
+        return value
+
+    def set_hyperparameters(self, **values):
+        """
+        Change the values of hyperparameters built with build_hyperparameter(..., as_data=True).
+
+        :param values: hyperparameter values, keyed by name
+        """
+        with self.model:
+            pm.set_data({k: np.asarray(v, dtype=theano.config.floatX) for k, v in values.items()})
+
+    def set_record_policy(self, record):
+        """
+        Set which deterministics build_deterministic records in the trace.
+
+        Deterministics which aren't recorded are still part of the model, and can be recomputed from the free RVs after
+        sampling (they are kept, by name, in self.unrecorded_deterministics).
+
+        :param record: 'full' to record every deterministic, 'summary' to record only SUMMARY_DETERMINISTICS, or a list
+                       of the names of the deterministics to record
+        """
+        if isinstance(record, str) and record not in ['full', 'summary']:
+            raise ValueError(f'Invalid record policy {record}. Use \'full\', \'summary\' or a list of names')
+
+        self.record = record
+        self.unrecorded_deterministics = {}
+
+    def records_deterministic(self, name):
+        """
+        Whether the record policy records the deterministic name.
+        """
+        if self.record == 'full':
+            return True
+        elif self.record == 'summary':
+            return name in SUMMARY_DETERMINISTICS
+        else:
+            return name in self.record
+
+    def build_deterministic(self, name, value):
+        """
+        Build a deterministic, which is recorded in the trace if the record policy says so (see set_record_policy).
+
+        :param name: deterministic name
+        :param value: tensor
+        :return: pm.Deterministic if recorded, otherwise value itself
+        """
+        if self.records_deterministic(name):
+            with self.model:
+                return pm.Deterministic(name, value)
+
+        self.unrecorded_deterministics[name] = value
+        return value
+
+    def compile_recompute_function(self, names):
+        """
+        Compile a function computing deterministics from a batch of draws of the (untransformed) free RVs.
+
+        The deterministics' graph is mapped over the leading (draw) dimension of the inputs with theano.map, so a batch
+        of draws is computed in one call of the compiled function. The graph itself can't simply be broadcast over draws,
+        as it reshapes and convolves tensors of fixed shapes.
+
+        :param names: deterministic names
+        :return: (function, list of free RV names giving the order of its arguments) tuple. The function takes arrays
+                 with a leading draw dimension, and returns a list of arrays, one per name, with the same leading
+                 dimension.
+        """
+        outputs = [self.unrecorded_deterministics[name] if name in self.unrecorded_deterministics
+                   else self.model.named_vars[name] for name in names]
+        input_names = [get_untransformed_name(v.name) if is_transformed_name(v.name) else v.name
+                       for v in self.model.free_RVs]
+        # the untransformed free RVs are computed from the transformed ones in the model graph, but are taken as the
+        # inputs here, cutting the graph there
+        inputs = [self.model.named_vars[name] for name in input_names]
+        batched_inputs = [T.TensorType(v.dtype, (False,) + v.broadcastable)(f'{name}_draws')
+                          for name, v in zip(input_names, inputs)]
+
+        def draw_outputs(*draw_inputs):
+            return theano.clone(outputs, replace=dict(zip(inputs, draw_inputs)))
+
+        # the batched inputs have no test values
+        with theano.change_flags(compute_test_value='off'):
+            batched_outputs, _ = theano.map(draw_outputs, sequences=batched_inputs)
+        if not isinstance(batched_outputs, list):
+            batched_outputs = [batched_outputs]
+        return theano.function(batched_inputs, batched_outputs, on_unused_input='ignore'), input_names
+
+    def iter_recomputed_deterministics(self, posterior, names=None, chunk_size=100):
+        """
+        Recompute deterministics from posterior samples of the free RVs, chunk_size draws at a time.
+
+        This gives deterministics which weren't recorded in the trace (see set_record_policy), or were dropped from it,
+        without holding them for every draw at once. The model must be built as it was for sampling, i.e. with the same
+        data and build_model arguments. The compiled function is kept, so later calls with the same names reuse it.
+
+        :param posterior: posterior samples of (at least) the free RVs, with leading (chain, draw) dimensions: an
+                          arviz InferenceData, its posterior, or a dict of arrays
+        :param names: names of deterministics to compute. Defaults to the unrecorded deterministics.
+        :param chunk_size: number of draws per chunk
+        :return: generator of (start, dict mapping names to arrays of shape (n, ...)) tuples, one per chunk. start is
+                 the index of the chunk's first draw, with the draws of all chains flattened in order.
+        """
+        if hasattr(posterior, 'posterior'):
+            posterior = posterior.posterior
+        if names is None:
+            names = list(self.unrecorded_deterministics.keys())
+
+        key = tuple(names)
+        if key not in self.recompute_functions:
+            self.recompute_functions[key] = self.compile_recompute_function(names)
+        fn, input_names = self.recompute_functions[key]
+
+        missing = [name for name in input_names if name not in posterior]
+        if missing:
+            raise ValueError(f'Posterior is missing free RVs {missing}')
+
+        input_values = [np.asarray(posterior[name]) for name in input_names]
+        n_chains, n_draws = input_values[0].shape[:2]
+        input_values = [v.reshape((n_chains * n_draws,) + v.shape[2:]) for v in input_values]
+        input_dtypes = [self.model.named_vars[name].dtype for name in input_names]
+
+        for start in range(0, n_chains * n_draws, chunk_size):
+            chunk_inputs = [v[start:(start + chunk_size)].astype(dtype, copy=False)
+                            for v, dtype in zip(input_values, input_dtypes)]
+            yield start, dict(zip(names, fn(*chunk_inputs)))
+
+    def recompute_deterministics(self, posterior, names=None, chunk_size=100):
+        """
+        Recompute deterministics from posterior samples of the free RVs, for all draws.
+
+        See iter_recomputed_deterministics, which this collects.
+
+        :param posterior: posterior samples of (at least) the free RVs, with leading (chain, draw) dimensions
+        :param names: names of deterministics to compute. Defaults to the unrecorded deterministics.
+        :param chunk_size: number of draws computed at once
+        :return: dict mapping names to arrays of shape (chain, draw, ...)
+        """
+        if hasattr(posterior, 'posterior'):
+            posterior = posterior.posterior
+        first_free_RV = self.model.free_RVs[0].name
+        if is_transformed_name(first_free_RV):
+            first_free_RV = get_untransformed_name(first_free_RV)
+        n_chains, n_draws = np.shape(posterior[first_free_RV])[:2]
+
+        chunks = [values for _, values in self.iter_recomputed_deterministics(posterior, names, chunk_size)]
+        return {name: np.concatenate([c[name] for c in chunks]).reshape((n_chains, n_draws) + chunks[0][name].shape[1:])
+                for name in chunks[0]}
+
+    def get_observation_heads(self):
+        """
+        Describe the observation heads of the model, see build_observation.
+
+        :return: dict mapping observed RV names to (expected value deterministic name, dispersion RV name, flat observed
+                 indices) tuples
+        """
+        unknown = [rv.name for rv in self.model.observed_RVs if rv.name not in self.observation_heads]
+        if unknown:
+            raise ValueError(f'Observed RVs {unknown} were not built by build_observation')
+
+        return dict(self.observation_heads)
+
     def build_npi_prior(self, prior_type, prior_scale=None):
         """
         Build NPI Effectiveness Prior.
@@ -239,6 +578,236 @@ class BaseCMModel(Model):
             elif prior_type == 'skewed':
                 self.CM_Alpha = AsymmetricLaplace('CM_Alpha', scale=prior_scale, symmetry=0.5, shape=(self.nCMs,))
 
+    def build_normal_or_fixed(self, name, mean, sd, description):
+        """
+        Build a normally distributed parameter, or use a fixed value if its sd isn't positive.
+
+        :param name: parameter name
+        :param mean: prior mean, or fixed value
+        :param sd: prior sd
+        :param description: description used in the message printed for fixed values
+        :return: pm.Normal, or the fixed value
+        """
+        if sd > 0:
+            with self.model:
+                return pm.Normal(name, mean, sd)
+
+        print(f'Using a fixed value for the {description}')
+        return mean
+
+    def build_region_r(self, R_prior_mean, noise_name='RegionR_noise', hyperparameters_as_data=False):
+        """
+        Build the basic reproduction number of each region, RegionR, with a hierarchical prior.
+
+        :param R_prior_mean: R_0 prior mean
+        :param noise_name: name of the standard normal noise of each region
+        :param hyperparameters_as_data: whether to hold R_prior_mean in a pm.Data container, see build_hyperparameter
+        :return: RegionR tensor, shape (nRs,)
+        """
+        with self.model:
+            self.HyperRVar = pm.HalfNormal('HyperRVar', sigma=0.5)
+
+            self.RPriorMean = self.build_hyperparameter('R_prior_mean', R_prior_mean, hyperparameters_as_data)
+            self.RegionR_noise = pm.Normal(noise_name, 0, 1, shape=(self.nRs,))
+            self.RegionR = self.build_deterministic('RegionR', self.RPriorMean + self.RegionR_noise * self.HyperRVar)
+
+        return self.RegionR
+
+    def build_region_cm_alpha(self, alpha_noise_scale_prior='half-t', alpha_noise_scale=0.04):
+        """
+        Build the NPI effectiveness in each region, AllCMAlpha, varying around CM_Alpha (see build_npi_prior).
+
+        :param alpha_noise_scale_prior: prior type placed over sigma_i. either 'half-normal' or 'half-t'
+        :param alpha_noise_scale: scale of sigma_i prior.
+        :return: AllCMAlpha tensor, shape (nRs, nCMs)
+        """
+        with self.model:
+            if alpha_noise_scale_prior == 'half-normal':
+                self.CMAlphaScales = pm.HalfNormal('CMAlphaScales', sigma=alpha_noise_scale, shape=(self.nCMs))
+            elif alpha_noise_scale_prior == 'half-t':
+                self.CMAlphaScales = pm.HalfStudentT('CMAlphaScales', nu=3, sigma=alpha_noise_scale, shape=(self.nCMs))
+
+            self.AllCMAlphaNoise = pm.Normal('AllCMAlphaNoise', 0, 1, shape=(self.nRs, self.nCMs))
+            self.AllCMAlpha = self.build_deterministic(
+                'AllCMAlpha',
+                T.reshape(self.CM_Alpha, (1, self.nCMs)).repeat(self.nRs, axis=0) +
+                self.CMAlphaScales.reshape((1, self.nCMs)) * self.AllCMAlphaNoise
+            )
+
+        return self.AllCMAlpha
+
+    def build_log_r_reduction(self, cm_alpha):
+        """
+        Build the reduction of log R by the active NPIs.
+
+        :param cm_alpha: NPI effectiveness tensor, shape (nCMs,), or (nRs, nCMs) for effects differing by region
+        :return: reduction tensor, shape (nRs, nDs)
+        """
+        with self.model:
+            self.ActiveCMs = pm.Data('ActiveCMs', self.d.ActiveCMs)
+
+        shape = (1, self.nCMs, 1) if cm_alpha.ndim == 1 else (self.nRs, self.nCMs, 1)
+        self.ActiveCMReduction = T.reshape(cm_alpha, shape) * self.ActiveCMs
+        return T.sum(self.ActiveCMReduction, axis=1)
+
+    def build_expected_log_r(self, reduction):
+        """
+        Build ExpectedLogR, the log R of each region and day, from RegionR (see build_region_r) and its reduction.
+
+        :param reduction: log R reduction tensor, shape (nRs, nDs)
+        :return: ExpectedLogR tensor, shape (nRs, nDs)
+        """
+        self.ExpectedLogR = self.build_deterministic(
+            'ExpectedLogR',
+            T.reshape(pm.math.log(self.RegionR), (self.nRs, 1)) - reduction
+        )
+        return self.ExpectedLogR
+
+    def build_generation_interval(self, gi_mean_mean=5, gi_mean_sd=1, gi_sd_mean=2, gi_sd_sd=2):
+        """
+        Build the priors of the generation interval mean GI_mean and sd GI_sd, used by growth_from_log_r.
+
+        :param gi_mean_mean: mean of normal prior placed over the generation interval mean
+        :param gi_mean_sd: sd of normal prior placed over the generation interval mean
+        :param gi_sd_mean: mean of normal prior placed over the generation interval sd
+        :param gi_sd_sd: sd of normal prior placed over the generation interval sd
+        """
+        self.GI_mean = self.build_normal_or_fixed('GI_mean', gi_mean_mean, gi_mean_sd, 'generation interval mean')
+        self.GI_sd = self.build_normal_or_fixed('GI_sd', gi_sd_mean, gi_sd_sd, 'generation interval sd')
+
+    def growth_from_log_r(self, log_r):
+        """
+        Convert log R into daily growth rates, for the gamma generation interval of build_generation_interval.
+
+        :param log_r: log R tensor
+        :return: growth rate tensor, shape of log_r
+        """
+        gi_beta = self.GI_mean / self.GI_sd ** 2
+        gi_alpha = self.GI_mean ** 2 / self.GI_sd ** 2
+        return gi_beta * (pm.math.exp(log_r / gi_alpha) - T.ones_like(log_r))
+
+    def build_growth_noise(self, name, sigma=1., basis='full', knot_spacing=7, degree=3):
+        """
+        Build normal growth noise for the days add_growth_noise adds it to, optionally on a low-dimensional basis (see
+        get_growth_noise_basis).
+
+        With the full basis, the noise is a free RV of shape (nRs, n_days). Otherwise, the free RV is {name}Weights, of
+        shape (nRs, n_weights), and the noise is the deterministic name.
+
+        :param name: noise name
+        :param sigma: noise sd (of the weights, with a basis)
+        :param basis: 'full', 'spline' or 'random_walk'
+        :param knot_spacing: days between knots
+        :param degree: spline degree
+        :return: noise tensor, shape (nRs, nDs - GROWTH_NOISE_START - GROWTH_NOISE_END)
+        """
+        n_days = self.nDs - GROWTH_NOISE_START - GROWTH_NOISE_END
+        basis_matrix = get_growth_noise_basis(n_days, basis, knot_spacing, degree)
+        with self.model:
+            if basis_matrix is None:
+                return pm.Normal(name, 0, sigma, shape=(self.nRs, n_days))
+
+            weights = pm.Normal(f'{name}Weights', 0, sigma, shape=(self.nRs, basis_matrix.shape[0]))
+            return self.build_deterministic(name, T.dot(weights, basis_matrix))
+
+    def add_growth_noise(self, growth, noise):
+        """
+        Add growth noise (see build_growth_noise) to growth rates.
+
+        :param growth: growth rate tensor, shape (nRs, nDs)
+        :param noise: noise tensor
+        :return: noisy growth rate tensor, shape (nRs, nDs)
+        """
+        return T.inc_subtensor(growth[:, GROWTH_NOISE_START:-GROWTH_NOISE_END], noise)
+
+    def build_infected(self, growth, suffix=''):
+        """
+        Build daily infections, Infected{suffix}, growing from an initial size InitialSize{suffix}_log in each region.
+
+        :param growth: growth rate tensor, shape (nRs, nDs)
+        :param suffix: suffix of the names, e.g. 'Cases'
+        :return: Infected{suffix} tensor, shape (nRs, nDs)
+        """
+        with self.model:
+            initial_size_log = pm.Normal(f'InitialSize{suffix}_log', 0, 50, shape=(self.nRs,))
+            infected_log = self.build_deterministic(
+                f'Infected{suffix}_log', T.reshape(initial_size_log, (self.nRs, 1)) + growth.cumsum(axis=1))
+            infected = self.build_deterministic(f'Infected{suffix}', pm.math.exp(infected_log))
+
+        setattr(self, f'InitialSize{suffix}_log', initial_size_log)
+        setattr(self, f'Infected{suffix}_log', infected_log)
+        setattr(self, f'Infected{suffix}', infected)
+        return infected
+
+    def build_delay(self, kind, mean_mean, mean_sd, disp_mean, disp_sd, truncation):
+        """
+        Build a delay distribution: a NegativeBinomial with priors over its mean {kind}DelayMean and dispersion
+        {kind}DelayDisp, truncated to truncation days.
+
+        :param kind: 'Cases' (infection to confirmation) or 'Deaths' (infection to death)
+        :param mean_mean: mean of normal prior placed over the delay mean
+        :param mean_sd: sd of normal prior placed over the delay mean
+        :param disp_mean: mean of normal prior placed over the delay dispersion
+        :param disp_sd: sd of normal prior placed over the delay dispersion
+        :param truncation: maximum delay
+        :return: delay pmf tensor, shape (1, truncation)
+        """
+        description = 'reporting delay' if kind == 'Cases' else 'fatality delay'
+        delay_mean = self.build_normal_or_fixed(f'{kind}DelayMean', mean_mean, mean_sd, f'{description} mean')
+        delay_disp = self.build_normal_or_fixed(f'{kind}DelayDisp', disp_mean, disp_sd, f'{description} dispersion')
+        setattr(self, f'{kind}DelayMean', delay_mean)
+        setattr(self, f'{kind}DelayDisp', delay_disp)
+
+        delay_dist = pm.NegativeBinomial.dist(mu=delay_mean, alpha=delay_disp)
+        pmf = T.exp(delay_dist.logp(np.arange(0, truncation)))
+        pmf = pmf / T.sum(pmf)
+        return pmf.reshape((1, truncation))
+
+    def build_expected(self, name, infected, delay):
+        """
+        Build expected daily reports, the deterministic name, from daily infections and a delay (see build_delay).
+
+        :param name: deterministic name, e.g. 'ExpectedCases'
+        :param infected: infections tensor, shape (nRs, nDs)
+        :param delay: delay pmf tensor, shape (1, n_delay)
+        :return: expected reports tensor, shape (nRs, nDs)
+        """
+        return self.build_deterministic(name, self.convolve_delay(infected, delay).reshape((self.nRs, self.nDs)))
+
+    def build_observation(self, name, expected_name, expected, dispersion, indices, data, data_name=None):
+        """
+        Build an observation head: a NegativeBinomial RV observing the expected reports on the observed days (see
+        MaskedNegativeBinomial).
+
+        The head is recorded in self.observation_heads (see get_observation_heads).
+
+        :param name: observed RV name
+        :param expected_name: name of the expected reports deterministic (see build_expected)
+        :param expected: expected reports tensor, shape (nRs, nDs)
+        :param dispersion: dispersion RV
+        :param indices: flat indices of the observed days, e.g. self.all_observed_active
+        :param data: reports, shape (nRs, nDs)
+        :param data_name: if given, the observed reports are held in a pm.Data container of this name
+        :return: observed RV
+        """
+        observed = np.ma.getdata(data).reshape((self.nRs * self.nDs,))[indices]
+        with self.model:
+            if data_name is not None:
+                observed = pm.Data(data_name, observed)
+                setattr(self, data_name, observed)
+
+            observed_rv = MaskedNegativeBinomial(
+                name,
+                mu=expected,
+                alpha=dispersion,
+                indices=indices,
+                shape=(len(indices),),
+                observed=observed
+            )
+
+        self.observation_heads[name] = (expected_name, dispersion.name, indices)
+        return observed_rv
+
     def plot_effect(self):
         """
         If model.trace has been set, plot the NPI effectiveness estimates.
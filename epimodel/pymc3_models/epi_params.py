@@ -4,13 +4,130 @@
 Calculate delay distributions and generate delay parameter dictionaries for model building.
 """
 
+import functools
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
+from scipy import stats
 from scipy.stats import norm
 import pprint
 from tqdm import tqdm
 
 
-def bootstrapped_negbinom_values(delays, n_bootstrap=250, n_rvs=int(1e7), truncation=64, filter_disp_outliers=True):
+def _parallel_map(fn, args, n_workers=1, progress=False):
+    """
+    Apply fn to each of args, in a pool of n_workers processes if n_workers isn't 1.
+
+    Results are returned in the order of args, so as long as fn doesn't depend on global state set elsewhere, the
+    results don't depend on n_workers.
+
+    :param fn: picklable function of one argument
+    :param args: list of arguments
+    :param n_workers: number of worker processes. If None, use one per CPU.
+    :param progress: whether to show a progress bar
+    :return: list of results
+    """
+    if n_workers == 1:
+        results = map(fn, args)
+        return list(tqdm(results, total=len(args)) if progress else results)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        results = executor.map(fn, args)
+        return list(tqdm(results, total=len(args)) if progress else results)
+
+
+def _delay_sampler(dist, with_noise, rng):
+    """
+    Draw the parameters of a distribution (with uncertainty) once, and return a function which samples from it.
+
+    :param dist: distribution dictionary, as used by EpidemiologicalParameters
+    :param with_noise: if true, add noise to distributions, else do not.
+    :param rng: np.random.Generator
+    :return: function mapping a number of samples to an array of samples
+    """
+    mean = rng.normal(loc=dist['mean_mean'], scale=dist['mean_sd'] * with_noise)
+    if dist['dist'] == 'gamma':
+        sd = rng.normal(loc=dist['sd_mean'], scale=dist['sd_sd'] * with_noise)
+        k = mean ** 2 / sd ** 2
+        theta = sd ** 2 / mean
+        return lambda size: rng.gamma(k, theta, size=size)
+    elif dist['dist'] == 'gamma_cov':
+        cov = rng.normal(loc=dist['cov_mean'], scale=dist['cov_sd'] * with_noise)
+        sd = cov * mean
+        k = mean ** 2 / sd ** 2
+        theta = sd ** 2 / mean
+        return lambda size: rng.gamma(k, theta, size=size)
+    elif dist['dist'] == 'lognorm':
+        sd = rng.normal(loc=dist['sd_mean'], scale=dist['sd_sd'] * with_noise)
+        # lognorm rv generated by e^z where z is normal
+        return lambda size: np.exp(rng.normal(loc=mean, scale=sd, size=size))
+    elif dist['dist'] == 'negbinom':
+        disp = rng.normal(loc=dist['disp_mean'], scale=dist['disp_sd'] * with_noise)
+        p = disp / (disp + mean)
+        return lambda size: rng.negative_binomial(disp, p, size=size)
+
+    raise ValueError(f'Unknown distribution type {dist["dist"]}')
+
+
+def _bootstrap_moments(delays, seed, n_rvs, truncation):
+    """
+    Mean and variance of n_rvs truncated samples of the sum of delays, drawn all at once with the global numpy seed.
+
+    :param delays: list of distributions (with uncertainty)
+    :param seed: bootstrap seed
+    :param n_rvs: number of samples
+    :param truncation: maximum value to truncate to.
+    :return: (mean, variance) tuple
+    """
+    ep = EpidemiologicalParameters(seed)
+    samples = np.zeros(n_rvs)
+
+    for dist in delays:
+        samples += ep.generate_dist_samples(dist, n_rvs, with_noise=True)
+
+    samples[samples > truncation] = truncation
+    return np.mean(samples), np.var(samples)
+
+
+def _streamed_bootstrap_moments(delays, seed, n_rvs, truncation, chunk_size):
+    """
+    Mean and variance of n_rvs truncated samples of the sum of delays, drawn in chunks of chunk_size.
+
+    Each chunk's moments are merged into running totals (Chan et al.'s pairwise update), so memory use depends only on
+    chunk_size. Samples come from a np.random.Generator seeded with seed.
+
+    :param delays: list of distributions (with uncertainty)
+    :param seed: bootstrap seed, int or np.random.SeedSequence
+    :param n_rvs: number of samples
+    :param truncation: maximum value to truncate to.
+    :param chunk_size: number of samples per chunk
+    :return: (mean, variance) tuple
+    """
+    rng = np.random.default_rng(seed)
+    samplers = [_delay_sampler(dist, True, rng) for dist in delays]
+
+    n = 0
+    mean = 0.0
+    sum_sq_dev = 0.0
+    for chunk_start in range(0, n_rvs, chunk_size):
+        chunk_n = min(chunk_size, n_rvs - chunk_start)
+        samples = np.zeros(chunk_n)
+        for sampler in samplers:
+            samples += sampler(chunk_n)
+        np.minimum(samples, truncation, out=samples)
+
+        chunk_mean = np.mean(samples)
+        samples -= chunk_mean
+        delta = chunk_mean - mean
+        mean += delta * chunk_n / (n + chunk_n)
+        sum_sq_dev += np.dot(samples, samples) + delta ** 2 * n * chunk_n / (n + chunk_n)
+        n += chunk_n
+
+    return mean, sum_sq_dev / n
+
+
+def bootstrapped_negbinom_values(delays, n_bootstrap=250, n_rvs=int(1e7), truncation=64, filter_disp_outliers=True,
+                                 chunk_size=None, n_workers=1, seed=0):
     """
     Fit negative binomial to n_bootstrapped sets of n_rv samples, each set of samples drawn randomly from the priors
     placed on the distributions in the delay array. e.g., this function is used to fit a single negative binomial
@@ -20,21 +137,26 @@ def bootstrapped_negbinom_values(delays, n_bootstrap=250, n_rvs=int(1e7), trunca
     :param n_bootstrap: number of bootstrapped to perform
     :param n_rvs: number of samples to draw from each draw from prior
     :param truncation: maximum value to truncate to.
+    :param filter_disp_outliers: whether to drop dispersions far from the median.
+    :param chunk_size: if None, draw all n_rvs samples at once using the global numpy seed, which reproduces our
+                       published values. Otherwise, stream samples in chunks of this size from a np.random.Generator
+                       per bootstrap, so peak memory doesn't grow with n_rvs. Streamed results depend on chunk_size.
+    :param n_workers: number of processes to run bootstraps in. If None, use one per CPU. Results don't depend on this.
+    :param seed: when streaming, bootstrap i uses the i-th child of np.random.SeedSequence(seed). Otherwise, bootstrap i
+                 uses global numpy seed i.
     :return: dictionary with uncertain NB values
     """
-    means = np.zeros(n_bootstrap)
-    disps = np.zeros(n_bootstrap)
-
-    for seed in tqdm(range(n_bootstrap)):
-        ep = EpidemiologicalParameters(seed)
-        samples = np.zeros(n_rvs)
-
-        for dist in delays:
-            samples += ep.generate_dist_samples(dist, n_rvs, with_noise=True)
-
-        samples[samples > truncation] = truncation
-        means[seed] = np.mean(samples)
-        disps[seed] = ((np.var(samples) - np.mean(samples)) / (np.mean(samples) ** 2)) ** -1
+    if chunk_size is None:
+        bootstrap_moments = functools.partial(_bootstrap_moments, delays, n_rvs=n_rvs, truncation=truncation)
+        seeds = list(range(n_bootstrap))
+    else:
+        bootstrap_moments = functools.partial(_streamed_bootstrap_moments, delays, n_rvs=n_rvs, truncation=truncation,
+                                              chunk_size=chunk_size)
+        seeds = np.random.SeedSequence(seed).spawn(n_bootstrap)
+
+    moments = np.array(_parallel_map(bootstrap_moments, seeds, n_workers, progress=True)).reshape((n_bootstrap, 2))
+    means = moments[:, 0]
+    disps = ((moments[:, 1] - means) / (means ** 2)) ** -1
 
     if filter_disp_outliers:
         # especially for the fatality delay, this can be an issue.
@@ -198,6 +320,86 @@ class EpidemiologicalParameters():
 
         return pmf
 
+    def get_scipy_dist(self, dist, with_noise):
+        """
+        Frozen scipy.stats distribution, with the same parameters as used by generate_dist_samples.
+
+        :param dist: Distribution dictionary to use.
+        :param with_noise: if true, add noise to distributions, else do not.
+        :return: frozen scipy.stats distribution
+        """
+        # same seed and draws as generate_dist_samples
+        np.random.seed(self.seed)
+        mean = np.random.normal(loc=dist['mean_mean'], scale=dist['mean_sd'] * with_noise)
+        if dist['dist'] == 'gamma':
+            sd = np.random.normal(loc=dist['sd_mean'], scale=dist['sd_sd'] * with_noise)
+            return stats.gamma(mean ** 2 / sd ** 2, scale=sd ** 2 / mean)
+        elif dist['dist'] == 'gamma_cov':
+            cov = np.random.normal(loc=dist['cov_mean'], scale=dist['cov_sd'] * with_noise)
+            sd = cov * mean
+            return stats.gamma(mean ** 2 / sd ** 2, scale=sd ** 2 / mean)
+        elif dist['dist'] == 'lognorm':
+            sd = np.random.normal(loc=dist['sd_mean'], scale=dist['sd_sd'] * with_noise)
+            return stats.lognorm(sd, scale=np.exp(mean))
+        elif dist['dist'] == 'negbinom':
+            disp = np.random.normal(loc=dist['disp_mean'], scale=dist['disp_sd'] * with_noise)
+            return stats.nbinom(disp, disp / (disp + mean))
+
+        raise ValueError(f'Unknown distribution type {dist["dist"]}')
+
+    def discretise_dists(self, dists, max_int, with_noise=False, grid_step=0.01):
+        """
+        Discretise the sum of independent delays to form a pmf, truncating to max, computed from their cdfs.
+
+        This gives the pmf which discretise_samples converges to as the number of samples grows, with the same binning
+        and shape, but without sampling noise. Discrete (negbinom) delays, and up to one continuous delay, are handled
+        exactly. Any further continuous delays are discretised onto a grid with spacing grid_step before convolving.
+
+        :param dists: list of distribution dictionaries.
+        :param max_int: Truncation.
+        :param with_noise: if true, add noise to distributions, as for generate_dist_samples.
+        :param grid_step: grid spacing for additional continuous delays.
+        :return: pmf - discretised distribution.
+        """
+        scipy_dists = [self.get_scipy_dist(dist, with_noise) for dist in dists]
+        discrete = [d for d in scipy_dists if isinstance(d.dist, stats.rv_discrete)]
+        continuous = [d for d in scipy_dists if not isinstance(d.dist, stats.rv_discrete)]
+
+        # all delays are non-negative, so mass beyond max_int never falls into the bins
+        step = grid_step if len(continuous) > 1 else 1.0
+        n_grid = int(np.ceil(max_int / step)) + 1
+
+        # mass of the sum of all but the first continuous delay, at offset + i * step
+        grid_mass = np.ones(1)
+        offset = 0.0
+        for d in discrete:
+            values = np.arange(max_int + 1)
+            mass = np.zeros(n_grid)
+            mass[np.round(values / step).astype(int)] = d.pmf(values)
+            grid_mass = np.convolve(grid_mass, mass)[:n_grid]
+        for d in continuous[1:]:
+            # mass of each grid cell, placed at the cell midpoint
+            mass = np.diff(d.cdf(step * np.arange(n_grid + 1)))
+            grid_mass = np.convolve(grid_mass, mass)[:n_grid]
+            offset += 0.5 * step
+        grid_points = offset + step * np.arange(grid_mass.size)
+
+        # same bins as discretise_samples
+        bins = np.arange(-1.0, float(max_int))
+        bins[2:] += 0.5
+
+        if continuous:
+            cdf = continuous[0].cdf(bins.reshape((-1, 1)) - grid_points.reshape((1, -1))) @ grid_mass
+        else:
+            # bins are half-open, [a, b), as in np.histogram, so this is P(V < b) at each edge
+            cdf = (grid_points.reshape((1, -1)) < bins.reshape((-1, 1))) @ grid_mass
+
+        pmf = np.diff(cdf)
+        pmf = pmf / np.sum(pmf)
+        pmf = pmf.reshape((1, pmf.size))
+
+        return pmf
+
     def generate_pmf_statistics_str(self, delay_prob):
         """
         Make mean and variance of delay string.
@@ -226,7 +428,8 @@ class EpidemiologicalParameters():
         print(f'Generation Interval: mean: {mean :.3f}, sd: {sd :.3f}')
         return mean, sd
 
-    def generate_reporting_and_fatality_delays(self, nRVs=int(1e7), with_noise=True, max_reporting=32, max_fatality=48):
+    def generate_reporting_and_fatality_delays(self, nRVs=int(1e7), with_noise=True, max_reporting=32, max_fatality=48,
+                                               n_workers=1, exact=False):
         """
         Generate reporting and fatality discretised delays using Monte Carlo integration.
 
@@ -236,11 +439,26 @@ class EpidemiologicalParameters():
         :param max_reporting: int - reporting delay truncation
         :param with_noise: boolean. If true, use noisy values for the incubation period etc, otherwise use the means.
         :param max_fatality: int - death delay trunction
+        :param n_workers: int - number of processes to draw samples in (up to 3). If None, use one per CPU.
+        :param exact: boolean. If true, compute the delays from the distribution cdfs (see discretise_dists) rather
+                      than sampling. nRVs and n_workers are then unused.
         :return: reporting_delay, fatality_delay tuple
         """
-        incubation_period_samples = self.generate_dist_samples(self.incubation_period, nRVs, with_noise)
-        reporting_samples = self.generate_dist_samples(self.infection_to_reporting_delay, nRVs, with_noise)
-        fatality_samples = self.generate_dist_samples(self.infection_to_fatality_delay, nRVs, with_noise)
+        if exact:
+            reporting_delay = self.discretise_dists([self.incubation_period, self.infection_to_reporting_delay],
+                                                    max_reporting, with_noise)
+            fatality_delay = self.discretise_dists([self.incubation_period, self.infection_to_fatality_delay],
+                                                   max_fatality, with_noise)
+            print(f'Generated Reporting Delay: {self.generate_pmf_statistics_str(reporting_delay)}')
+            print(f'Generated Fatality Delay: {self.generate_pmf_statistics_str(fatality_delay)}')
+            return reporting_delay, fatality_delay
+
+        # generate_dist_samples seeds numpy itself, so these are the same in any process
+        incubation_period_samples, reporting_samples, fatality_samples = _parallel_map(
+            functools.partial(self.generate_dist_samples, nRVs=nRVs, with_noise=with_noise),
+            [self.incubation_period, self.infection_to_reporting_delay, self.infection_to_fatality_delay],
+            n_workers
+        )
 
         print(f'Raw: reporting delay mean {np.mean(incubation_period_samples + reporting_samples)}')
         print(f'Raw: fatality delay mean {np.mean(incubation_period_samples + fatality_samples)}')
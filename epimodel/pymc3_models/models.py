@@ -7,10 +7,10 @@ import numpy as np
 import pymc3 as pm
 
 import theano.tensor as T
-import theano.tensor.signal.conv as C
 
 from epimodel import EpidemiologicalParameters
 from .base_model import BaseCMModel
+from .renewal import DiscreteRenewal
 
 
 class DefaultModel(BaseCMModel):
@@ -33,7 +33,7 @@ class DefaultModel(BaseCMModel):
                     gi_mean_mean=5, gi_mean_sd=1, gi_sd_mean=2, gi_sd_sd=2, growth_noise_scale=0.2,
                     deaths_delay_mean_mean=21, deaths_delay_mean_sd=1, deaths_delay_disp_mean=9, deaths_delay_disp_sd=1,
                     cases_delay_mean_mean=10, cases_delay_mean_sd=1, cases_delay_disp_mean=5, cases_delay_disp_sd=1,
-                    deaths_truncation=48, cases_truncation=32):
+                    deaths_truncation=48, cases_truncation=32, record='full'):
         """
         Build NPI effectiveness model
 
@@ -55,151 +55,61 @@ class DefaultModel(BaseCMModel):
         :param cases_delay_disp_sd: sd of normal prior placed over cases delay dispersion
         :param deaths_truncation: maximum death delay
         :param cases_truncation: maximum reporting delay
+        :param record: which deterministics to record in the trace: 'full', 'summary' or a list of names. See
+                       BaseCMModel.set_record_policy
         """
+        self.set_record_policy(record)
         with self.model:
             # build NPI Effectiveness priors
             self.build_npi_prior(cm_prior, cm_prior_scale)
 
-            self.CMReduction = pm.Deterministic("CMReduction", T.exp((-1.0) * self.CM_Alpha))
+            self.CMReduction = self.build_deterministic("CMReduction", T.exp((-1.0) * self.CM_Alpha))
 
             # build R_0 prior
-            self.HyperRVar = pm.HalfNormal(
-                "HyperRVar", sigma=0.5
-            )
-
-            self.RegionR_noise = pm.Normal("RegionLogR_noise", 0, 1, shape=(self.nRs))
-            self.RegionR = pm.Deterministic("RegionR", R_prior_mean + self.RegionLogR_noise * self.HyperRVar)
+            self.build_region_r(R_prior_mean, noise_name="RegionLogR_noise")
 
             # load CMs active, compute log-R reduction and region log-R based on NPIs active
-            self.ActiveCMs = pm.Data("ActiveCMs", self.d.ActiveCMs)
-
-            self.ActiveCMReduction = (
-                    T.reshape(self.CM_Alpha, (1, self.nCMs, 1))
-                    * self.ActiveCMs
-            )
-
-            self.LogRReduction = T.sum(self.ActiveCMReduction, axis=1)
-
-            self.ExpectedLogR = T.reshape(pm.math.log(self.RegionR), (self.nRs, 1)) - self.LogRReduction
+            self.LogRReduction = self.build_log_r_reduction(self.CM_Alpha)
+            self.build_expected_log_r(self.LogRReduction)
 
             # convert R into growth rates
-            if gi_mean_sd > 0:
-                self.GI_mean = pm.Normal('GI_mean', gi_mean_mean, gi_mean_sd)
-            else:
-                print('Using a fixed value for the generation interval mean')
-                self.GI_mean = gi_mean_mean
-
-            if gi_sd_sd > 0:
-                self.GI_sd = pm.Normal('GI_sd', gi_sd_mean, gi_sd_sd)
-            else:
-                print('Using a fixed value for the generation interval sd')
-                self.GI_sd = gi_sd_mean
+            self.build_generation_interval(gi_mean_mean, gi_mean_sd, gi_sd_mean, gi_sd_sd)
+            self.ExpectedGrowth = self.growth_from_log_r(self.ExpectedLogR)
 
-            gi_beta = self.GI_mean / self.GI_sd ** 2
-            gi_alpha = self.GI_mean ** 2 / self.GI_sd ** 2
+            self.GrowthCasesNoise = self.build_growth_noise("GrowthCasesNoise", growth_noise_scale)
+            self.GrowthDeathsNoise = self.build_growth_noise("GrowthDeathsNoise", growth_noise_scale)
 
-            self.ExpectedGrowth = gi_beta * (pm.math.exp(self.ExpectedLogR / gi_alpha) - T.ones((self.nRs, self.nDs)))
-
-            # exclude 40 days of noise, slight increase in runtime.
-            self.GrowthCasesNoise = pm.Normal("GrowthCasesNoise", 0, growth_noise_scale,
-                                              shape=(self.nRs, self.nDs - 40))
-            self.GrowthDeathsNoise = pm.Normal("GrowthDeathsNoise", 0, growth_noise_scale,
-                                               shape=(self.nRs, self.nDs - 40))
-
-            self.GrowthCases = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10], self.GrowthCasesNoise)
-            self.GrowthDeaths = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10], self.GrowthDeathsNoise)
+            self.GrowthCases = self.add_growth_noise(self.ExpectedGrowth, self.GrowthCasesNoise)
+            self.GrowthDeaths = self.add_growth_noise(self.ExpectedGrowth, self.GrowthDeathsNoise)
 
             self.PsiCases = pm.HalfNormal('PsiCases', 5.)
             self.PsiDeaths = pm.HalfNormal('PsiDeaths', 5.)
 
             # Confirmed Cases
             # seed and produce daily infections which become confirmed cases
-            self.InitialSizeCases_log = pm.Normal("InitialSizeCases_log", 0, 50, shape=(self.nRs, 1))
-            self.InfectedCases = pm.Deterministic("InfectedCases", pm.math.exp(
-                self.InitialSizeCases_log + self.GrowthCases.cumsum(axis=1)))
-
-            if cases_delay_mean_sd > 0:
-                self.CasesDelayMean = pm.Normal('CasesDelayMean', cases_delay_mean_mean, cases_delay_mean_sd)
-            else:
-                print('Using a fixed value for the reporting delay mean')
-                self.CasesDelayMean = cases_delay_mean_mean
-
-            if cases_delay_disp_sd > 0:
-                self.CasesDelayDisp = pm.Normal('CasesDelayDisp', cases_delay_disp_mean, cases_delay_disp_sd)
-            else:
-                print('Using a fixed value for the reporting delay mean')
-                self.CasesDelayDisp = cases_delay_disp_mean
-
-            cases_delay_dist = pm.NegativeBinomial.dist(mu=self.CasesDelayMean, alpha=self.CasesDelayDisp)
-            bins = np.arange(0, cases_truncation)
-            pmf = T.exp(cases_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            reporting_delay = pmf.reshape((1, cases_truncation))
+            self.build_infected(self.GrowthCases, "Cases")
 
             # convolve with delay to produce expectations
-            expected_cases = C.conv2d(
-                self.InfectedCases,
-                reporting_delay,
-                border_mode="full"
-            )[:, :self.nDs]
-
-            self.ExpectedCases = pm.Deterministic("ExpectedCases", expected_cases.reshape(
-                (self.nRs, self.nDs)))
+            reporting_delay = self.build_delay("Cases", cases_delay_mean_mean, cases_delay_mean_sd,
+                                               cases_delay_disp_mean, cases_delay_disp_sd, cases_truncation)
+            self.ExpectedCases = self.build_expected("ExpectedCases", self.InfectedCases, reporting_delay)
 
-            # effectively handle missing values ourselves
             # output distribution
-            self.ObservedCases = pm.NegativeBinomial(
-                "ObservedCases",
-                mu=self.ExpectedCases.reshape((self.nRs * self.nDs,))[self.all_observed_active],
-                alpha=self.PsiCases,
-                shape=(len(self.all_observed_active),),
-                observed=self.d.NewCases.data.reshape((self.nRs * self.nDs,))[self.all_observed_active]
-            )
+            self.ObservedCases = self.build_observation("ObservedCases", "ExpectedCases", self.ExpectedCases,
+                                                        self.PsiCases, self.all_observed_active, self.d.NewCases)
 
             # Deaths
-            # seed and produce daily infections which become confirmed cases
-            self.InitialSizeDeaths_log = pm.Normal("InitialSizeDeaths_log", 0, 50, shape=(self.nRs, 1))
-            self.InfectedDeaths = pm.Deterministic("InfectedDeaths", pm.math.exp(
-                self.InitialSizeDeaths_log + self.GrowthDeaths.cumsum(axis=1)))
-
-            if deaths_delay_mean_sd > 0:
-                self.DeathsDelayMean = pm.Normal('DeathsDelayMean', deaths_delay_mean_mean,
-                                                 deaths_delay_mean_sd)
-            else:
-                print('Using a fixed value for the fatality delay mean')
-                self.DeathsDelayMean = deaths_delay_mean_mean
-
-            if deaths_delay_disp_sd > 0:
-                self.DeathsDelayDisp = pm.Normal('DeathsDelayDisp', deaths_delay_disp_mean, deaths_delay_disp_sd)
-            else:
-                print('Using a fixed value for the reporting delay mean')
-                self.DeathsDelayDisp = deaths_delay_disp_mean
-
-            deaths_delay_dist = pm.NegativeBinomial.dist(mu=self.DeathsDelayMean, alpha=self.DeathsDelayDisp)
-            bins = np.arange(0, deaths_truncation)
-            pmf = T.exp(deaths_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            fatality_delay = pmf.reshape((1, deaths_truncation))
+            # seed and produce daily infections which become deaths
+            self.build_infected(self.GrowthDeaths, "Deaths")
 
             # convolve with delay to production reports
-            expected_deaths = C.conv2d(
-                self.InfectedDeaths,
-                fatality_delay,
-                border_mode="full"
-            )[:, :self.nDs]
-
-            self.ExpectedDeaths = pm.Deterministic("ExpectedDeaths", expected_deaths.reshape(
-                (self.nRs, self.nDs)))
+            fatality_delay = self.build_delay("Deaths", deaths_delay_mean_mean, deaths_delay_mean_sd,
+                                              deaths_delay_disp_mean, deaths_delay_disp_sd, deaths_truncation)
+            self.ExpectedDeaths = self.build_expected("ExpectedDeaths", self.InfectedDeaths, fatality_delay)
 
-            # effectively handle missing values ourselves
             # death output distribution
-            self.ObservedDeaths = pm.NegativeBinomial(
-                "ObservedDeaths",
-                mu=self.ExpectedDeaths.reshape((self.nRs * self.nDs,))[self.all_observed_deaths],
-                alpha=self.PsiDeaths,
-                shape=(len(self.all_observed_deaths),),
-                observed=self.d.NewDeaths.data.reshape((self.nRs * self.nDs,))[self.all_observed_deaths]
-            )
+            self.ObservedDeaths = self.build_observation("ObservedDeaths", "ExpectedDeaths", self.ExpectedDeaths,
+                                                         self.PsiDeaths, self.all_observed_deaths, self.d.NewDeaths)
 
 
 class DeathsOnlyModel(BaseCMModel):
@@ -212,7 +122,7 @@ class DeathsOnlyModel(BaseCMModel):
     def build_model(self, R_prior_mean=3.28, cm_prior_scale=10, cm_prior='skewed',
                     gi_mean_mean=5, gi_mean_sd=1, gi_sd_mean=2, gi_sd_sd=2, growth_noise_scale=0.2,
                     deaths_delay_mean_mean=21, deaths_delay_mean_sd=1, deaths_delay_disp_mean=9, deaths_delay_disp_sd=1,
-                    deaths_truncation=48, **kwargs):
+                    deaths_truncation=48, record='full', **kwargs):
         """
         Build PyMC3 model.
 
@@ -229,7 +139,10 @@ class DeathsOnlyModel(BaseCMModel):
         :param deaths_delay_disp_mean: mean of normal prior placed over death delay dispersion (alpha / psi)
         :param deaths_delay_disp_sd: sd of normal prior placed over death delay dispersion (alpha / psi)
         :param deaths_truncation: maximum death delay
+        :param record: which deterministics to record in the trace: 'full', 'summary' or a list of names. See
+                       BaseCMModel.set_record_policy
         """
+        self.set_record_policy(record)
 
         for key, _ in kwargs.items():
             print(f'Argument: {key} not being used')
@@ -238,79 +151,33 @@ class DeathsOnlyModel(BaseCMModel):
             # build NPI Effectiveness priors
             self.build_npi_prior(cm_prior, cm_prior_scale)
 
-            self.CMReduction = pm.Deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
-
-            self.HyperRVar = pm.HalfNormal(
-                'HyperRVar', sigma=0.5
-            )
-
-            self.RegionR_noise = pm.Normal('RegionLogR_noise', 0, 1, shape=(self.nRs), )
-            self.RegionR = pm.Deterministic('RegionR', R_prior_mean + self.RegionLogR_noise * self.HyperRVar)
-
-            self.ActiveCMs = pm.Data('ActiveCMs', self.d.ActiveCMs)
-
-            self.ActiveCMReduction = (
-                    T.reshape(self.CM_Alpha, (1, self.nCMs, 1))
-                    * self.ActiveCMs
-            )
+            self.CMReduction = self.build_deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
 
-            self.GrowthReduction = T.sum(self.ActiveCMReduction, axis=1)
+            self.build_region_r(R_prior_mean, noise_name='RegionLogR_noise')
 
-            self.ExpectedLogR = pm.Deterministic(
-                'ExpectedLogR',
-                T.reshape(pm.math.log(self.RegionR), (self.nRs, 1)) - self.GrowthReduction
-            )
+            self.GrowthReduction = self.build_log_r_reduction(self.CM_Alpha)
+            self.build_expected_log_r(self.GrowthReduction)
 
             # convert R into growth rates
-            self.GI_mean = pm.Normal('GI_mean', gi_mean_mean, gi_mean_sd)
-            self.GI_sd = pm.Normal('GI_sd', gi_sd_mean, gi_sd_sd)
-
-            gi_beta = self.GI_mean / self.GI_sd ** 2
-            gi_alpha = self.GI_mean ** 2 / self.GI_sd ** 2
-
-            self.ExpectedGrowth = gi_beta * (np.exp(self.ExpectedLogR / gi_alpha) - T.ones_like(
-                self.ExpectedLogR))
-
-            self.GrowthNoise = pm.Normal('Growth', 0, growth_noise_scale, shape=(self.nRs, self.nDs - 40))
-
-            self.Growth = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10], self.GrowthNoise)
-
-            self.InitialSize_log = pm.Normal('InitialSize_log', 0, 50, shape=(self.nRs,))
-            self.Infected_log = pm.Deterministic('Infected_log', T.reshape(self.InitialSize_log, (
-                self.nRs, 1)) + self.Growth.cumsum(axis=1))
+            self.build_generation_interval(gi_mean_mean, gi_mean_sd, gi_sd_mean, gi_sd_sd)
+            self.ExpectedGrowth = self.growth_from_log_r(self.ExpectedLogR)
 
-            self.Infected = pm.Deterministic('Infected', pm.math.exp(self.Infected_log))
+            self.GrowthNoise = self.build_growth_noise('Growth', growth_noise_scale)
 
-            self.DeathsDelayMean = pm.Normal('DeathsDelayMean', deaths_delay_mean_mean, deaths_delay_mean_sd)
-            self.DeathsDelayDisp = pm.Normal('DeathsDelayDisp', deaths_delay_disp_mean, deaths_delay_disp_sd)
-            deaths_delay_dist = pm.NegativeBinomial.dist(mu=self.DeathsDelayMean, alpha=self.DeathsDelayDisp)
-            bins = np.arange(0, deaths_truncation)
-            pmf = T.exp(deaths_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            fatality_delay = pmf.reshape((1, deaths_truncation))
+            self.Growth = self.add_growth_noise(self.ExpectedGrowth, self.GrowthNoise)
 
-            expected_deaths = C.conv2d(
-                self.Infected,
-                fatality_delay,
-                border_mode='full'
-            )[:, :self.nDs]
+            self.build_infected(self.Growth)
 
-            self.ExpectedDeaths = pm.Deterministic('ExpectedDeaths', expected_deaths.reshape(
-                (self.nRs, self.nDs)))
+            fatality_delay = self.build_delay('Deaths', deaths_delay_mean_mean, deaths_delay_mean_sd,
+                                              deaths_delay_disp_mean, deaths_delay_disp_sd, deaths_truncation)
+            self.ExpectedDeaths = self.build_expected('ExpectedDeaths', self.Infected, fatality_delay)
 
             self.Psi = pm.HalfNormal('Psi', 5)
 
-            self.NewDeaths = pm.Data('NewDeaths',
-                                     self.d.NewDeaths.data.reshape((self.nRs * self.nDs,))[self.all_observed_deaths])
-
-            # effectively handle missing values ourselves
-            self.ObservedDeaths = pm.NegativeBinomial(
-                'ObservedCases',
-                mu=self.ExpectedDeaths.reshape((self.nRs * self.nDs,))[self.all_observed_deaths],
-                alpha=self.Psi,
-                shape=(len(self.all_observed_deaths),),
-                observed=self.NewDeaths
-            )
+            # the observed RV keeps its historical name, ObservedCases
+            self.ObservedDeaths = self.build_observation('ObservedCases', 'ExpectedDeaths', self.ExpectedDeaths,
+                                                         self.Psi, self.all_observed_deaths, self.d.NewDeaths,
+                                                         data_name='NewDeaths')
 
 
 class CasesOnlyModel(BaseCMModel):
@@ -323,7 +190,7 @@ class CasesOnlyModel(BaseCMModel):
     def build_model(self, R_prior_mean=3.28, cm_prior_scale=10, cm_prior='skewed',
                     gi_mean_mean=5, gi_mean_sd=1, gi_sd_mean=2, gi_sd_sd=2, growth_noise_scale=0.2,
                     cases_delay_mean_mean=10, cases_delay_mean_sd=1, cases_delay_disp_mean=5, cases_delay_disp_sd=1,
-                    cases_truncation=32, **kwargs):
+                    cases_truncation=32, record='full', **kwargs):
         """
         Build PyMC3 model.
 
@@ -341,7 +208,10 @@ class CasesOnlyModel(BaseCMModel):
         :param cases_delay_disp_sd: sd of normal prior placed over cases delay dispersion
         :param deaths_truncation: maximum death delay
         :param cases_truncation: maximum reporting delay
+        :param record: which deterministics to record in the trace: 'full', 'summary' or a list of names. See
+                       BaseCMModel.set_record_policy
         """
+        self.set_record_policy(record)
         for key, _ in kwargs.items():
             print(f'Argument: {key} not being used')
 
@@ -349,76 +219,31 @@ class CasesOnlyModel(BaseCMModel):
             # build NPI Effectiveness priors
             self.build_npi_prior(cm_prior, cm_prior_scale)
 
-            self.CMReduction = pm.Deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
-
-            self.HyperRVar = pm.HalfNormal(
-                'HyperRVar', sigma=0.5
-            )
+            self.CMReduction = self.build_deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
 
-            self.RegionR_noise = pm.Normal('RegionLogR_noise', 0, 1, shape=(self.nRs), )
-            self.RegionR = pm.Deterministic('RegionR', R_prior_mean + self.RegionLogR_noise * self.HyperRVar)
+            self.build_region_r(R_prior_mean, noise_name='RegionLogR_noise')
 
-            self.ActiveCMs = pm.Data('ActiveCMs', self.d.ActiveCMs)
-
-            self.ActiveCMReduction = (
-                    T.reshape(self.CM_Alpha, (1, self.nCMs, 1))
-                    * self.ActiveCMs
-            )
-
-            growth_reduction = T.sum(self.ActiveCMReduction, axis=1)
-
-            self.ExpectedLogR = pm.Deterministic(
-                'ExpectedLogR',
-                T.reshape(pm.math.log(self.RegionR), (self.nRs, 1)) - growth_reduction
-            )
+            growth_reduction = self.build_log_r_reduction(self.CM_Alpha)
+            self.build_expected_log_r(growth_reduction)
 
             # convert R into growth rates
-            self.GI_mean = pm.Normal('GI_mean', gi_mean_mean, gi_mean_sd)
-            self.GI_sd = pm.Normal('GI_sd', gi_sd_mean, gi_sd_sd)
-
-            gi_beta = self.GI_mean / self.GI_sd ** 2
-            gi_alpha = self.GI_mean ** 2 / self.GI_sd ** 2
-
-            self.ExpectedGrowth = gi_beta * (np.exp(self.ExpectedLogR / gi_alpha) - T.ones_like(
-                self.ExpectedLogR))
-
-            self.GrowthNoise = pm.Normal('Growth', 0, growth_noise_scale, shape=(self.nRs, self.nDs - 40))
-
-            self.Growth = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10], self.GrowthNoise)
+            self.build_generation_interval(gi_mean_mean, gi_mean_sd, gi_sd_mean, gi_sd_sd)
+            self.ExpectedGrowth = self.growth_from_log_r(self.ExpectedLogR)
 
-            self.InitialSize_log = pm.Normal('InitialSize_log', 0, 50, shape=(self.nRs,))
-            self.Infected_log = pm.Deterministic('Infected_log', T.reshape(self.InitialSize_log, (
-                self.nRs, 1)) + self.Growth.cumsum(axis=1))
+            self.GrowthNoise = self.build_growth_noise('Growth', growth_noise_scale)
 
-            self.Infected = pm.Deterministic('Infected', pm.math.exp(self.Infected_log))
+            self.Growth = self.add_growth_noise(self.ExpectedGrowth, self.GrowthNoise)
 
-            self.CasesDelayMean = pm.Normal('CasesDelayMean', cases_delay_mean_mean, cases_delay_mean_sd)
-            self.CasesDelayDisp = pm.Normal('CasesDelayDisp', cases_delay_disp_mean, cases_delay_disp_sd)
-            cases_delay_dist = pm.NegativeBinomial.dist(mu=self.CasesDelayMean, alpha=self.CasesDelayDisp)
-            bins = np.arange(0, cases_truncation)
-            pmf = T.exp(cases_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            reporting_delay = pmf.reshape((1, cases_truncation))
+            self.build_infected(self.Growth)
 
-            expected_confirmed = C.conv2d(
-                self.Infected,
-                reporting_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedCases = pm.Deterministic('ExpectedCases', expected_confirmed.reshape(
-                (self.nRs, self.nDs)))
+            reporting_delay = self.build_delay('Cases', cases_delay_mean_mean, cases_delay_mean_sd,
+                                               cases_delay_disp_mean, cases_delay_disp_sd, cases_truncation)
+            self.ExpectedCases = self.build_expected('ExpectedCases', self.Infected, reporting_delay)
 
             self.Psi = pm.HalfNormal('Phi', 5)
 
-            # effectively handle missing values ourselves
-            self.ObservedCases = pm.NegativeBinomial(
-                'ObservedCases',
-                mu=self.ExpectedCases.reshape((self.nRs * self.nDs,))[self.all_observed_active],
-                alpha=self.Psi,
-                shape=(len(self.all_observed_active),),
-                observed=self.d.NewCases.data.reshape((self.nRs * self.nDs,))[self.all_observed_active]
-            )
+            self.ObservedCases = self.build_observation('ObservedCases', 'ExpectedCases', self.ExpectedCases,
+                                                        self.Psi, self.all_observed_active, self.d.NewCases)
 
 
 class NoisyRModel(BaseCMModel):
@@ -433,7 +258,7 @@ class NoisyRModel(BaseCMModel):
                     gi_mean_mean=5, gi_mean_sd=1, gi_sd_mean=2, gi_sd_sd=2, R_noise_scale=0.8,
                     deaths_delay_mean_mean=21, deaths_delay_mean_sd=1, deaths_delay_disp_mean=9, deaths_delay_disp_sd=1,
                     cases_delay_mean_mean=10, cases_delay_mean_sd=1, cases_delay_disp_mean=5, cases_delay_disp_sd=1,
-                    deaths_truncation=48, cases_truncation=32, **kwargs):
+                    deaths_truncation=48, cases_truncation=32, record='full', **kwargs):
         """
         Build NPI effectiveness model
 
@@ -455,31 +280,22 @@ class NoisyRModel(BaseCMModel):
         :param cases_delay_disp_sd: sd of normal prior placed over cases delay dispersion
         :param deaths_truncation: maximum death delay
         :param cases_truncation: maximum reporting delay
+        :param record: which deterministics to record in the trace: 'full', 'summary' or a list of names. See
+                       BaseCMModel.set_record_policy
         """
+        self.set_record_policy(record)
         for key, _ in kwargs.items():
             print(f'Argument: {key} not being used')
 
         with self.model:
             self.build_npi_prior(cm_prior, cm_prior_scale)
-            self.CMReduction = pm.Deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
+            self.CMReduction = self.build_deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
 
-            self.HyperRVar = pm.HalfNormal(
-                'HyperRVar', sigma=0.5
-            )
-
-            self.RegionR_noise = pm.Normal('RegionLogR_noise', 0, 1, shape=(self.nRs))
-            self.RegionR = pm.Deterministic('RegionR', R_prior_mean + self.RegionLogR_noise * self.HyperRVar)
+            self.build_region_r(R_prior_mean, noise_name='RegionLogR_noise')
 
             self.RegionLogR = pm.math.log(self.RegionR)
 
-            self.ActiveCMs = pm.Data('ActiveCMs', self.d.ActiveCMs)
-
-            self.ActiveCMReduction = (
-                    T.reshape(self.CM_Alpha, (1, self.nCMs, 1))
-                    * self.ActiveCMs
-            )
-
-            self.GrowthReduction = T.sum(self.ActiveCMReduction, axis=1)
+            self.GrowthReduction = self.build_log_r_reduction(self.CM_Alpha)
 
             self.ExpectedLogRCases = pm.Normal(
                 'ExpectedLogRCases',
@@ -496,84 +312,31 @@ class NoisyRModel(BaseCMModel):
             )
 
             # convert R into growth rates
-            self.GI_mean = pm.Normal('GI_mean', gi_mean_mean, gi_mean_sd)
-            self.GI_sd = pm.Normal('GI_sd', gi_sd_mean, gi_sd_sd)
-
-            gi_beta = self.GI_mean / self.GI_sd ** 2
-            gi_alpha = self.GI_mean ** 2 / self.GI_sd ** 2
-
-            self.GrowthCases = gi_beta * (
-                    pm.math.exp(self.ExpectedLogRCases / gi_alpha) - T.ones_like(self.ExpectedLogRCases))
+            self.build_generation_interval(gi_mean_mean, gi_mean_sd, gi_sd_mean, gi_sd_sd)
 
-            self.GrowthDeaths = gi_beta * (
-                    pm.math.exp(self.ExpectedLogRDeaths / gi_alpha) - T.ones_like(self.ExpectedLogRDeaths))
+            self.GrowthCases = self.growth_from_log_r(self.ExpectedLogRCases)
+            self.GrowthDeaths = self.growth_from_log_r(self.ExpectedLogRDeaths)
 
             self.PsiCases = pm.HalfNormal('PsiCases', 5.)
             self.PsiDeaths = pm.HalfNormal('PsiDeaths', 5.)
 
-            self.InitialSizeCases_log = pm.Normal('InitialSizeCases_log', 0, 50, shape=(self.nRs,))
-            self.InfectedCases_log = pm.Deterministic('InfectedCases_log', T.reshape(self.InitialSizeCases_log, (
-                self.nRs, 1)) + self.GrowthCases.cumsum(axis=1))
-
-            self.InfectedCases = pm.Deterministic('InfectedCases', pm.math.exp(self.InfectedCases_log))
-
-            self.CasesDelayMean = pm.Normal('CasesDelayMean', cases_delay_mean_mean, cases_delay_mean_sd)
-            self.CasesDelayDisp = pm.Normal('CasesDelayDisp', cases_delay_disp_mean, cases_delay_disp_sd)
-            cases_delay_dist = pm.NegativeBinomial.dist(mu=self.CasesDelayMean, alpha=self.CasesDelayDisp)
-            bins = np.arange(0, cases_truncation)
-            pmf = T.exp(cases_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            reporting_delay = pmf.reshape((1, cases_truncation))
-
-            expected_cases = C.conv2d(
-                self.InfectedCases,
-                reporting_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedCases = pm.Deterministic('ExpectedCases', expected_cases.reshape(
-                (self.nRs, self.nDs)))
-
-            # effectively handle missing values ourselves
-            self.ObservedCases = pm.NegativeBinomial(
-                'ObservedCases',
-                mu=self.ExpectedCases.reshape((self.nRs * self.nDs,))[self.all_observed_active],
-                alpha=self.PsiCases,
-                shape=(len(self.all_observed_active),),
-                observed=self.d.NewCases.data.reshape((self.nRs * self.nDs,))[self.all_observed_active]
-            )
+            self.build_infected(self.GrowthCases, 'Cases')
 
-            self.InitialSizeDeaths_log = pm.Normal('InitialSizeDeaths_log', 0, 50, shape=(self.nRs,))
-            self.InfectedDeaths_log = pm.Deterministic('InfectedDeaths_log', T.reshape(self.InitialSizeDeaths_log, (
-                self.nRs, 1)) + self.GrowthDeaths.cumsum(axis=1))
-
-            self.InfectedDeaths = pm.Deterministic('InfectedDeaths', pm.math.exp(self.InfectedDeaths_log))
-
-            self.DeathsDelayMean = pm.Normal('DeathsDelayMean', deaths_delay_mean_mean, deaths_delay_mean_sd)
-            self.DeathsDelayDisp = pm.Normal('DeathsDelayDisp', deaths_delay_disp_mean, deaths_delay_disp_sd)
-            deaths_delay_dist = pm.NegativeBinomial.dist(mu=self.DeathsDelayMean, alpha=self.DeathsDelayDisp)
-            bins = np.arange(0, deaths_truncation)
-            pmf = T.exp(deaths_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            fatality_delay = pmf.reshape((1, deaths_truncation))
-
-            expected_deaths = C.conv2d(
-                self.InfectedDeaths,
-                fatality_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedDeaths = pm.Deterministic('ExpectedDeaths', expected_deaths.reshape(
-                (self.nRs, self.nDs)))
-
-            # effectively handle missing values ourselves
-            self.ObservedDeaths = pm.NegativeBinomial(
-                'ObservedDeaths',
-                mu=self.ExpectedDeaths.reshape((self.nRs * self.nDs,))[self.all_observed_deaths],
-                alpha=self.PsiDeaths,
-                shape=(len(self.all_observed_deaths),),
-                observed=self.d.NewDeaths.data.reshape((self.nRs * self.nDs,))[self.all_observed_deaths]
-            )
+            reporting_delay = self.build_delay('Cases', cases_delay_mean_mean, cases_delay_mean_sd,
+                                               cases_delay_disp_mean, cases_delay_disp_sd, cases_truncation)
+            self.ExpectedCases = self.build_expected('ExpectedCases', self.InfectedCases, reporting_delay)
+
+            self.ObservedCases = self.build_observation('ObservedCases', 'ExpectedCases', self.ExpectedCases,
+                                                        self.PsiCases, self.all_observed_active, self.d.NewCases)
+
+            self.build_infected(self.GrowthDeaths, 'Deaths')
+
+            fatality_delay = self.build_delay('Deaths', deaths_delay_mean_mean, deaths_delay_mean_sd,
+                                              deaths_delay_disp_mean, deaths_delay_disp_sd, deaths_truncation)
+            self.ExpectedDeaths = self.build_expected('ExpectedDeaths', self.InfectedDeaths, fatality_delay)
+
+            self.ObservedDeaths = self.build_observation('ObservedDeaths', 'ExpectedDeaths', self.ExpectedDeaths,
+                                                         self.PsiDeaths, self.all_observed_deaths, self.d.NewDeaths)
 
 
 class AdditiveModel(BaseCMModel):
@@ -581,7 +344,7 @@ class AdditiveModel(BaseCMModel):
                     gi_mean_mean=5, gi_mean_sd=1, gi_sd_mean=2, gi_sd_sd=2, growth_noise_scale=0.2,
                     deaths_delay_mean_mean=21, deaths_delay_mean_sd=1, deaths_delay_disp_mean=9, deaths_delay_disp_sd=1,
                     cases_delay_mean_mean=10, cases_delay_mean_sd=1, cases_delay_disp_mean=5, cases_delay_disp_sd=1,
-                    deaths_truncation=48, cases_truncation=32, **kwargs):
+                    deaths_truncation=48, cases_truncation=32, record='full', **kwargs):
         """
         Build NPI effectiveness model
         :param R_prior_mean: R_0 prior mean
@@ -602,22 +365,20 @@ class AdditiveModel(BaseCMModel):
         :param cases_delay_disp_sd: sd of normal prior placed over cases delay dispersion
         :param deaths_truncation: maximum death delay
         :param cases_truncation: maximum reporting delay
+        :param record: which deterministics to record in the trace: 'full', 'summary' or a list of names. See
+                       BaseCMModel.set_record_policy
         """
+        self.set_record_policy(record)
         for key, _ in kwargs.items():
             print(f'Argument: {key} not being used')
 
         with self.model:
             self.AllBeta = pm.Dirichlet('AllBeta', cm_prior_scale * np.ones((self.nCMs + 1)), shape=(self.nCMs + 1,))
-            self.CM_Beta = pm.Deterministic('CM_Beta', self.AllBeta[1:])
-            self.Beta_hat = pm.Deterministic('Beta_hat', self.AllBeta[0])
-            self.CMReduction = pm.Deterministic('CMReduction', self.CM_Beta)
-
-            self.HyperRVar = pm.HalfNormal(
-                'HyperRVar', sigma=0.5
-            )
+            self.CM_Beta = self.build_deterministic('CM_Beta', self.AllBeta[1:])
+            self.Beta_hat = self.build_deterministic('Beta_hat', self.AllBeta[0])
+            self.CMReduction = self.build_deterministic('CMReduction', self.CM_Beta)
 
-            self.RegionR_noise = pm.Normal('RegionLogR_noise', 0, 1, shape=(self.nRs), )
-            self.RegionR = pm.Deterministic('RegionR', R_prior_mean + self.RegionLogR_noise * self.HyperRVar)
+            self.build_region_r(R_prior_mean, noise_name='RegionLogR_noise')
 
             self.ActiveCMs = pm.Data('ActiveCMs', self.d.ActiveCMs)
 
@@ -626,93 +387,40 @@ class AdditiveModel(BaseCMModel):
 
             growth_reduction = T.sum(active_cm_reduction, axis=1) + self.Beta_hat
 
-            self.ExpectedLogR = pm.Deterministic(
+            self.ExpectedLogR = self.build_deterministic(
                 'ExpectedLogR',
                 T.log(T.exp(T.reshape(pm.math.log(self.RegionR), (self.nRs, 1))) * growth_reduction)
             )
 
-            self.GI_mean = pm.Normal('GI_mean', gi_mean_mean, gi_mean_sd)
-            self.GI_sd = pm.Normal('GI_sd', gi_sd_mean, gi_sd_sd)
-
-            gi_beta = self.GI_mean / self.GI_sd ** 2
-            gi_alpha = self.GI_mean ** 2 / self.GI_sd ** 2
-
-            self.ExpectedGrowth = gi_beta * (pm.math.exp(self.ExpectedLogR / gi_alpha) - T.ones_like(self.ExpectedLogR))
+            self.build_generation_interval(gi_mean_mean, gi_mean_sd, gi_sd_mean, gi_sd_sd)
+            self.ExpectedGrowth = self.growth_from_log_r(self.ExpectedLogR)
 
-            self.GrowthCasesNoise = pm.Normal("GrowthCasesNoise", 0, growth_noise_scale,
-                                              shape=(self.nRs, self.nDs - 40))
-            self.GrowthDeathsNoise = pm.Normal("GrowthDeathsNoise", 0, growth_noise_scale,
-                                               shape=(self.nRs, self.nDs - 40))
+            self.GrowthCasesNoise = self.build_growth_noise('GrowthCasesNoise', growth_noise_scale)
+            self.GrowthDeathsNoise = self.build_growth_noise('GrowthDeathsNoise', growth_noise_scale)
 
-            self.GrowthCases = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10], self.GrowthCasesNoise)
-            self.GrowthDeaths = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10], self.GrowthDeathsNoise)
+            self.GrowthCases = self.add_growth_noise(self.ExpectedGrowth, self.GrowthCasesNoise)
+            self.GrowthDeaths = self.add_growth_noise(self.ExpectedGrowth, self.GrowthDeathsNoise)
 
             self.PsiCases = pm.HalfNormal('PsiCases', 5.)
             self.PsiDeaths = pm.HalfNormal('PsiDeaths', 5.)
 
-            self.InitialSizeCases_log = pm.Normal('InitialSizeCases_log', 0, 50, shape=(self.nRs,))
-            self.InfectedCases_log = pm.Deterministic('InfectedCases_log', T.reshape(self.InitialSizeCases_log, (
-                self.nRs, 1)) + self.GrowthCases.cumsum(axis=1))
-
-            self.InfectedCases = pm.Deterministic('InfectedCases', pm.math.exp(self.InfectedCases_log))
-
-            self.CasesDelayMean = pm.Normal('CasesDelayMean', cases_delay_mean_mean, cases_delay_mean_sd)
-            self.CasesDelayDisp = pm.Normal('CasesDelayDisp', cases_delay_disp_mean, cases_delay_disp_sd)
-            cases_delay_dist = pm.NegativeBinomial.dist(mu=self.CasesDelayMean, alpha=self.CasesDelayDisp)
-            bins = np.arange(0, cases_truncation)
-            pmf = T.exp(cases_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            reporting_delay = pmf.reshape((1, cases_truncation))
-
-            expected_cases = C.conv2d(
-                self.InfectedCases,
-                reporting_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedCases = pm.Deterministic('ExpectedCases', expected_cases.reshape(
-                (self.nRs, self.nDs)))
-
-            # learn the output noise for this.
-            self.ObservedCases = pm.NegativeBinomial(
-                'ObservedCases',
-                mu=self.ExpectedCases.reshape((self.nRs * self.nDs,))[self.all_observed_active],
-                alpha=self.PsiCases,
-                shape=(len(self.all_observed_active),),
-                observed=self.d.NewCases.data.reshape((self.nRs * self.nDs,))[self.all_observed_active]
-            )
+            self.build_infected(self.GrowthCases, 'Cases')
 
-            self.InitialSizeDeaths_log = pm.Normal('InitialSizeDeaths_log', 0, 50, shape=(self.nRs,))
-            self.InfectedDeaths_log = pm.Deterministic('InfectedDeaths_log', T.reshape(self.InitialSizeDeaths_log, (
-                self.nRs, 1)) + self.GrowthDeaths.cumsum(axis=1))
-
-            self.InfectedDeaths = pm.Deterministic('InfectedDeaths', pm.math.exp(self.InfectedDeaths_log))
-
-            self.DeathsDelayMean = pm.Normal('DeathsDelayMean', deaths_delay_mean_mean, deaths_delay_mean_sd)
-            self.DeathsDelayDisp = pm.Normal('DeathsDelayDisp', deaths_delay_disp_mean, deaths_delay_disp_sd)
-            deaths_delay_dist = pm.NegativeBinomial.dist(mu=self.DeathsDelayMean, alpha=self.DeathsDelayDisp)
-            bins = np.arange(0, deaths_truncation)
-            pmf = T.exp(deaths_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            fatality_delay = pmf.reshape((1, deaths_truncation))
-
-            expected_deaths = C.conv2d(
-                self.InfectedDeaths,
-                fatality_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedDeaths = pm.Deterministic('ExpectedDeaths', expected_deaths.reshape(
-                (self.nRs, self.nDs)))
-
-            # effectively handle missing values ourselves
-            self.ObservedDeaths = pm.NegativeBinomial(
-                'ObservedDeaths',
-                mu=self.ExpectedDeaths.reshape((self.nRs * self.nDs,))[self.all_observed_deaths],
-                alpha=self.PsiDeaths,
-                shape=(len(self.all_observed_deaths),),
-                observed=self.d.NewDeaths.data.reshape((self.nRs * self.nDs,))[self.all_observed_deaths]
-            )
+            reporting_delay = self.build_delay('Cases', cases_delay_mean_mean, cases_delay_mean_sd,
+                                               cases_delay_disp_mean, cases_delay_disp_sd, cases_truncation)
+            self.ExpectedCases = self.build_expected('ExpectedCases', self.InfectedCases, reporting_delay)
+
+            self.ObservedCases = self.build_observation('ObservedCases', 'ExpectedCases', self.ExpectedCases,
+                                                        self.PsiCases, self.all_observed_active, self.d.NewCases)
+
+            self.build_infected(self.GrowthDeaths, 'Deaths')
+
+            fatality_delay = self.build_delay('Deaths', deaths_delay_mean_mean, deaths_delay_mean_sd,
+                                              deaths_delay_disp_mean, deaths_delay_disp_sd, deaths_truncation)
+            self.ExpectedDeaths = self.build_expected('ExpectedDeaths', self.InfectedDeaths, fatality_delay)
+
+            self.ObservedDeaths = self.build_observation('ObservedDeaths', 'ExpectedDeaths', self.ExpectedDeaths,
+                                                         self.PsiDeaths, self.all_observed_deaths, self.d.NewDeaths)
 
 
 class DifferentEffectsModel(BaseCMModel):
@@ -720,7 +428,7 @@ class DifferentEffectsModel(BaseCMModel):
                     gi_mean_mean=5, gi_mean_sd=1, gi_sd_mean=2, gi_sd_sd=2, growth_noise_scale=0.2,
                     alpha_noise_scale=0.1, deaths_delay_mean_mean=21, deaths_delay_mean_sd=1, deaths_delay_disp_mean=9,
                     deaths_delay_disp_sd=1, cases_delay_mean_mean=10, cases_delay_mean_sd=1, cases_delay_disp_mean=5,
-                    cases_delay_disp_sd=1, deaths_truncation=48, cases_truncation=32, **kwargs):
+                    cases_delay_disp_sd=1, deaths_truncation=48, cases_truncation=32, record='full', **kwargs):
         """
         Build NPI effectiveness model
         :param R_prior_mean: R_0 prior mean
@@ -741,11 +449,14 @@ class DifferentEffectsModel(BaseCMModel):
         :param cases_delay_disp_sd: sd of normal prior placed over cases delay dispersion
         :param deaths_truncation: maximum death delay
         :param cases_truncation: maximum reporting delay
+        :param record: which deterministics to record in the trace: 'full', 'summary' or a list of names. See
+                       BaseCMModel.set_record_policy
         """
+        self.set_record_policy(record)
         with self.model:
             self.build_npi_prior(cm_prior, cm_prior_scale)
 
-            self.CMReduction = pm.Deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
+            self.CMReduction = self.build_deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
 
             self.AllCMAlpha = pm.Normal('AllCMAlpha',
                                         T.reshape(self.CM_Alpha, (1, self.nCMs)).repeat(self.nRs, axis=0),
@@ -753,105 +464,41 @@ class DifferentEffectsModel(BaseCMModel):
                                         shape=(self.nRs, self.nCMs)
                                         )
 
-            self.HyperRVar = pm.HalfNormal(
-                'HyperRVar', sigma=0.5
-            )
+            self.build_region_r(R_prior_mean, noise_name='RegionLogR_noise')
 
-            self.RegionR_noise = pm.Normal('RegionLogR_noise', 0, 1, shape=(self.nRs), )
-            self.RegionR = pm.Deterministic('RegionR', R_prior_mean + self.RegionLogR_noise * self.HyperRVar)
+            growth_reduction = self.build_log_r_reduction(self.AllCMAlpha)
+            self.build_expected_log_r(growth_reduction)
 
-            self.ActiveCMs = pm.Data('ActiveCMs', self.d.ActiveCMs)
+            # convert R into growth rates
+            self.build_generation_interval(gi_mean_mean, gi_mean_sd, gi_sd_mean, gi_sd_sd)
+            self.ExpectedGrowth = self.growth_from_log_r(self.ExpectedLogR)
 
-            active_cm_reduction = T.reshape(self.AllCMAlpha, (self.nRs, self.nCMs, 1)) * self.ActiveCMs
-            growth_reduction = T.sum(active_cm_reduction, axis=1)
+            self.GrowthCasesNoise = self.build_growth_noise('GrowthCasesNoise', growth_noise_scale)
+            self.GrowthDeathsNoise = self.build_growth_noise('GrowthDeathsNoise', growth_noise_scale)
 
-            self.ExpectedLogR = pm.Deterministic(
-                'ExpectedLogR',
-                T.reshape(pm.math.log(self.RegionR), (self.nRs, 1)) - growth_reduction,
-            )
+            self.GrowthCases = self.add_growth_noise(self.ExpectedGrowth, self.GrowthCasesNoise)
+            self.GrowthDeaths = self.add_growth_noise(self.ExpectedGrowth, self.GrowthDeathsNoise)
 
-            # convert R into growth rates
-            self.GI_mean = pm.Normal('GI_mean', gi_mean_mean, gi_mean_sd)
-            self.GI_sd = pm.Normal('GI_sd', gi_sd_mean, gi_sd_sd)
+            self.PsiCases = pm.HalfNormal('PsiCases', 5.)
+            self.PsiDeaths = pm.HalfNormal('PsiDeaths', 5.)
 
-            gi_beta = self.GI_mean / self.GI_sd ** 2
-            gi_alpha = self.GI_mean ** 2 / self.GI_sd ** 2
+            self.build_infected(self.GrowthCases, 'Cases')
 
-            self.ExpectedGrowth = gi_beta * (pm.math.exp(self.ExpectedLogR / gi_alpha) - T.ones((self.nRs, self.nDs)))
+            reporting_delay = self.build_delay('Cases', cases_delay_mean_mean, cases_delay_mean_sd,
+                                               cases_delay_disp_mean, cases_delay_disp_sd, cases_truncation)
+            self.ExpectedCases = self.build_expected('ExpectedCases', self.InfectedCases, reporting_delay)
 
-            # exclude 40 days of noise, slight increase in runtime.
-            self.GrowthCasesNoise = pm.Normal("GrowthCasesNoise", 0, growth_noise_scale,
-                                              shape=(self.nRs, self.nDs - 40))
-            self.GrowthDeathsNoise = pm.Normal("GrowthDeathsNoise", 0, growth_noise_scale,
-                                               shape=(self.nRs, self.nDs - 40))
+            self.ObservedCases = self.build_observation('ObservedCases', 'ExpectedCases', self.ExpectedCases,
+                                                        self.PsiCases, self.all_observed_active, self.d.NewCases)
 
-            self.GrowthCases = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10], self.GrowthCasesNoise)
-            self.GrowthDeaths = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10], self.GrowthDeathsNoise)
+            self.build_infected(self.GrowthDeaths, 'Deaths')
 
-            self.PsiCases = pm.HalfNormal('PsiCases', 5.)
-            self.PsiDeaths = pm.HalfNormal('PsiDeaths', 5.)
+            fatality_delay = self.build_delay('Deaths', deaths_delay_mean_mean, deaths_delay_mean_sd,
+                                              deaths_delay_disp_mean, deaths_delay_disp_sd, deaths_truncation)
+            self.ExpectedDeaths = self.build_expected('ExpectedDeaths', self.InfectedDeaths, fatality_delay)
 
-            self.InitialSizeCases_log = pm.Normal('InitialSizeCases_log', 0, 50, shape=(self.nRs,))
-            self.InfectedCases_log = pm.Deterministic('InfectedCases_log', T.reshape(self.InitialSizeCases_log, (
-                self.nRs, 1)) + self.GrowthCases.cumsum(axis=1))
-            self.InfectedCases = pm.Deterministic('InfectedCases', pm.math.exp(self.InfectedCases_log))
-
-            self.CasesDelayMean = pm.Normal('CasesDelayMean', cases_delay_mean_mean, cases_delay_mean_sd)
-            self.CasesDelayDisp = pm.Normal('CasesDelayDisp', cases_delay_disp_mean, cases_delay_disp_sd)
-            cases_delay_dist = pm.NegativeBinomial.dist(mu=self.CasesDelayMean, alpha=self.CasesDelayDisp)
-            bins = np.arange(0, cases_truncation)
-            pmf = T.exp(cases_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            reporting_delay = pmf.reshape((1, cases_truncation))
-
-            expected_cases = C.conv2d(
-                self.InfectedCases,
-                reporting_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedCases = pm.Deterministic('ExpectedCases', expected_cases.reshape(
-                (self.nRs, self.nDs)))
-
-            # effectively handle missing values ourselves
-            self.ObservedCases = pm.NegativeBinomial(
-                'ObservedCases',
-                mu=self.ExpectedCases.reshape((self.nRs * self.nDs,))[self.all_observed_active],
-                alpha=self.PsiCases,
-                shape=(len(self.all_observed_active),),
-                observed=self.d.NewCases.data.reshape((self.nRs * self.nDs,))[self.all_observed_active]
-            )
-
-            self.InitialSizeDeaths_log = pm.Normal('InitialSizeDeaths_log', 0, 50, shape=(self.nRs,))
-            self.InfectedDeaths_log = pm.Deterministic('InfectedDeaths_log', T.reshape(self.InitialSizeDeaths_log, (
-                self.nRs, 1)) + self.GrowthDeaths.cumsum(axis=1))
-            self.InfectedDeaths = pm.Deterministic('InfectedDeaths', pm.math.exp(self.InfectedDeaths_log))
-
-            self.DeathsDelayMean = pm.Normal('DeathsDelayMean', deaths_delay_mean_mean, deaths_delay_mean_sd)
-            self.DeathsDelayDisp = pm.Normal('DeathsDelayDisp', deaths_delay_disp_mean, deaths_delay_disp_sd)
-            deaths_delay_dist = pm.NegativeBinomial.dist(mu=self.DeathsDelayMean, alpha=self.DeathsDelayDisp)
-            bins = np.arange(0, deaths_truncation)
-            pmf = T.exp(deaths_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            fatality_delay = pmf.reshape((1, deaths_truncation))
-
-            expected_deaths = C.conv2d(
-                self.InfectedDeaths,
-                fatality_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedDeaths = pm.Deterministic('ExpectedDeaths', expected_deaths.reshape(
-                (self.nRs, self.nDs)))
-
-            # effectively handle missing values ourselves
-            self.ObservedDeaths = pm.NegativeBinomial(
-                'ObservedDeaths',
-                mu=self.ExpectedDeaths.reshape((self.nRs * self.nDs,))[self.all_observed_deaths],
-                alpha=self.PsiDeaths,
-                shape=(len(self.all_observed_deaths),),
-                observed=self.d.NewDeaths.data.reshape((self.nRs * self.nDs,))[self.all_observed_deaths]
-            )
+            self.ObservedDeaths = self.build_observation('ObservedDeaths', 'ExpectedDeaths', self.ExpectedDeaths,
+                                                         self.PsiDeaths, self.all_observed_deaths, self.d.NewDeaths)
 
 
 class DiscreteRenewalFixedGIModel(BaseCMModel):
@@ -865,7 +512,8 @@ class DiscreteRenewalFixedGIModel(BaseCMModel):
     def build_model(self, R_prior_mean=3.28, cm_prior_scale=10, cm_prior='skewed', R_noise_scale=0.8,
                     deaths_delay_mean_mean=21, deaths_delay_mean_sd=1, deaths_delay_disp_mean=9, deaths_delay_disp_sd=1,
                     cases_delay_mean_mean=10, cases_delay_mean_sd=1, cases_delay_disp_mean=5, cases_delay_disp_sd=1,
-                    deaths_truncation=48, cases_truncation=32, gi_truncation=28, conv_padding=7, **kwargs):
+                    deaths_truncation=48, cases_truncation=32, gi_truncation=28, conv_padding=7, record='full',
+                    **kwargs):
         """
         Build NPI effectiveness model
 
@@ -885,7 +533,10 @@ class DiscreteRenewalFixedGIModel(BaseCMModel):
         :param cases_truncation: maximum reporting delay
         :param gi_truncation: truncation used for generation interval discretisation
         :param conv_padding: padding for renewal process
+        :param record: which deterministics to record in the trace: 'full', 'summary' or a list of names. See
+                       BaseCMModel.set_record_policy
         """
+        self.set_record_policy(record)
 
         for key, _ in kwargs.items():
             print(f'Argument: {key} not being used')
@@ -893,28 +544,15 @@ class DiscreteRenewalFixedGIModel(BaseCMModel):
         ep = EpidemiologicalParameters()
         gi_s = ep.generate_dist_samples(ep.generation_interval, nRVs=int(1e8), with_noise=False)
         GI = ep.discretise_samples(gi_s, gi_truncation).flatten()
-        GI_rev = GI[::-1].reshape((1, 1, GI.size)).repeat(2, axis=0)
 
         with self.model:
             # build NPI Effectiveness priors
             self.build_npi_prior(cm_prior, cm_prior_scale)
-            self.CMReduction = pm.Deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
+            self.CMReduction = self.build_deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
 
-            self.HyperRVar = pm.HalfNormal(
-                'HyperRVar', sigma=0.5
-            )
-
-            self.RegionR_noise = pm.Normal('RegionLogR_noise', 0, 1, shape=(self.nRs), )
-            self.RegionR = pm.Deterministic('RegionR', R_prior_mean + self.RegionLogR_noise * self.HyperRVar)
+            self.build_region_r(R_prior_mean, noise_name='RegionLogR_noise')
 
-            self.ActiveCMs = pm.Data('ActiveCMs', self.d.ActiveCMs)
-
-            self.ActiveCMReduction = (
-                    T.reshape(self.CM_Alpha, (1, self.nCMs, 1))
-                    * self.ActiveCMs
-            )
-
-            self.RReduction = T.sum(self.ActiveCMReduction, axis=1)
+            self.RReduction = self.build_log_r_reduction(self.CM_Alpha)
 
             self.ExpectedLogR = T.reshape(T.reshape(pm.math.log(self.RegionR), (self.nRs, 1)) - self.RReduction,
                                           (1, self.nRs, self.nDs)).repeat(2, axis=0)
@@ -923,90 +561,42 @@ class DiscreteRenewalFixedGIModel(BaseCMModel):
 
             self.InitialSize_log = pm.Normal('InitialSizeCases_log', 0, 50, shape=(2, self.nRs))
 
-            infected = T.zeros((2, self.nRs, self.nDs + gi_truncation))
-            infected = T.set_subtensor(infected[:, :, (gi_truncation - conv_padding):gi_truncation],
-                                       pm.math.exp(self.InitialSize_log.reshape((2, self.nRs, 1)).repeat(
-                                           conv_padding, axis=2)))
+            initial = T.zeros((2, self.nRs, gi_truncation))
+            initial = T.set_subtensor(initial[:, :, (gi_truncation - conv_padding):],
+                                      pm.math.exp(self.InitialSize_log.reshape((2, self.nRs, 1)).repeat(
+                                          conv_padding, axis=2)))
 
             # R is a lognorm
             R = pm.math.exp(self.LogR)
-            for d in range(self.nDs):
-                val = pm.math.sum(
-                    R[:, :, d].reshape((2, self.nRs, 1)) * infected[:, :, d:(d + gi_truncation)] * GI_rev,
-                    axis=2)
-                infected = T.set_subtensor(infected[:, :, d + gi_truncation], val)
-
-            res = infected
+            res = DiscreteRenewal(GI)(R, initial)
 
-            self.InfectedCases = pm.Deterministic(
+            self.InfectedCases = self.build_deterministic(
                 'InfectedCases',
                 res[0, :, gi_truncation:].reshape((self.nRs, self.nDs))
             )
 
-            self.InfectedDeaths = pm.Deterministic(
+            self.InfectedDeaths = self.build_deterministic(
                 'InfectedDeaths',
                 res[1, :, gi_truncation:].reshape((self.nRs, self.nDs))
             )
 
-            self.CasesDelayMean = pm.Normal('CasesDelayMean', cases_delay_mean_mean, cases_delay_mean_sd)
-            self.CasesDelayDisp = pm.Normal('CasesDelayDisp', cases_delay_disp_mean, cases_delay_disp_sd)
-            cases_delay_dist = pm.NegativeBinomial.dist(mu=self.CasesDelayMean, alpha=self.CasesDelayDisp)
-            bins = np.arange(0, cases_truncation)
-            pmf = T.exp(cases_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            reporting_delay = pmf.reshape((1, cases_truncation))
-
-            self.DeathsDelayMean = pm.Normal('DeathsDelayMean', deaths_delay_mean_mean, deaths_delay_mean_sd)
-            self.DeathsDelayDisp = pm.Normal('DeathsDelayDisp', deaths_delay_disp_mean, deaths_delay_disp_sd)
-            deaths_delay_dist = pm.NegativeBinomial.dist(mu=self.DeathsDelayMean, alpha=self.DeathsDelayDisp)
-            bins = np.arange(0, deaths_truncation)
-            pmf = T.exp(deaths_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            fatality_delay = pmf.reshape((1, deaths_truncation))
+            reporting_delay = self.build_delay('Cases', cases_delay_mean_mean, cases_delay_mean_sd,
+                                               cases_delay_disp_mean, cases_delay_disp_sd, cases_truncation)
+            fatality_delay = self.build_delay('Deaths', deaths_delay_mean_mean, deaths_delay_mean_sd,
+                                              deaths_delay_disp_mean, deaths_delay_disp_sd, deaths_truncation)
 
             self.PsiCases = pm.HalfNormal('PsiCases', 5.)
             self.PsiDeaths = pm.HalfNormal('PsiDeaths', 5.)
 
-            expected_cases = C.conv2d(
-                self.InfectedCases,
-                reporting_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            expected_deaths = C.conv2d(
-                self.InfectedDeaths,
-                fatality_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedCases = pm.Deterministic('ExpectedCases', expected_cases.reshape(
-                (self.nRs, self.nDs)))
-
-            self.ExpectedDeaths = pm.Deterministic('ExpectedDeaths', expected_deaths.reshape(
-                (self.nRs, self.nDs)))
-
-            self.NewCases = pm.Data('NewCases',
-                                    self.d.NewCases.data.reshape((self.nRs * self.nDs,))[
-                                        self.all_observed_active])
-            self.NewDeaths = pm.Data('NewDeaths',
-                                     self.d.NewDeaths.data.reshape((self.nRs * self.nDs,))[
-                                         self.all_observed_deaths])
-
-            self.ObservedCases = pm.NegativeBinomial(
-                'ObservedCases',
-                mu=self.ExpectedCases.reshape((self.nRs * self.nDs,))[self.all_observed_active],
-                alpha=self.PsiCases,
-                shape=(len(self.all_observed_active),),
-                observed=self.NewCases
-            )
+            self.ExpectedCases = self.build_expected('ExpectedCases', self.InfectedCases, reporting_delay)
+            self.ExpectedDeaths = self.build_expected('ExpectedDeaths', self.InfectedDeaths, fatality_delay)
 
-            self.ObservedDeaths = pm.NegativeBinomial(
-                'ObservedDeaths',
-                mu=self.ExpectedDeaths.reshape((self.nRs * self.nDs,))[self.all_observed_deaths],
-                alpha=self.PsiDeaths,
-                shape=(len(self.all_observed_deaths),),
-                observed=self.NewDeaths
-            )
+            self.ObservedCases = self.build_observation('ObservedCases', 'ExpectedCases', self.ExpectedCases,
+                                                        self.PsiCases, self.all_observed_active, self.d.NewCases,
+                                                        data_name='NewCases')
+            self.ObservedDeaths = self.build_observation('ObservedDeaths', 'ExpectedDeaths', self.ExpectedDeaths,
+                                                         self.PsiDeaths, self.all_observed_deaths, self.d.NewDeaths,
+                                                         data_name='NewDeaths')
 
 
 class ComplexDifferentEffectsModel(BaseCMModel):
@@ -1029,7 +619,8 @@ class ComplexDifferentEffectsModel(BaseCMModel):
                     deaths_delay_mean_sd=1, deaths_delay_disp_mean=9,
                     deaths_delay_disp_sd=1, cases_delay_mean_mean=10, cases_delay_mean_sd=1, cases_delay_disp_mean=5,
                     cases_delay_disp_sd=1, deaths_truncation=48, cases_truncation=32, growth_noise_scale='prior',
-                    **kwargs):
+                    growth_noise_basis='full', growth_noise_knot_spacing=7, growth_noise_degree=3,
+                    hyperparameters_as_data=False, record='full', **kwargs):
         """
         Build NPI effectiveness model
         :param R_prior_mean: R_0 prior mean
@@ -1051,133 +642,72 @@ class ComplexDifferentEffectsModel(BaseCMModel):
         :param cases_delay_disp_sd: sd of normal prior placed over cases delay dispersion
         :param deaths_truncation: maximum death delay
         :param cases_truncation: maximum reporting delay
+        :param hyperparameters_as_data: if True, R_prior_mean is held in a pm.Data container and can be changed with
+                                        set_hyperparameters after building.
+        :param growth_noise_basis: growth noise basis, 'full' (independent noise on each day), 'spline' or
+                                   'random_walk'. See get_growth_noise_basis
+        :param growth_noise_knot_spacing: days between knots of the growth noise basis
+        :param growth_noise_degree: spline degree of the 'spline' growth noise basis
+        :param record: which deterministics to record in the trace: 'full', 'summary' or a list of names. See
+                       BaseCMModel.set_record_policy
         """
+        self.set_record_policy(record)
         with self.model:
             self.build_npi_prior(cm_prior, cm_prior_scale)
 
-            self.CMReduction = pm.Deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
-
-            if alpha_noise_scale_prior == 'half-normal':
-                self.CMAlphaScales = pm.HalfNormal('CMAlphaScales', sigma=alpha_noise_scale, shape=(self.nCMs))
-            elif alpha_noise_scale_prior == 'half-t':
-                self.CMAlphaScales = pm.HalfStudentT('CMAlphaScales', nu=3, sigma=alpha_noise_scale, shape=(self.nCMs))
-
-            self.AllCMAlphaNoise = pm.Normal('AllCMAlphaNoise', 0, 1, shape=(self.nRs, self.nCMs))
-            self.AllCMAlpha = pm.Deterministic('AllCMAlpha',
-                                               T.reshape(self.CM_Alpha, (1, self.nCMs)).repeat(self.nRs,
-                                                                                               axis=0) +
-                                               self.CMAlphaScales.reshape((1, self.nCMs)) * self.AllCMAlphaNoise)
-
-            self.HyperRVar = pm.HalfNormal(
-                'HyperRVar', sigma=0.5
-            )
-
-            self.RegionR_noise = pm.Normal('RegionR_noise', 0, 1, shape=(self.nRs), )
-            self.RegionR = pm.Deterministic('RegionR', R_prior_mean + self.RegionR_noise * self.HyperRVar)
+            self.CMReduction = self.build_deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
 
-            self.ActiveCMs = pm.Data('ActiveCMs', self.d.ActiveCMs)
+            self.build_region_cm_alpha(alpha_noise_scale_prior, alpha_noise_scale)
 
-            active_cm_reduction = T.reshape(self.AllCMAlpha, (self.nRs, self.nCMs, 1)) * self.ActiveCMs
-            growth_reduction = T.sum(active_cm_reduction, axis=1)
+            self.build_region_r(R_prior_mean, hyperparameters_as_data=hyperparameters_as_data)
 
-            self.ExpectedLogR = pm.Deterministic(
-                'ExpectedLogR',
-                T.reshape(pm.math.log(self.RegionR), (self.nRs, 1)) - growth_reduction,
-            )
+            growth_reduction = self.build_log_r_reduction(self.AllCMAlpha)
+            self.build_expected_log_r(growth_reduction)
 
             # convert R into growth rates
-            self.GI_mean = pm.Normal('GI_mean', gi_mean_mean, gi_mean_sd)
-            self.GI_sd = pm.Normal('GI_sd', gi_sd_mean, gi_sd_sd)
-
-            gi_beta = self.GI_mean / self.GI_sd ** 2
-            gi_alpha = self.GI_mean ** 2 / self.GI_sd ** 2
-
-            self.ExpectedGrowth = gi_beta * (pm.math.exp(self.ExpectedLogR / gi_alpha) - T.ones((self.nRs, self.nDs)))
+            self.build_generation_interval(gi_mean_mean, gi_mean_sd, gi_sd_mean, gi_sd_sd)
+            self.ExpectedGrowth = self.growth_from_log_r(self.ExpectedLogR)
 
             if growth_noise_scale == 'prior':
                 self.GrowthNoiseScale = pm.HalfStudentT('GrowthNoiseScale', nu=3, sigma=0.15)
             elif growth_noise_scale == 'fixed':
                 self.GrowthNoiseScale = 0.205
-                self.GrowthNoiseScale
             elif growth_noise_scale == 'indep':
                 self.GrowthNoiseScaleCases = pm.HalfStudentT('GrowthNoiseCases', nu=3, sigma=0.15)
                 self.GrowthNoiseScaleDeaths = pm.HalfStudentT('GrowthNoiseDeaths', nu=3, sigma=0.15)
 
             # exclude 40 days of noise, slight increase in runtime.
-            self.GrowthCasesNoise = pm.Normal("GrowthCasesNoise", 0, 1,
-                                              shape=(self.nRs, self.nDs - 40))
-            self.GrowthDeathsNoise = pm.Normal("GrowthDeathsNoise", 0, 1,
-                                               shape=(self.nRs, self.nDs - 40))
+            self.GrowthCasesNoise = self.build_growth_noise(
+                'GrowthCasesNoise', basis=growth_noise_basis, knot_spacing=growth_noise_knot_spacing,
+                degree=growth_noise_degree)
+            self.GrowthDeathsNoise = self.build_growth_noise(
+                'GrowthDeathsNoise', basis=growth_noise_basis, knot_spacing=growth_noise_knot_spacing,
+                degree=growth_noise_degree)
 
-            self.GrowthCases = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10],
-                                               self.GrowthNoiseScale * self.GrowthCasesNoise)
-            self.GrowthDeaths = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10],
-                                                self.GrowthNoiseScale * self.GrowthDeathsNoise)
+            self.GrowthCases = self.add_growth_noise(self.ExpectedGrowth, self.GrowthNoiseScale * self.GrowthCasesNoise)
+            self.GrowthDeaths = self.add_growth_noise(self.ExpectedGrowth,
+                                                      self.GrowthNoiseScale * self.GrowthDeathsNoise)
 
             self.PsiCases = pm.HalfNormal('PsiCases', 5.)
             self.PsiDeaths = pm.HalfNormal('PsiDeaths', 5.)
 
-            self.InitialSizeCases_log = pm.Normal('InitialSizeCases_log', 0, 50, shape=(self.nRs,))
-            self.InfectedCases_log = pm.Deterministic('InfectedCases_log', T.reshape(self.InitialSizeCases_log, (
-                self.nRs, 1)) + self.GrowthCases.cumsum(axis=1))
-            self.InfectedCases = pm.Deterministic('InfectedCases', pm.math.exp(self.InfectedCases_log))
-
-            self.CasesDelayMean = pm.Normal('CasesDelayMean', cases_delay_mean_mean, cases_delay_mean_sd)
-            self.CasesDelayDisp = pm.Normal('CasesDelayDisp', cases_delay_disp_mean, cases_delay_disp_sd)
-            cases_delay_dist = pm.NegativeBinomial.dist(mu=self.CasesDelayMean, alpha=self.CasesDelayDisp)
-            bins = np.arange(0, cases_truncation)
-            pmf = T.exp(cases_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            reporting_delay = pmf.reshape((1, cases_truncation))
-
-            expected_cases = C.conv2d(
-                self.InfectedCases,
-                reporting_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedCases = pm.Deterministic('ExpectedCases', expected_cases.reshape(
-                (self.nRs, self.nDs)))
-
-            # effectively handle missing values ourselves
-            self.ObservedCases = pm.NegativeBinomial(
-                'ObservedCases',
-                mu=self.ExpectedCases.reshape((self.nRs * self.nDs,))[self.all_observed_active],
-                alpha=self.PsiCases,
-                shape=(len(self.all_observed_active),),
-                observed=self.d.NewCases.data.reshape((self.nRs * self.nDs,))[self.all_observed_active]
-            )
+            self.build_infected(self.GrowthCases, 'Cases')
 
-            self.InitialSizeDeaths_log = pm.Normal('InitialSizeDeaths_log', 0, 50, shape=(self.nRs,))
-            self.InfectedDeaths_log = pm.Deterministic('InfectedDeaths_log', T.reshape(self.InitialSizeDeaths_log, (
-                self.nRs, 1)) + self.GrowthDeaths.cumsum(axis=1))
-            self.InfectedDeaths = pm.Deterministic('InfectedDeaths', pm.math.exp(self.InfectedDeaths_log))
-
-            self.DeathsDelayMean = pm.Normal('DeathsDelayMean', deaths_delay_mean_mean, deaths_delay_mean_sd)
-            self.DeathsDelayDisp = pm.Normal('DeathsDelayDisp', deaths_delay_disp_mean, deaths_delay_disp_sd)
-            deaths_delay_dist = pm.NegativeBinomial.dist(mu=self.DeathsDelayMean, alpha=self.DeathsDelayDisp)
-            bins = np.arange(0, deaths_truncation)
-            pmf = T.exp(deaths_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            fatality_delay = pmf.reshape((1, deaths_truncation))
-
-            expected_deaths = C.conv2d(
-                self.InfectedDeaths,
-                fatality_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedDeaths = pm.Deterministic('ExpectedDeaths', expected_deaths.reshape(
-                (self.nRs, self.nDs)))
-
-            # effectively handle missing values ourselves
-            self.ObservedDeaths = pm.NegativeBinomial(
-                'ObservedDeaths',
-                mu=self.ExpectedDeaths.reshape((self.nRs * self.nDs,))[self.all_observed_deaths],
-                alpha=self.PsiDeaths,
-                shape=(len(self.all_observed_deaths),),
-                observed=self.d.NewDeaths.data.reshape((self.nRs * self.nDs,))[self.all_observed_deaths]
-            )
+            reporting_delay = self.build_delay('Cases', cases_delay_mean_mean, cases_delay_mean_sd,
+                                               cases_delay_disp_mean, cases_delay_disp_sd, cases_truncation)
+            self.ExpectedCases = self.build_expected('ExpectedCases', self.InfectedCases, reporting_delay)
+
+            self.ObservedCases = self.build_observation('ObservedCases', 'ExpectedCases', self.ExpectedCases,
+                                                        self.PsiCases, self.all_observed_active, self.d.NewCases)
+
+            self.build_infected(self.GrowthDeaths, 'Deaths')
+
+            fatality_delay = self.build_delay('Deaths', deaths_delay_mean_mean, deaths_delay_mean_sd,
+                                              deaths_delay_disp_mean, deaths_delay_disp_sd, deaths_truncation)
+            self.ExpectedDeaths = self.build_expected('ExpectedDeaths', self.InfectedDeaths, fatality_delay)
+
+            self.ObservedDeaths = self.build_observation('ObservedDeaths', 'ExpectedDeaths', self.ExpectedDeaths,
+                                                         self.PsiDeaths, self.all_observed_deaths, self.d.NewDeaths)
 
 
 class ComplexDifferentEffectsWithSeasonalityModel(BaseCMModel):
@@ -1195,9 +725,12 @@ class ComplexDifferentEffectsWithSeasonalityModel(BaseCMModel):
                     deaths_delay_mean_sd=1, deaths_delay_disp_mean=9,
                     deaths_delay_disp_sd=1, cases_delay_mean_mean=10, cases_delay_mean_sd=1, cases_delay_disp_mean=5,
                     cases_delay_disp_sd=1, deaths_truncation=48, cases_truncation=32, growth_noise_scale='prior',
+                    growth_noise_basis='full', growth_noise_knot_spacing=7, growth_noise_degree=3,
                     max_R_day_prior={'type': 'fixed', 'value': 1.0},
                     different_seasonality=False,
                     local_seasonality_sd=0.1,
+                    hyperparameters_as_data=False,
+                    record='full',
                     **kwargs):
         """
         Build NPI effectiveness model
@@ -1221,159 +754,114 @@ class ComplexDifferentEffectsWithSeasonalityModel(BaseCMModel):
         :param deaths_truncation: maximum death delay
         :param cases_truncation: maximum reporting delay
         :param max_R_day_prior: prior dict for day of maximum R from seasonality
+        :param hyperparameters_as_data: | if True, the following are held in pm.Data containers and can be changed with
+                                        | set_hyperparameters after building, without changing the model structure:
+                                        |   - R_prior_mean
+                                        |   - max_R_day (fixed max_R_day_prior) or max_R_day_mean and max_R_day_scale
+                                        |     (normal max_R_day_prior)
+                                        |   - local_seasonality_sd (if different_seasonality)
+        :param growth_noise_basis: growth noise basis, 'full' (independent noise on each day), 'spline' or
+                                   'random_walk'. See get_growth_noise_basis
+        :param growth_noise_knot_spacing: days between knots of the growth noise basis
+        :param growth_noise_degree: spline degree of the 'spline' growth noise basis
+        :param record: which deterministics to record in the trace: 'full', 'summary' or a list of names. See
+                       BaseCMModel.set_record_policy
         """
+        self.set_record_policy(record)
         with self.model:
             self.build_npi_prior(cm_prior, cm_prior_scale)
 
             if max_R_day_prior['type'] == 'fixed':
-                self.seasonality_max_R_day = pm.Deterministic("seasonality_max_R_day", T.constant(max_R_day_prior["value"], dtype=np.float32))
+                if hyperparameters_as_data:
+                    max_R_day = self.build_hyperparameter('max_R_day', max_R_day_prior["value"], True)
+                    self.seasonality_max_R_day = self.build_deterministic("seasonality_max_R_day", T.cast(max_R_day, 'float32'))
+                else:
+                    self.seasonality_max_R_day = self.build_deterministic("seasonality_max_R_day", T.constant(max_R_day_prior["value"], dtype=np.float32))
             elif max_R_day_prior['type'] == 'normal':
-                self.seasonality_max_R_day = pm.Normal("seasonality_max_R_day", max_R_day_prior["mean"], max_R_day_prior["scale"])
+                max_R_day_mean = self.build_hyperparameter('max_R_day_mean', max_R_day_prior["mean"],
+                                                           hyperparameters_as_data)
+                max_R_day_scale = self.build_hyperparameter('max_R_day_scale', max_R_day_prior["scale"],
+                                                            hyperparameters_as_data)
+                self.seasonality_max_R_day = pm.Normal("seasonality_max_R_day", max_R_day_mean, max_R_day_scale)
             else:
                 raise Exception(f"Invalid max_R_day_prior")
 
             self.seasonality_beta1 = pm.Uniform("seasonality_beta1", -0.95, 0.95)
             seasonality_beta1_bc = self.seasonality_beta1 * T.ones(self.nRs)
             if different_seasonality:
+                local_seasonality_sd = self.build_hyperparameter('local_seasonality_sd', local_seasonality_sd,
+                                                                 hyperparameters_as_data)
                 self.seasonality_local_beta1 = pm.Normal("seasonality_local_beta1",
                     seasonality_beta1_bc, sigma=local_seasonality_sd, shape=(self.nRs, ))
             else:
-                self.seasonality_local_beta1 = pm.Deterministic("seasonality_local_beta1", 
+                self.seasonality_local_beta1 = self.build_deterministic("seasonality_local_beta1", 
                     seasonality_beta1_bc)
-            self.SeasonalitySinusoid = pm.Deterministic("SeasonalitySinusoid", pm.math.cos((self.d.Ds_day_of_year - self.seasonality_max_R_day) / 365.0 * 2.0 * 3.14159))
-            self.SeasonalityMultEffect = pm.Deterministic("SeasonalityMultEffect",
+            self.SeasonalitySinusoid = self.build_deterministic("SeasonalitySinusoid", pm.math.cos((self.d.Ds_day_of_year - self.seasonality_max_R_day) / 365.0 * 2.0 * 3.14159))
+            self.SeasonalityMultEffect = self.build_deterministic("SeasonalityMultEffect",
                 T.maximum(1.0 +
                     T.reshape(self.seasonality_local_beta1, (self.nRs, 1)) *
                     T.reshape(self.SeasonalitySinusoid, (1, self.nDs)), 0.01))
 
-            self.CMReduction = pm.Deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
-
-            if alpha_noise_scale_prior == 'half-normal':
-                self.CMAlphaScales = pm.HalfNormal('CMAlphaScales', sigma=alpha_noise_scale, shape=(self.nCMs))
-            elif alpha_noise_scale_prior == 'half-t':
-                self.CMAlphaScales = pm.HalfStudentT('CMAlphaScales', nu=3, sigma=alpha_noise_scale, shape=(self.nCMs))
-
-            self.AllCMAlphaNoise = pm.Normal('AllCMAlphaNoise', 0, 1, shape=(self.nRs, self.nCMs))
-            self.AllCMAlpha = pm.Deterministic('AllCMAlpha',
-                                               T.reshape(self.CM_Alpha, (1, self.nCMs)).repeat(self.nRs,
-                                                                                               axis=0) +
-                                               self.CMAlphaScales.reshape((1, self.nCMs)) * self.AllCMAlphaNoise)
+            self.CMReduction = self.build_deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
 
-            self.HyperRVar = pm.HalfNormal(
-                'HyperRVar', sigma=0.5
-            )
-
-            self.RegionR_noise = pm.Normal('RegionR_noise', 0, 1, shape=(self.nRs), )
-            self.RegionR = pm.Deterministic('RegionR', R_prior_mean + self.RegionR_noise * self.HyperRVar)
-            self.MeanRegionR = pm.Deterministic('MeanRegionR', self.RegionR.mean())
+            self.build_region_cm_alpha(alpha_noise_scale_prior, alpha_noise_scale)
 
-            self.ActiveCMs = pm.Data('ActiveCMs', self.d.ActiveCMs)
+            self.build_region_r(R_prior_mean, hyperparameters_as_data=hyperparameters_as_data)
+            self.MeanRegionR = self.build_deterministic('MeanRegionR', self.RegionR.mean())
 
-            active_cm_reduction = T.reshape(self.AllCMAlpha, (self.nRs, self.nCMs, 1)) * self.ActiveCMs
-            growth_reduction = T.sum(active_cm_reduction, axis=1)
+            growth_reduction = self.build_log_r_reduction(self.AllCMAlpha)
 
             # Divide RegionR by self.SeasonalityMultEffect[0, 0] to get mean-seasonality R
-            self.ExpectedLogR = pm.Deterministic(
+            self.ExpectedLogR = self.build_deterministic(
                 'ExpectedLogR',
                 T.reshape(pm.math.log(self.RegionR), (self.nRs, 1)) - growth_reduction
                     + pm.math.log(self.SeasonalityMultEffect) - pm.math.log(self.SeasonalityMultEffect[0, 0]),
             )
 
             # convert R into growth rates
-            self.GI_mean = pm.Normal('GI_mean', gi_mean_mean, gi_mean_sd)
-            self.GI_sd = pm.Normal('GI_sd', gi_sd_mean, gi_sd_sd)
-
-            gi_beta = self.GI_mean / self.GI_sd ** 2
-            gi_alpha = self.GI_mean ** 2 / self.GI_sd ** 2
-
-            self.ExpectedGrowth = gi_beta * (pm.math.exp(self.ExpectedLogR / gi_alpha) - T.ones((self.nRs, self.nDs)))
+            self.build_generation_interval(gi_mean_mean, gi_mean_sd, gi_sd_mean, gi_sd_sd)
+            self.ExpectedGrowth = self.growth_from_log_r(self.ExpectedLogR)
 
             if growth_noise_scale == 'prior':
                 self.GrowthNoiseScale = pm.HalfStudentT('GrowthNoiseScale', nu=3, sigma=0.15)
             elif growth_noise_scale == 'fixed':
                 self.GrowthNoiseScale = 0.205
-                self.GrowthNoiseScale
             elif growth_noise_scale == 'indep':
                 self.GrowthNoiseScaleCases = pm.HalfStudentT('GrowthNoiseCases', nu=3, sigma=0.15)
                 self.GrowthNoiseScaleDeaths = pm.HalfStudentT('GrowthNoiseDeaths', nu=3, sigma=0.15)
 
             # exclude 40 days of noise, slight increase in runtime.
-            self.GrowthCasesNoise = pm.Normal("GrowthCasesNoise", 0, 1,
-                                              shape=(self.nRs, self.nDs - 40))
-            self.GrowthDeathsNoise = pm.Normal("GrowthDeathsNoise", 0, 1,
-                                               shape=(self.nRs, self.nDs - 40))
+            self.GrowthCasesNoise = self.build_growth_noise(
+                'GrowthCasesNoise', basis=growth_noise_basis, knot_spacing=growth_noise_knot_spacing,
+                degree=growth_noise_degree)
+            self.GrowthDeathsNoise = self.build_growth_noise(
+                'GrowthDeathsNoise', basis=growth_noise_basis, knot_spacing=growth_noise_knot_spacing,
+                degree=growth_noise_degree)
 
-            self.GrowthCases = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10],
-                                               self.GrowthNoiseScale * self.GrowthCasesNoise)
-            self.GrowthDeaths = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10],
-                                                self.GrowthNoiseScale * self.GrowthDeathsNoise)
+            self.GrowthCases = self.add_growth_noise(self.ExpectedGrowth, self.GrowthNoiseScale * self.GrowthCasesNoise)
+            self.GrowthDeaths = self.add_growth_noise(self.ExpectedGrowth,
+                                                      self.GrowthNoiseScale * self.GrowthDeathsNoise)
 
             self.PsiCases = pm.HalfNormal('PsiCases', 5.)
             self.PsiDeaths = pm.HalfNormal('PsiDeaths', 5.)
 
-            self.InitialSizeCases_log = pm.Normal('InitialSizeCases_log', 0, 50, shape=(self.nRs,))
-            self.InfectedCases_log = pm.Deterministic('InfectedCases_log', T.reshape(self.InitialSizeCases_log, (
-                self.nRs, 1)) + self.GrowthCases.cumsum(axis=1))
-            self.InfectedCases = pm.Deterministic('InfectedCases', pm.math.exp(self.InfectedCases_log))
-
-            self.CasesDelayMean = pm.Normal('CasesDelayMean', cases_delay_mean_mean, cases_delay_mean_sd)
-            self.CasesDelayDisp = pm.Normal('CasesDelayDisp', cases_delay_disp_mean, cases_delay_disp_sd)
-            cases_delay_dist = pm.NegativeBinomial.dist(mu=self.CasesDelayMean, alpha=self.CasesDelayDisp)
-            bins = np.arange(0, cases_truncation)
-            pmf = T.exp(cases_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            reporting_delay = pmf.reshape((1, cases_truncation))
-
-            expected_cases = C.conv2d(
-                self.InfectedCases,
-                reporting_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedCases = pm.Deterministic('ExpectedCases', expected_cases.reshape(
-                (self.nRs, self.nDs)))
-
-            # effectively handle missing values ourselves
-            self.ObservedCases = pm.NegativeBinomial(
-                'ObservedCases',
-                mu=self.ExpectedCases.reshape((self.nRs * self.nDs,))[self.all_observed_active],
-                alpha=self.PsiCases,
-                shape=(len(self.all_observed_active),),
-                observed=self.d.NewCases.data.reshape((self.nRs * self.nDs,))[self.all_observed_active]
-            )
+            self.build_infected(self.GrowthCases, 'Cases')
 
-            self.InitialSizeDeaths_log = pm.Normal('InitialSizeDeaths_log', 0, 50, shape=(self.nRs,))
-            self.InfectedDeaths_log = pm.Deterministic('InfectedDeaths_log', T.reshape(self.InitialSizeDeaths_log, (
-                self.nRs, 1)) + self.GrowthDeaths.cumsum(axis=1))
-            self.InfectedDeaths = pm.Deterministic('InfectedDeaths', pm.math.exp(self.InfectedDeaths_log))
-
-            self.DeathsDelayMean = pm.Normal('DeathsDelayMean', deaths_delay_mean_mean, deaths_delay_mean_sd)
-            self.DeathsDelayDisp = pm.Normal('DeathsDelayDisp', deaths_delay_disp_mean, deaths_delay_disp_sd)
-            deaths_delay_dist = pm.NegativeBinomial.dist(mu=self.DeathsDelayMean, alpha=self.DeathsDelayDisp)
-            bins = np.arange(0, deaths_truncation)
-            pmf = T.exp(deaths_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            fatality_delay = pmf.reshape((1, deaths_truncation))
-
-            expected_deaths = C.conv2d(
-                self.InfectedDeaths,
-                fatality_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedDeaths = pm.Deterministic('ExpectedDeaths', expected_deaths.reshape(
-                (self.nRs, self.nDs)))
-
-            # effectively handle missing values ourselves
-            self.ObservedDeaths = pm.NegativeBinomial(
-                'ObservedDeaths',
-                mu=self.ExpectedDeaths.reshape((self.nRs * self.nDs,))[self.all_observed_deaths],
-                alpha=self.PsiDeaths,
-                shape=(len(self.all_observed_deaths),),
-                observed=self.d.NewDeaths.data.reshape((self.nRs * self.nDs,))[self.all_observed_deaths]
-            )
+            reporting_delay = self.build_delay('Cases', cases_delay_mean_mean, cases_delay_mean_sd,
+                                               cases_delay_disp_mean, cases_delay_disp_sd, cases_truncation)
+            self.ExpectedCases = self.build_expected('ExpectedCases', self.InfectedCases, reporting_delay)
+
+            self.ObservedCases = self.build_observation('ObservedCases', 'ExpectedCases', self.ExpectedCases,
+                                                        self.PsiCases, self.all_observed_active, self.d.NewCases)
 
+            self.build_infected(self.GrowthDeaths, 'Deaths')
 
+            fatality_delay = self.build_delay('Deaths', deaths_delay_mean_mean, deaths_delay_mean_sd,
+                                              deaths_delay_disp_mean, deaths_delay_disp_sd, deaths_truncation)
+            self.ExpectedDeaths = self.build_expected('ExpectedDeaths', self.InfectedDeaths, fatality_delay)
+
+            self.ObservedDeaths = self.build_observation('ObservedDeaths', 'ExpectedDeaths', self.ExpectedDeaths,
+                                                         self.PsiDeaths, self.all_observed_deaths, self.d.NewDeaths)
 
 
 class CasesOnlyComplexDifferentEffectsModel(BaseCMModel):
@@ -1390,7 +878,9 @@ class CasesOnlyComplexDifferentEffectsModel(BaseCMModel):
                     alpha_noise_scale_prior='half-t', alpha_noise_scale=0.04, deaths_delay_mean_mean=21,
                     deaths_delay_mean_sd=1, deaths_delay_disp_mean=9,
                     deaths_delay_disp_sd=1, cases_delay_mean_mean=10, cases_delay_mean_sd=1, cases_delay_disp_mean=5,
-                    cases_delay_disp_sd=1, deaths_truncation=48, cases_truncation=32, **kwargs):
+                    cases_delay_disp_sd=1, deaths_truncation=48, cases_truncation=32,
+                    growth_noise_basis='full', growth_noise_knot_spacing=7, growth_noise_degree=3, record='full',
+                    **kwargs):
         """
         Build NPI effectiveness model
         :param R_prior_mean: R_0 prior mean
@@ -1407,91 +897,51 @@ class CasesOnlyComplexDifferentEffectsModel(BaseCMModel):
         :param cases_delay_disp_mean: mean of normal prior placed over cases delay dispersion
         :param cases_delay_disp_sd: sd of normal prior placed over cases delay dispersion
         :param cases_truncation: maximum reporting delay
+        :param growth_noise_basis: growth noise basis, 'full' (independent noise on each day), 'spline' or
+                                   'random_walk'. See get_growth_noise_basis
+        :param growth_noise_knot_spacing: days between knots of the growth noise basis
+        :param growth_noise_degree: spline degree of the 'spline' growth noise basis
+        :param record: which deterministics to record in the trace: 'full', 'summary' or a list of names. See
+                       BaseCMModel.set_record_policy
         """
+        self.set_record_policy(record)
         with self.model:
             self.build_npi_prior(cm_prior, cm_prior_scale)
 
-            self.CMReduction = pm.Deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
-
-            if alpha_noise_scale_prior == 'half-normal':
-                self.CMAlphaScales = pm.HalfNormal('CMAlphaScales', sigma=alpha_noise_scale, shape=(self.nCMs))
-            elif alpha_noise_scale_prior == 'half-t':
-                self.CMAlphaScales = pm.HalfStudentT('CMAlphaScales', nu=3, sigma=alpha_noise_scale, shape=(self.nCMs))
-
-            self.AllCMAlphaNoise = pm.Normal('AllCMAlphaNoise', 0, 1, shape=(self.nRs, self.nCMs))
-            self.AllCMAlpha = pm.Deterministic('AllCMAlpha',
-                                               T.reshape(self.CM_Alpha, (1, self.nCMs)).repeat(self.nRs,
-                                                                                               axis=0) +
-                                               self.CMAlphaScales.reshape((1, self.nCMs)) * self.AllCMAlphaNoise)
-
-            self.HyperRVar = pm.HalfNormal(
-                'HyperRVar', sigma=0.5
-            )
-
-            self.RegionR_noise = pm.Normal('RegionR_noise', 0, 1, shape=(self.nRs), )
-            self.RegionR = pm.Deterministic('RegionR', R_prior_mean + self.RegionR_noise * self.HyperRVar)
+            self.CMReduction = self.build_deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
 
-            self.ActiveCMs = pm.Data('ActiveCMs', self.d.ActiveCMs)
+            self.build_region_cm_alpha(alpha_noise_scale_prior, alpha_noise_scale)
 
-            active_cm_reduction = T.reshape(self.AllCMAlpha, (self.nRs, self.nCMs, 1)) * self.ActiveCMs
-            growth_reduction = T.sum(active_cm_reduction, axis=1)
+            self.build_region_r(R_prior_mean)
 
-            self.ExpectedLogR = pm.Deterministic(
-                'ExpectedLogR',
-                T.reshape(pm.math.log(self.RegionR), (self.nRs, 1)) - growth_reduction,
-            )
+            growth_reduction = self.build_log_r_reduction(self.AllCMAlpha)
+            self.build_expected_log_r(growth_reduction)
 
             # convert R into growth rates
-            self.GI_mean = pm.Normal('GI_mean', gi_mean_mean, gi_mean_sd)
-            self.GI_sd = pm.Normal('GI_sd', gi_sd_mean, gi_sd_sd)
-
-            gi_beta = self.GI_mean / self.GI_sd ** 2
-            gi_alpha = self.GI_mean ** 2 / self.GI_sd ** 2
-
-            self.ExpectedGrowth = gi_beta * (pm.math.exp(self.ExpectedLogR / gi_alpha) - T.ones((self.nRs, self.nDs)))
+            self.build_generation_interval(gi_mean_mean, gi_mean_sd, gi_sd_mean, gi_sd_sd)
+            self.ExpectedGrowth = self.growth_from_log_r(self.ExpectedLogR)
 
             self.GrowthNoiseScale = pm.HalfStudentT('GrowthNoiseScale', nu=3, sigma=0.15)
             # self.GrowthNoiseScale = pm.HalfNormal('GrowthNoiseScale', sigma=0.15)
 
             # exclude 40 days of noise, slight increase in runtime.
-            self.GrowthCasesNoise = pm.Normal("GrowthCasesNoise", 0, 1,
-                                              shape=(self.nRs, self.nDs - 40))
+            self.GrowthCasesNoise = self.build_growth_noise(
+                'GrowthCasesNoise', basis=growth_noise_basis, knot_spacing=growth_noise_knot_spacing,
+                degree=growth_noise_degree)
 
-            self.GrowthCases = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10],
-                                               self.GrowthNoiseScale * self.GrowthCasesNoise)
+            self.GrowthCases = self.add_growth_noise(self.ExpectedGrowth,
+                                                     self.GrowthNoiseScale * self.GrowthCasesNoise)
 
             self.PsiCases = pm.HalfNormal('PsiCases', 5.)
 
-            self.InitialSizeCases_log = pm.Normal('InitialSizeCases_log', 0, 50, shape=(self.nRs,))
-            self.InfectedCases_log = pm.Deterministic('InfectedCases_log', T.reshape(self.InitialSizeCases_log, (
-                self.nRs, 1)) + self.GrowthCases.cumsum(axis=1))
-            self.InfectedCases = pm.Deterministic('InfectedCases', pm.math.exp(self.InfectedCases_log))
-
-            self.CasesDelayMean = pm.Normal('CasesDelayMean', cases_delay_mean_mean, cases_delay_mean_sd)
-            self.CasesDelayDisp = pm.Normal('CasesDelayDisp', cases_delay_disp_mean, cases_delay_disp_sd)
-            cases_delay_dist = pm.NegativeBinomial.dist(mu=self.CasesDelayMean, alpha=self.CasesDelayDisp)
-            bins = np.arange(0, cases_truncation)
-            pmf = T.exp(cases_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            reporting_delay = pmf.reshape((1, cases_truncation))
-
-            expected_cases = C.conv2d(
-                self.InfectedCases,
-                reporting_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedCases = pm.Deterministic('ExpectedCases', expected_cases.reshape(
-                (self.nRs, self.nDs)))
-
-            # effectively handle missing values ourselves
-            self.ObservedCases = pm.NegativeBinomial(
-                'ObservedCases',
-                mu=self.ExpectedCases.reshape((self.nRs * self.nDs,))[self.all_observed_active],
-                alpha=self.PsiCases,
-                shape=(len(self.all_observed_active),),
-                observed=self.d.NewCases.data.reshape((self.nRs * self.nDs,))[self.all_observed_active]
-            )
+            self.build_infected(self.GrowthCases, 'Cases')
+
+            reporting_delay = self.build_delay('Cases', cases_delay_mean_mean, cases_delay_mean_sd,
+                                               cases_delay_disp_mean, cases_delay_disp_sd, cases_truncation)
+            self.ExpectedCases = self.build_expected('ExpectedCases', self.InfectedCases, reporting_delay)
+
+            self.ObservedCases = self.build_observation('ObservedCases', 'ExpectedCases', self.ExpectedCases,
+                                                        self.PsiCases, self.all_observed_active, self.d.NewCases)
 
 
 class DeathsOnlyComplexDifferentEffectsModel(BaseCMModel):
@@ -1508,7 +958,9 @@ class DeathsOnlyComplexDifferentEffectsModel(BaseCMModel):
                     alpha_noise_scale_prior='half-t', alpha_noise_scale=0.04, deaths_delay_mean_mean=21,
                     deaths_delay_mean_sd=1, deaths_delay_disp_mean=9,
                     deaths_delay_disp_sd=1, cases_delay_mean_mean=10, cases_delay_mean_sd=1, cases_delay_disp_mean=5,
-                    cases_delay_disp_sd=1, deaths_truncation=48, cases_truncation=32, **kwargs):
+                    cases_delay_disp_sd=1, deaths_truncation=48, cases_truncation=32,
+                    growth_noise_basis='full', growth_noise_knot_spacing=7, growth_noise_degree=3, record='full',
+                    **kwargs):
         """
         Build NPI effectiveness model
         :param R_prior_mean: R_0 prior mean
@@ -1525,87 +977,48 @@ class DeathsOnlyComplexDifferentEffectsModel(BaseCMModel):
         :param deaths_delay_disp_mean: mean of normal prior placed over death delay dispersion (alpha / psi)
         :param deaths_delay_disp_sd: sd of normal prior placed over death delay dispersion (alpha / psi)
         :param deaths_truncation: maximum death delay
+        :param growth_noise_basis: growth noise basis, 'full' (independent noise on each day), 'spline' or
+                                   'random_walk'. See get_growth_noise_basis
+        :param growth_noise_knot_spacing: days between knots of the growth noise basis
+        :param growth_noise_degree: spline degree of the 'spline' growth noise basis
+        :param record: which deterministics to record in the trace: 'full', 'summary' or a list of names. See
+                       BaseCMModel.set_record_policy
         """
+        self.set_record_policy(record)
         with self.model:
             self.build_npi_prior(cm_prior, cm_prior_scale)
 
-            self.CMReduction = pm.Deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
-
-            if alpha_noise_scale_prior == 'half-normal':
-                self.CMAlphaScales = pm.HalfNormal('CMAlphaScales', sigma=alpha_noise_scale, shape=(self.nCMs))
-            elif alpha_noise_scale_prior == 'half-t':
-                self.CMAlphaScales = pm.HalfStudentT('CMAlphaScales', nu=3, sigma=alpha_noise_scale, shape=(self.nCMs))
-
-            self.AllCMAlphaNoise = pm.Normal('AllCMAlphaNoise', 0, 1, shape=(self.nRs, self.nCMs))
-            self.AllCMAlpha = pm.Deterministic('AllCMAlpha',
-                                               T.reshape(self.CM_Alpha, (1, self.nCMs)).repeat(self.nRs,
-                                                                                               axis=0) +
-                                               self.CMAlphaScales.reshape((1, self.nCMs)) * self.AllCMAlphaNoise)
-
-            self.HyperRVar = pm.HalfNormal(
-                'HyperRVar', sigma=0.5
-            )
-
-            self.RegionR_noise = pm.Normal('RegionR_noise', 0, 1, shape=(self.nRs), )
-            self.RegionR = pm.Deterministic('RegionR', R_prior_mean + self.RegionR_noise * self.HyperRVar)
+            self.CMReduction = self.build_deterministic('CMReduction', T.exp((-1.0) * self.CM_Alpha))
 
-            self.ActiveCMs = pm.Data('ActiveCMs', self.d.ActiveCMs)
+            self.build_region_cm_alpha(alpha_noise_scale_prior, alpha_noise_scale)
 
-            active_cm_reduction = T.reshape(self.AllCMAlpha, (self.nRs, self.nCMs, 1)) * self.ActiveCMs
-            growth_reduction = T.sum(active_cm_reduction, axis=1)
+            self.build_region_r(R_prior_mean)
 
-            self.ExpectedLogR = pm.Deterministic(
-                'ExpectedLogR',
-                T.reshape(pm.math.log(self.RegionR), (self.nRs, 1)) - growth_reduction,
-            )
+            growth_reduction = self.build_log_r_reduction(self.AllCMAlpha)
+            self.build_expected_log_r(growth_reduction)
 
             # convert R into growth rates
-            self.GI_mean = pm.Normal('GI_mean', gi_mean_mean, gi_mean_sd)
-            self.GI_sd = pm.Normal('GI_sd', gi_sd_mean, gi_sd_sd)
-
-            gi_beta = self.GI_mean / self.GI_sd ** 2
-            gi_alpha = self.GI_mean ** 2 / self.GI_sd ** 2
-
-            self.ExpectedGrowth = gi_beta * (pm.math.exp(self.ExpectedLogR / gi_alpha) - T.ones((self.nRs, self.nDs)))
+            self.build_generation_interval(gi_mean_mean, gi_mean_sd, gi_sd_mean, gi_sd_sd)
+            self.ExpectedGrowth = self.growth_from_log_r(self.ExpectedLogR)
 
             self.GrowthNoiseScale = pm.HalfStudentT('GrowthNoiseScale', nu=3, sigma=0.15)
             # self.GrowthNoiseScale = pm.HalfNormal('GrowthNoiseScale', sigma=0.15)
 
             # exclude 40 days of noise, slight increase in runtime.
-            self.GrowthDeathsNoise = pm.Normal("GrowthDeathsNoise", 0, 1,
-                                               shape=(self.nRs, self.nDs - 40))
+            self.GrowthDeathsNoise = self.build_growth_noise(
+                'GrowthDeathsNoise', basis=growth_noise_basis, knot_spacing=growth_noise_knot_spacing,
+                degree=growth_noise_degree)
+
+            self.GrowthDeaths = self.add_growth_noise(self.ExpectedGrowth,
+                                                      self.GrowthNoiseScale * self.GrowthDeathsNoise)
 
-            self.GrowthDeaths = T.inc_subtensor(self.ExpectedGrowth[:, 30:-10],
-                                                self.GrowthNoiseScale * self.GrowthDeathsNoise)
             self.PsiDeaths = pm.HalfNormal('PsiDeaths', 5.)
 
-            self.InitialSizeDeaths_log = pm.Normal('InitialSizeDeaths_log', 0, 50, shape=(self.nRs,))
-            self.InfectedDeaths_log = pm.Deterministic('InfectedDeaths_log', T.reshape(self.InitialSizeDeaths_log, (
-                self.nRs, 1)) + self.GrowthDeaths.cumsum(axis=1))
-            self.InfectedDeaths = pm.Deterministic('InfectedDeaths', pm.math.exp(self.InfectedDeaths_log))
-
-            self.DeathsDelayMean = pm.Normal('DeathsDelayMean', deaths_delay_mean_mean, deaths_delay_mean_sd)
-            self.DeathsDelayDisp = pm.Normal('DeathsDelayDisp', deaths_delay_disp_mean, deaths_delay_disp_sd)
-            deaths_delay_dist = pm.NegativeBinomial.dist(mu=self.DeathsDelayMean, alpha=self.DeathsDelayDisp)
-            bins = np.arange(0, deaths_truncation)
-            pmf = T.exp(deaths_delay_dist.logp(bins))
-            pmf = pmf / T.sum(pmf)
-            fatality_delay = pmf.reshape((1, deaths_truncation))
-
-            expected_deaths = C.conv2d(
-                self.InfectedDeaths,
-                fatality_delay,
-                border_mode='full'
-            )[:, :self.nDs]
-
-            self.ExpectedDeaths = pm.Deterministic('ExpectedDeaths', expected_deaths.reshape(
-                (self.nRs, self.nDs)))
-
-            # effectively handle missing values ourselves
-            self.ObservedDeaths = pm.NegativeBinomial(
-                'ObservedDeaths',
-                mu=self.ExpectedDeaths.reshape((self.nRs * self.nDs,))[self.all_observed_deaths],
-                alpha=self.PsiDeaths,
-                shape=(len(self.all_observed_deaths),),
-                observed=self.d.NewDeaths.data.reshape((self.nRs * self.nDs,))[self.all_observed_deaths]
-            )
+            self.build_infected(self.GrowthDeaths, 'Deaths')
+
+            fatality_delay = self.build_delay('Deaths', deaths_delay_mean_mean, deaths_delay_mean_sd,
+                                              deaths_delay_disp_mean, deaths_delay_disp_sd, deaths_truncation)
+            self.ExpectedDeaths = self.build_expected('ExpectedDeaths', self.InfectedDeaths, fatality_delay)
+
+            self.ObservedDeaths = self.build_observation('ObservedDeaths', 'ExpectedDeaths', self.ExpectedDeaths,
+                                                         self.PsiDeaths, self.all_observed_deaths, self.d.NewDeaths)
@@ -0,0 +1,138 @@
+"""
+:code:`renewal.py`
+
+Theano Op for the discrete renewal process, used by DiscreteRenewalFixedGIModel.
+
+Unrolling the renewal equation with one :code:`T.set_subtensor` per day gives a graph whose size (and compile time)
+grows with the number of days. Here, the recursion runs in a NumPy loop inside a single Op, with a hand-written
+gradient, so the graph size doesn't depend on the number of days.
+"""
+import numpy as np
+import theano
+import theano.tensor as T
+
+try:
+    from theano.graph.basic import Apply
+    from theano.graph.op import Op
+except ImportError:
+    # Theano < 1.1
+    from theano.gof import Apply, Op
+
+
+def _gi_windows(infected, gi_rev):
+    """
+    Generation interval weighted sum of each window of gi_truncation consecutive days.
+
+    :param infected: infections, shape (..., nDs + gi_truncation)
+    :param gi_rev: reversed generation interval, shape (gi_truncation,)
+    :return: weighted sums, shape (..., nDs). Entry d is the sum over days d to d + gi_truncation - 1.
+    """
+    nDs = infected.shape[-1] - gi_rev.size
+    return sum(g * infected[..., i:(i + nDs)] for i, g in enumerate(gi_rev))
+
+
+class DiscreteRenewal(Op):
+    """
+    Discrete renewal process.
+
+    Given reproduction numbers R, shape (..., nDs), and the initial infections, shape (..., gi_truncation), computes
+    infections, shape (..., gi_truncation + nDs). The first gi_truncation days are the initial infections, and day
+    d + gi_truncation is
+
+    :code:`R[..., d] * sum(infected[..., d:(d + gi_truncation)] * gi[::-1])`
+    """
+    __props__ = ('gi',)
+
+    def __init__(self, gi):
+        """
+        Constructor
+
+        :param gi: discretised generation interval, shape (gi_truncation,). gi[i] is the probability of an infection
+                   being caused by an infection i + 1 days earlier.
+        """
+        self.gi = tuple(float(g) for g in np.asarray(gi).flatten())
+        self.gi_rev = np.array(self.gi[::-1])
+
+    def make_node(self, R, initial):
+        R = T.as_tensor_variable(R)
+        initial = T.as_tensor_variable(initial)
+        out = T.TensorType(theano.scalar.upcast(R.dtype, initial.dtype), R.broadcastable[:-1] + (False,))()
+        return Apply(self, [R, initial], [out])
+
+    def perform(self, node, inputs, output_storage):
+        R, initial = inputs
+        gi_truncation = self.gi_rev.size
+
+        if initial.shape[-1] != gi_truncation:
+            raise ValueError(f'Initial infections must cover {gi_truncation} days, not {initial.shape[-1]}')
+
+        nDs = R.shape[-1]
+        infected = np.zeros(R.shape[:-1] + (gi_truncation + nDs,), dtype=node.outputs[0].dtype)
+        infected[..., :gi_truncation] = initial
+        for d in range(nDs):
+            infected[..., d + gi_truncation] = R[..., d] * (infected[..., d:(d + gi_truncation)] @ self.gi_rev)
+
+        output_storage[0][0] = infected
+
+    def infer_shape(self, *args):
+        # Theano < 1.1 doesn't pass fgraph
+        R_shape, initial_shape = args[-1]
+        return [tuple(R_shape[:-1]) + (R_shape[-1] + initial_shape[-1],)]
+
+    def grad(self, inputs, output_grads):
+        R, initial = inputs
+        infected = self(R, initial)
+        R_grad, initial_grad = DiscreteRenewalGrad(self.gi)(R, infected, output_grads[0])
+        return [R_grad, T.cast(initial_grad, initial.dtype)]
+
+
+class DiscreteRenewalGrad(Op):
+    """
+    Gradient of DiscreteRenewal, with respect to R and the initial infections.
+
+    This back-propagates through the recursion in reverse day order: the gradient of each day's infections is final
+    once every later day has been processed, because infections only feed into later days.
+    """
+    __props__ = ('gi',)
+
+    def __init__(self, gi):
+        """
+        Constructor
+
+        :param gi: discretised generation interval, as for DiscreteRenewal
+        """
+        self.gi = tuple(float(g) for g in np.asarray(gi).flatten())
+        self.gi_rev = np.array(self.gi[::-1])
+
+    def make_node(self, R, infected, infected_grad):
+        R = T.as_tensor_variable(R)
+        infected = T.as_tensor_variable(infected)
+        infected_grad = T.as_tensor_variable(infected_grad)
+        initial_grad = T.TensorType(infected.dtype, infected.broadcastable[:-1] + (False,))()
+        return Apply(self, [R, infected, infected_grad], [R.type(), initial_grad])
+
+    def perform(self, node, inputs, output_storage):
+        R, infected, infected_grad = inputs
+        gi_truncation = self.gi_rev.size
+        nDs = R.shape[-1]
+
+        # total derivative with respect to each day's infections
+        total_grad = np.array(infected_grad, dtype=infected.dtype)
+        R_grad = np.zeros(R.shape, dtype=node.outputs[0].dtype)
+        window_sums = _gi_windows(infected, self.gi_rev)
+
+        for d in reversed(range(nDs)):
+            day_grad = total_grad[..., d + gi_truncation]
+            R_grad[..., d] = day_grad * window_sums[..., d]
+            total_grad[..., d:(d + gi_truncation)] += (day_grad * R[..., d])[..., np.newaxis] * self.gi_rev
+
+        output_storage[0][0] = R_grad
+        output_storage[1][0] = np.array(total_grad[..., :gi_truncation], dtype=node.outputs[1].dtype)
+
+    def infer_shape(self, *args):
+        # Theano < 1.1 doesn't pass fgraph
+        R_shape, infected_shape, _ = args[-1]
+        return [R_shape, tuple(infected_shape[:-1]) + (infected_shape[-1] - R_shape[-1],)]
+
+    def grad(self, inputs, output_grads):
+        return [theano.gradient.grad_not_implemented(self, i, inputs[i]) for i in range(len(inputs))]
@@ -0,0 +1,238 @@
+"""
+:code:`streaming_trace.py`
+
+PyMC3 trace backend streaming draws to netCDF files as they are sampled.
+
+The default (NDArray) backend holds every draw of every variable in memory until sampling finishes, including large
+deterministics of shape (nRs, nDs). Here, draws are buffered in chunks and appended to one netCDF file per chain, so
+memory use while sampling is bounded by the chunk size, variables can be left out of the trace altogether, and the
+draws recorded so far survive a crash (see load_streamed_trace). After sampling, get_values reads every draw of one
+variable, and point reads the chunk of draws holding the draw asked for.
+"""
+import glob
+import json
+import os
+from copy import copy
+
+import netCDF4
+import numpy as np
+import pymc3 as pm
+from pymc3.backends.base import BaseTrace, MultiTrace
+
+
+def _stat_varname(sampler_idx, stat_name):
+    return f'sampler_{sampler_idx}__{stat_name}'
+
+
+class StreamingTrace(BaseTrace):
+    """
+    Trace backend appending draws, in chunks, to {directory}/chain-{chain}.nc.
+
+    Pass it to pm.sample as :code:`trace=StreamingTrace(directory, exclude=[...])`. pm.sample copies the backend for
+    each chain when sampling chains in parallel, but uses the same backend for every chain when sampling them one after
+    another, which isn't supported: sample several chains with cores > 1.
+    """
+    supports_sampler_stats = True
+
+    def __init__(self, directory, exclude=None, chunk_size=100, name=None, model=None, vars=None, test_point=None):
+        """
+        Constructor
+
+        :param directory: directory for the per-chain netCDF files
+        :param exclude: names of variables not to record (e.g. large deterministics)
+        :param chunk_size: number of draws buffered in memory before being written
+        :param name: backend name (unused)
+        :param model: model, taken from the context if None
+        :param vars: variables to record, model.unobserved_RVs if None
+        """
+        model = pm.modelcontext(model)
+        if vars is None:
+            vars = model.unobserved_RVs
+        if exclude is not None:
+            unknown = set(exclude) - set(model.named_vars)
+            if unknown:
+                raise ValueError(f'Unknown variables to exclude from the trace: {sorted(unknown)}')
+            vars = [var for var in vars if var.name not in exclude]
+
+        super().__init__(name, model, vars, test_point)
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.path = None
+        self.draws = None
+        self.draw_idx = 0
+        # draws of the file making up this trace. Slicing the trace narrows this range.
+        self.draw_range = None
+        self._dataset = None
+        self._buffer = None
+        self._buffer_stats = None
+        self._buffer_len = 0
+        self._point_cache = {}
+
+    def setup(self, draws, chain, sampler_vars=None):
+        """
+        Create the netCDF file for chain.
+
+        :param draws: expected number of draws
+        :param chain: chain number
+        :param sampler_vars: names and dtypes of the sampler statistics, one dict per sampler
+        """
+        if self.path is not None:
+            raise ValueError('StreamingTrace can only record one chain: sample several chains with cores > 1')
+
+        super().setup(draws, chain, sampler_vars)
+        self.chain = chain
+        self.draws = draws
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, f'chain-{chain}.nc')
+
+        self._dataset = netCDF4.Dataset(self.path, 'w')
+        self._dataset.createDimension('draw', None)
+        self._dataset.varnames = json.dumps(self.varnames)
+        self._dataset.sampler_vars = json.dumps(
+            [{k: np.dtype(v).str for k, v in s.items()} for s in (sampler_vars or [])])
+        for varname in self.varnames:
+            shape = self.var_shapes[varname]
+            dims = ['draw']
+            for i, size in enumerate(shape):
+                self._dataset.createDimension(f'{varname}_dim_{i}', size)
+                dims.append(f'{varname}_dim_{i}')
+            self._dataset.createVariable(varname, self.var_dtypes[varname], dims,
+                                         chunksizes=(self.chunk_size,) + shape)
+        for sampler_idx, stats in enumerate(sampler_vars or []):
+            for stat_name, dtype in stats.items():
+                dtype = np.dtype(dtype)
+                if dtype.kind in 'biuf':
+                    self._dataset.createVariable(_stat_varname(sampler_idx, stat_name),
+                                                 'u1' if dtype.kind == 'b' else dtype, ['draw'])
+
+        self._buffer = {varname: np.zeros((self.chunk_size,) + self.var_shapes[varname], self.var_dtypes[varname])
+                        for varname in self.varnames}
+        self._buffer_stats = [{k: np.zeros(self.chunk_size, dtype=v) for k, v in s.items()}
+                              for s in (sampler_vars or [])]
+
+    def record(self, point, sampler_stats=None):
+        """
+        Record a draw, writing the buffered draws once there are chunk_size of them.
+        """
+        for varname, value in zip(self.varnames, self.fn(point)):
+            self._buffer[varname][self._buffer_len] = value
+        for buffer_stats, stats in zip(self._buffer_stats, sampler_stats or []):
+            for stat_name, value in stats.items():
+                buffer_stats[stat_name][self._buffer_len] = value
+
+        self._buffer_len += 1
+        self.draw_idx += 1
+        if self._buffer_len == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered draws to the netCDF file.
+        """
+        if self._buffer_len == 0:
+            return
+
+        start = self.draw_idx - self._buffer_len
+        for varname in self.varnames:
+            self._dataset[varname][start:self.draw_idx] = self._buffer[varname][:self._buffer_len]
+        for sampler_idx, buffer_stats in enumerate(self._buffer_stats):
+            for stat_name, values in buffer_stats.items():
+                if _stat_varname(sampler_idx, stat_name) in self._dataset.variables:
+                    self._dataset[_stat_varname(sampler_idx, stat_name)][start:self.draw_idx] = \
+                        values[:self._buffer_len]
+        self._dataset.sync()
+        self._buffer_len = 0
+
+    def close(self):
+        if self._dataset is None:
+            return
+
+        self.flush()
+        self._dataset.close()
+        self._dataset = None
+        self._buffer = None
+        self._buffer_stats = None
+        self.draw_range = range(self.draw_idx)
+
+    def __len__(self):
+        if self.draw_range is None:
+            return self.draw_idx
+        return len(self.draw_range)
+
+    def _read(self, varname, draws):
+        """
+        Read draws (a range of draws of the file) of varname.
+        """
+        if self._dataset is not None:
+            raise ValueError('StreamingTrace can only be read after sampling')
+
+        with netCDF4.Dataset(self.path, 'r') as dataset:
+            variable = dataset[varname]
+            variable.set_auto_mask(False)
+            return np.asarray(variable[draws.start:draws.stop:draws.step] if len(draws) > 0 else variable[0:0])
+
+    def get_values(self, varname, burn=0, thin=1):
+        """
+        Read the draws of varname from disk.
+        """
+        return self._read(varname, self.draw_range[burn::thin]).astype(self.var_dtypes[varname], copy=False)
+
+    def _get_sampler_stats(self, stat_name, sampler_idx, burn, thin):
+        dtype = np.dtype(self.sampler_vars[sampler_idx][stat_name])
+        if dtype.kind not in 'biuf':
+            # e.g. sampler warnings, which aren't stored
+            return np.full(len(self.draw_range[burn::thin]), None, dtype=object)
+
+        return self._read(_stat_varname(sampler_idx, stat_name), self.draw_range[burn::thin]).astype(dtype)
+
+    def _slice(self, idx):
+        sliced = copy(self)
+        sliced.draw_range = self.draw_range[idx]
+        sliced._point_cache = {}
+        return sliced
+
+    def point(self, idx):
+        """
+        Values of each variable at draw idx. The chunk of chunk_size draws holding it is read and kept until a draw of
+        another chunk is asked for, so iterating over the draws reads each chunk once.
+        """
+        idx = range(len(self))[int(idx)]
+        start = idx - idx % self.chunk_size
+        if self._point_cache.get('start') != start:
+            draws = self.draw_range[start:(start + self.chunk_size)]
+            self._point_cache = {
+                'start': start,
+                'values': {varname: self._read(varname, draws).astype(self.var_dtypes[varname], copy=False)
+                           for varname in self.varnames},
+            }
+        return {varname: values[idx - start] for varname, values in self._point_cache['values'].items()}
+
+
+def load_streamed_trace(directory, model=None):
+    """
+    Load the chains written by StreamingTrace to directory, including those of an interrupted run.
+
+    :param directory: directory of the per-chain netCDF files
+    :param model: model the trace was sampled from, taken from the context if None
+    :return: pm.MultiTrace. Tuning draws, if any, are included.
+    """
+    model = pm.modelcontext(model)
+    straces = []
+    for path in sorted(glob.glob(os.path.join(directory, 'chain-*.nc'))):
+        with netCDF4.Dataset(path, 'r') as dataset:
+            varnames = json.loads(dataset.varnames)
+            sampler_vars = json.loads(dataset.sampler_vars)
+            n_draws = dataset.dimensions['draw'].size
+
+        strace = StreamingTrace(directory, model=model, vars=[model[varname] for varname in varnames])
+        strace._set_sampler_vars([{k: np.dtype(v) for k, v in s.items()} for s in sampler_vars] or None)
+        strace.chain = int(os.path.basename(path)[len('chain-'):-len('.nc')])
+        strace.path = path
+        strace.draw_idx = n_draws
+        strace.draw_range = range(n_draws)
+        straces.append(strace)
+
+    if not straces:
+        raise ValueError(f'No streamed chains found in {directory}')
+
+    return MultiTrace(straces)
@@ -1,10 +1,14 @@
 import argparse
+import hashlib
 import json
 import lzma
 import os
+import shlex
 import subprocess
 import sys
 import time
+import traceback
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 
@@ -12,12 +16,32 @@ import arviz as az
 import numpy as np
 import pymc3 as pm
 import threadpoolctl
+from pymc3.step_methods.hmc.quadpotential import QuadPotentialDiagAdapt
+from pymc3.theanof import inputvars
 from epimodel import EpidemiologicalParameters, preprocess_data
+from epimodel.pymc3_models.streaming_trace import StreamingTrace
+from scripts.sensitivity_analysis.post_sampling import StreamedDiagnostics, write_prior_predictive, write_trace
+from scripts.sensitivity_analysis.summaries import save_summary_arrays
 from scripts.sensitivity_analysis.utils import *
 
 argparser = argparse.ArgumentParser()
 argparser.add_argument("--data", default="")
 argparser.add_argument("--last_day", help="Brauner data: 2020-05-30")
+argparser.add_argument(
+    "--data_cache_dir",
+    default=".preprocessed_cache",
+    help="Directory caching preprocessed data across runs (empty string to disable)",
+)
+argparser.add_argument(
+    "--data_mmap",
+    action="store_true",
+    help="Memory-map cached preprocessed data read-only, sharing it between concurrent runs",
+)
+argparser.add_argument(
+    "--active_cms_storage",
+    default="float",
+    help="Storage of NPI activations ('float', 'uint8', 'bits')",
+)
 argparser.add_argument("-n", "--no_log", action="store_true")
 argparser.add_argument("-P", "--force_progress", action="store_true")
 argparser.add_argument("--target_accept", default=0.96, type=float)
@@ -30,7 +54,8 @@ argparser.add_argument(
     "--output_base",
     dest="output_base",
     type=str,
-    help="Override destination path prefix (adding '.log', '_summary.json', '_full.netcdf')",
+    help="Override destination path prefix (adding '.log', '_summary.json', '_summary.npz', '_summary_meta.json', "
+         "'_full.netcdf')",
     default="",
 )
 
@@ -65,63 +90,115 @@ argparser.add_argument(
 )
 argparser.add_argument("--different_seasonality", type=str, default="False")
 argparser.add_argument("--local_seasonality_sd", type=float, default=0.1)
+argparser.add_argument(
+    "--hyperparameters_as_data",
+    action="store_true",
+    help="Build prior hyperparameters (basic R mean, max R day, local seasonality sd) as pm.Data, so runs differing "
+         "only in these, in one --batch_file, share the built model and its compiled logp and gradient",
+)
 
-add_argparse_arguments(argparser)
-# Other args of note:
-# --model_build_arg_seasonality_peak_index=1
+argparser.add_argument(
+    "--growth_noise_basis",
+    default="full",
+    help="Growth noise basis of the complex models: 'full' (independent noise on each day), 'spline' or "
+         "'random_walk' (fewer latent dimensions, with knots every --growth_noise_knot_spacing days)",
+)
+argparser.add_argument("--growth_noise_knot_spacing", type=int, default=7)
 
+argparser.add_argument(
+    "--record",
+    default="full",
+    help="Deterministics to record in the trace: 'full', 'summary' (those without a days dimension) or a "
+         "comma-separated list of names. The others can be recomputed from the free RVs",
+)
+argparser.add_argument(
+    "--stream_trace",
+    action="store_true",
+    help="Write draws to '<output_base>_trace/' in chunks while sampling, rather than holding them all in memory",
+)
+argparser.add_argument(
+    "--trace_exclude",
+    nargs="+",
+    default=[],
+    help="Variables not to record in the trace, e.g. ExpectedCases InfectedCases ExpectedDeaths InfectedDeaths",
+)
 
-def load_keys_from_samples(keymap, posterior_samples, summary_dict):
-    for k, v in keymap.items():
-        if k in posterior_samples:
-            # save to list
-            a = np.asarray(posterior_samples[k])
-            summary_dict[v] = a.reshape(-1, *a.shape[2:]).tolist()
-    return summary_dict
+argparser.add_argument(
+    "--post_workers",
+    type=int,
+    default=1,
+    help="Number of processes saving the trace, sampling the posterior and prior predictive and computing "
+    "diagnostics after sampling",
+)
+argparser.add_argument(
+    "--post_chunk_size",
+    type=int,
+    default=100,
+    help="Number of draws processed at a time after sampling",
+)
 
+argparser.add_argument(
+    "--batch_file",
+    default="",
+    help="Run each configuration in this file (one line of new_custom.py arguments per run) in this process, reusing "
+         "loaded data, and models (with their compiled logp and gradient) differing only in hyperparameters if "
+         "--hyperparameters_as_data is given",
+)
 
-def main():
-    args, extras = argparser.parse_known_args()
+argparser.add_argument(
+    "--skip_completed",
+    action="store_true",
+    help="Exit without running if this configuration has already completed, i.e. its summary exists. Outputs are "
+         "named by a hash of the run configuration (arguments, model build dict and data file contents)",
+)
 
-    if not args.output_base:
-        ts_str = datetime.now().strftime("%Y-%m-%d-%H%M%S")
-        args.output_base = f"sensitivity_analysis/{args.model_config_name}/{args.exp_tag}/{args.model_type}_{ts_str}_pid{os.getpid()}"
-    Path(args.output_base).parent.mkdir(parents=True, exist_ok=True)
+argparser.add_argument(
+    "--timestamp_output",
+    action="store_true",
+    help="Add a timestamp and process id to the output names, so that repeated runs of a configuration don't "
+         "overwrite each other. These runs aren't recognised as completed by --skip_completed",
+)
 
-    log_output = f"{args.output_base}.log"
-    full_output = f"{args.output_base}_full.netcdf"
-    summary_output = f"{args.output_base}_summary.json"
-    if not args.no_log:
-        print(f"Logging to {log_output}")
-        logprocess = subprocess.Popen(
-            ["/usr/bin/tee", log_output], stdin=subprocess.PIPE,
-        )
-        os.close(sys.stdout.fileno())
-        os.dup2(logprocess.stdin.fileno(), sys.stdout.fileno())
-        os.close(sys.stderr.fileno())
-        os.dup2(logprocess.stdin.fileno(), sys.stderr.fileno())
+add_argparse_arguments(argparser)
+# Other args of note:
+# --model_build_arg_seasonality_peak_index=1
 
-    if args.force_progress:
-        import fastprogress
+# arguments which don't change a run's results, so aren't part of its configuration hash
+OUTPUT_ONLY_ARGS = [
+    "no_log",
+    "force_progress",
+    "output_base",
+    "data_cache_dir",
+    "data_mmap",
+    "active_cms_storage",
+    "hyperparameters_as_data",
+    "skip_completed",
+    "timestamp_output",
+    "batch_file",
+    "stream_trace",
+    "post_workers",
+    "post_chunk_size",
+]
 
-        fastprogress.fastprogress.printing = lambda: True
-        fastprogress.fastprogress.ProgressBar.update_every = 5.0
-        fastprogress.fastprogress.ProgressBar.first_its = 100
+# build dict entries holding model hyperparameters (see BaseCMModel.build_hyperparameter) rather than model structure,
+# besides the values in max_R_day_prior
+HYPERPARAMETER_KEYS = ["R_prior_mean", "local_seasonality_sd", "basic_R_prior"]
 
-    print(f"CMD: {' '.join(sys.argv)}")
 
-    if args.last_day:
-        data = preprocess_data(args.data, last_day=args.last_day)
-    else:
-        data = preprocess_data(args.data)
-    print(f"\nData loaded from {args.data}:")
-    print(f"NPI CMs ({len(data.CMs)}): {data.CMs}")
-    print(f"Regions ({len(data.Rs)}): {data.Rs}")
-    print(f"Days ({len(data.Ds)}): {data.Ds[0]} .. {data.Ds[-1]}")
+def load_keys_from_samples(keymap, posterior_samples, summary_dict, summary_arrays=None):
+    for k, v in keymap.items():
+        if k in posterior_samples:
+            a = np.asarray(posterior_samples[k])
+            a = a.reshape(-1, *a.shape[2:])
+            if summary_arrays is not None:
+                summary_arrays[v] = a
+            # save to list
+            summary_dict[v] = a.tolist()
+    return summary_dict
 
-    ep = EpidemiologicalParameters()
 
-    model_class = get_model_class_from_str(args.model_type)
+def get_build_dict(args, extras):
+    ep = EpidemiologicalParameters()
 
     if args.max_R_day_prior == "fixed":
         max_R_day_prior = {
@@ -150,12 +227,221 @@ def main():
     assert args.different_seasonality in ["True", "False"]
     bd["different_seasonality"] = (args.different_seasonality == "True")
     bd["local_seasonality_sd"] = args.local_seasonality_sd
-    print(f"\nBD = {bd}")
+    if args.hyperparameters_as_data:
+        bd["hyperparameters_as_data"] = True
+    if args.growth_noise_basis != "full":
+        bd["growth_noise_basis"] = args.growth_noise_basis
+        bd["growth_noise_knot_spacing"] = args.growth_noise_knot_spacing
+    if args.record in ["full", "summary"]:
+        if args.record != "full":
+            bd["record"] = args.record
+    else:
+        bd["record"] = args.record.split(",")
+    return bd
+
+
+def get_run_hash(args, extras, bd):
+    h = hashlib.sha256()
+    if os.path.exists(args.data):
+        with open(args.data, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+
+    run_args = {k: v for k, v in vars(args).items() if k not in OUTPUT_ONLY_ARGS}
+    run_bd = {k: v for k, v in bd.items() if k not in OUTPUT_ONLY_ARGS}
+    h.update(json.dumps({"args": run_args, "extras": extras, "bd": run_bd}, sort_keys=True, default=str).encode("utf8"))
+    return h.hexdigest()[:16]
+
+
+def get_hyperparameters(bd):
+    hyperparameters = {
+        "R_prior_mean": bd["R_prior_mean"],
+        "local_seasonality_sd": bd["local_seasonality_sd"],
+    }
+    if bd["max_R_day_prior"]["type"] == "fixed":
+        hyperparameters["max_R_day"] = bd["max_R_day_prior"]["value"]
+    else:
+        hyperparameters["max_R_day_mean"] = bd["max_R_day_prior"]["mean"]
+        hyperparameters["max_R_day_scale"] = bd["max_R_day_prior"]["scale"]
+    return hyperparameters
+
+
+def get_data_key(args):
+    return (args.data, args.last_day, args.data_cache_dir, args.data_mmap, args.active_cms_storage)
+
+
+def get_model_key(args, bd):
+    structure_bd = {k: v for k, v in bd.items() if k not in HYPERPARAMETER_KEYS}
+    structure_bd["max_R_day_prior"] = bd["max_R_day_prior"]["type"]
+    return json.dumps([args.model_type, get_data_key(args), structure_bd], sort_keys=True, default=str)
+
+
+def load_data(args, data_cache=None):
+    """
+    Load args.data, or reuse it from data_cache (a dict, updated in place) if it has already been loaded.
+    """
+    key = get_data_key(args)
+    if data_cache is not None and key in data_cache:
+        print(f"\nReusing data loaded from {args.data}")
+        return data_cache[key]
+
+    cache_dir = args.data_cache_dir or None
+    if args.last_day:
+        data = preprocess_data(args.data, last_day=args.last_day, cache_dir=cache_dir, mmap=args.data_mmap,
+                               active_cms_storage=args.active_cms_storage)
+    else:
+        data = preprocess_data(args.data, cache_dir=cache_dir, mmap=args.data_mmap,
+                               active_cms_storage=args.active_cms_storage)
+
+    if data_cache is not None:
+        data_cache[key] = data
+    return data
+
+
+def build_model(args, bd, data, model_cache=None):
+    """
+    Build the model and compile its logp and gradient function, or reuse them from model_cache (a dict, updated in
+    place) for a model with the same structure.
+
+    A cached model is only reused if every hyperparameter which differs is held in a data container (see
+    --hyperparameters_as_data), and is then updated with set_hyperparameters. The compiled function reads the data
+    containers' shared variables, so it computes the updated model, and reusing it saves optimising and compiling the
+    graph again.
+
+    :return: (model, logp and gradient function) tuple, see get_nuts_step
+    """
+    model_class = get_model_class_from_str(args.model_type)
+    hyperparameters = get_hyperparameters(bd)
+    key = get_model_key(args, bd)
+
+    if model_cache is not None and key in model_cache:
+        model, built_hyperparameters, logp_dlogp_func = model_cache[key]
+        changed = {k: v for k, v in hyperparameters.items() if v != built_hyperparameters[k]}
+        if all(k in model.model.named_vars for k in changed):
+            print(f"\nReusing model, with hyperparameters {changed}")
+            model.set_hyperparameters(**changed)
+            model_cache[key] = (model, hyperparameters, logp_dlogp_func)
+            return model, logp_dlogp_func
 
-    start = time.time()
     print("\nBuilding model ...")
     with model_class(data) as model:
         model.build_model(**bd)
+        # as compiled by pm.NUTS
+        logp_dlogp_func = model.logp_dlogp_function(inputvars(model.cont_vars))
+
+    if model_cache is not None:
+        model_cache[key] = (model, hyperparameters, logp_dlogp_func)
+    return model, logp_dlogp_func
+
+
+def get_nuts_step(args, model, logp_dlogp_func):
+    """
+    NUTS step as built by pm.sample(init="adapt_diag", max_treedepth=14), but around an already compiled logp and
+    gradient function (see build_model). The step is built for each run, so no tuning state is carried over.
+    """
+    with model.model:
+        mean = model.model.dict_to_array(model.model.test_point)
+        potential = QuadPotentialDiagAdapt(model.model.ndim, mean, np.ones_like(mean), 10)
+        return pm.NUTS(
+            potential=potential,
+            max_treedepth=14,
+            target_accept=args.target_accept,
+            logp_dlogp_func=logp_dlogp_func,
+        )
+
+
+@contextmanager
+def log_to_file(log_output):
+    """
+    Copy stdout and stderr to log_output (as well as to the terminal) within this context.
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_stdout = os.dup(sys.stdout.fileno())
+    saved_stderr = os.dup(sys.stderr.fileno())
+    logprocess = subprocess.Popen(
+        ["/usr/bin/tee", log_output], stdin=subprocess.PIPE,
+    )
+    os.dup2(logprocess.stdin.fileno(), sys.stdout.fileno())
+    os.dup2(logprocess.stdin.fileno(), sys.stderr.fileno())
+    try:
+        yield
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.dup2(saved_stdout, sys.stdout.fileno())
+        os.dup2(saved_stderr, sys.stderr.fileno())
+        os.close(saved_stdout)
+        os.close(saved_stderr)
+        logprocess.stdin.close()
+        logprocess.wait()
+
+
+def run(args, extras, data_cache=None, model_cache=None):
+    """
+    Run one configuration, writing its outputs to args.output_base.
+
+    :param args: parsed arguments
+    :param extras: unparsed (model build) arguments
+    :param data_cache: dict of data loaded by previous runs in this process, or None
+    :param model_cache: dict of models built by previous runs in this process, or None
+    """
+    bd = get_build_dict(args, extras)
+
+    if not args.output_base:
+        # outputs are content-addressed, so any completed configuration can be found again
+        run_str = get_run_hash(args, extras, bd)
+        if args.timestamp_output:
+            run_str = f"{run_str}_{datetime.now().strftime('%Y-%m-%d-%H%M%S')}_pid{os.getpid()}"
+        args.output_base = f"sensitivity_analysis/{args.model_config_name}/{args.exp_tag}/{args.model_type}_{run_str}"
+    Path(args.output_base).parent.mkdir(parents=True, exist_ok=True)
+
+    log_output = f"{args.output_base}.log"
+    summary_output = f"{args.output_base}_summary.json"
+    if args.skip_completed and os.path.exists(summary_output):
+        print(f"Skipping completed run: {summary_output} exists")
+        return
+
+    if args.no_log:
+        run_inference(args, bd, data_cache, model_cache)
+    else:
+        print(f"Logging to {log_output}")
+        with log_to_file(log_output):
+            run_inference(args, bd, data_cache, model_cache)
+
+
+def run_inference(args, bd, data_cache=None, model_cache=None):
+    full_output = f"{args.output_base}_full.netcdf"
+    summary_output = f"{args.output_base}_summary.json"
+
+    if args.force_progress:
+        import fastprogress
+
+        fastprogress.fastprogress.printing = lambda: True
+        fastprogress.fastprogress.ProgressBar.update_every = 5.0
+        fastprogress.fastprogress.ProgressBar.first_its = 100
+
+    print(f"CMD: {' '.join(sys.argv)}")
+
+    data = load_data(args, data_cache)
+    print(f"\nData loaded from {args.data}:")
+    print(f"NPI CMs ({len(data.CMs)}): {data.CMs}")
+    print(f"Regions ({len(data.Rs)}): {data.Rs}")
+    print(f"Days ({len(data.Ds)}): {data.Ds[0]} .. {data.Ds[-1]}")
+
+    model_class = get_model_class_from_str(args.model_type)
+
+    print(f"\nBD = {bd}")
+
+    start = time.time()
+    model, logp_dlogp_func = build_model(args, bd, data, model_cache)
+
+    trace = None
+    if args.stream_trace:
+        with model.model:
+            trace = StreamingTrace(f"{args.output_base}_trace", exclude=args.trace_exclude)
+    elif args.trace_exclude:
+        trace = [v for v in model.model.unobserved_RVs if v.name not in args.trace_exclude]
 
     print("Running inference ...\n")
     with threadpoolctl.threadpool_limits(limits=1):
@@ -165,37 +451,46 @@ def main():
                 tune=min(500, args.n_samples),
                 chains=args.n_chains,
                 cores=args.n_chains,
-                max_treedepth=14,
-                target_accept=args.target_accept,
-                init="adapt_diag",
+                step=get_nuts_step(args, model, logp_dlogp_func),
+                trace=trace,
+                # pm.sample's checks convert the whole trace with arviz, reading it into memory. write_trace computes
+                # R-hat and ESS chunk by chunk after sampling
+                compute_convergence_checks=not args.stream_trace,
             )
     end = time.time()
 
-    print("\n\nSaving as arviz ...")
-    with model.model:
-        try:
-            prior = pm.sample_prior_predictive()
-        except:
-            prior = None
-        try:
-            posterior_predictive = pm.sample_posterior_predictive(model.trace)
-        except:
-            posterior_predictive = None
-        pm_data = az.from_pymc3(
-            trace=model.trace,
-            prior=prior,
-            posterior_predictive=posterior_predictive,
-            coords={"R": data.Rs, "D": data.Ds, "CM": data.CMs},
-            dims={"CM_Alpha": ["CM"], "RegionR_noise": ["R"]},
+    print("\n\nSaving as arviz, with the posterior predictive, and computing diagnostics ...")
+    coords = {"R": data.Rs, "D": data.Ds, "CM": data.CMs}
+    dims = {"CM_Alpha": ["CM"], "RegionR_noise": ["R"]}
+    rhat_by_var, ess_by_var = write_trace(
+        model.model,
+        model.trace,
+        full_output,
+        coords=coords,
+        dims=dims,
+        chunk_size=args.post_chunk_size,
+        n_workers=args.post_workers,
+    )
+
+    print("\n\nSampling prior predictive ...")
+    try:
+        write_prior_predictive(
+            model.model,
+            full_output,
+            coords=coords,
+            dims=dims,
+            chunk_size=args.post_chunk_size,
+            n_workers=args.post_workers,
         )
-        pm_data.to_netcdf(full_output)
+    except Exception:
+        traceback.print_exc()
+        print("Prior predictive sampling failed, the prior is not saved")
+    pm_data = az.from_netcdf(full_output)
 
     print("\n\nSaving as json ...")
 
     if args.n_samples >= 4 and args.n_chains >= 2:
-        all_rhat = np.concatenate(
-            [v.values.ravel() for v in az.rhat(pm_data.posterior).data_vars.values()]
-        )
+        all_rhat = np.concatenate([v.ravel() for v in rhat_by_var.values()])
         print(f"  {np.sum(np.isnan(all_rhat))} Rhat were nan")
         all_rhat = all_rhat[np.logical_not(np.isnan(all_rhat))]
         rhat = {
@@ -205,8 +500,16 @@ def main():
             "max": float(np.max(all_rhat)),
             "min": float(np.min(all_rhat)),
         }
+        all_ess = np.concatenate([v.ravel() for v in ess_by_var.values()])
+        all_ess = all_ess[np.isfinite(all_ess)]
+        ess = {
+            "med": float(np.percentile(all_ess, 50)),
+            "lower": float(np.percentile(all_ess, 2.5)),
+            "min": float(np.min(all_ess)),
+        } if all_ess.size > 0 else None
     else:
         rhat = None
+        ess = None
 
     info_dict = dict(
         model_name=str(model_class.__name__),
@@ -215,12 +518,15 @@ def main():
         time_per_sample=float(end - start) / args.n_samples,
         total_runtime=float(end - start),
         rhat=rhat,
+        rhat_method=StreamedDiagnostics.rhat_method,
+        ess=ess,
         data_path=args.data,
         cm_names=model.d.CMs,
         exp_tag=args.exp_tag,
         exp_config=bd,
         model_kwargs=bd,
     )
+    summary_arrays = {}
     load_keys_from_samples(
         {
             "seasonality_beta1": "seasonality_beta1",
@@ -231,9 +537,59 @@ def main():
         },
         pm_data.posterior,
         info_dict,
+        summary_arrays,
     )
-    with open(summary_output, "wb") as f:
+    save_summary_arrays(
+        args.output_base, {k: v for k, v in info_dict.items() if k not in summary_arrays}, summary_arrays
+    )
+    # the summary is written last, and atomically, so its existence marks the run as completed
+    with open(f"{summary_output}.tmp", "wb") as f:
         f.write(json.dumps(info_dict, ensure_ascii=False, indent=4).encode("utf8"))
+    os.replace(f"{summary_output}.tmp", summary_output)
+
+
+def run_batch(batch_file):
+    """
+    Run each configuration in batch_file in turn, sharing loaded data and models between them.
+
+    Each line holds the arguments of one run. Lines may also start with the command running new_custom.py (as printed
+    by sensitivity_dispatcher.py --dry_run), and empty lines and lines starting with # are ignored. A failed run is
+    reported, and the remaining runs still go ahead.
+
+    :return: number of failed runs
+    """
+    with open(batch_file, "r") as f:
+        lines = [line.strip() for line in f]
+    lines = [line for line in lines if line and not line.startswith("#")]
+
+    data_cache = {}
+    model_cache = {}
+    n_failed = 0
+    for i, line in enumerate(lines):
+        run_argv = shlex.split(line)
+        if "new_custom.py" in " ".join(run_argv[:2]):
+            run_argv = run_argv[[a.endswith("new_custom.py") for a in run_argv].index(True) + 1:]
+
+        print(f"\nBatch run {i + 1}/{len(lines)}: {' '.join(run_argv)}")
+        try:
+            args, extras = argparser.parse_known_args(run_argv)
+            run(args, extras, data_cache, model_cache)
+        except Exception:
+            traceback.print_exc()
+            print(f"Batch run {i + 1}/{len(lines)} failed")
+            n_failed += 1
+
+    print(f"\n{len(lines) - n_failed} batch runs done, {n_failed} failed")
+    return n_failed
+
+
+def main():
+    args, extras = argparser.parse_known_args()
+    if args.batch_file:
+        if run_batch(args.batch_file) > 0:
+            sys.exit(1)
+    else:
+        run(args, extras)
 
 
 if __name__ == "__main__":
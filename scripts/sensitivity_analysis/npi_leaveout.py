@@ -26,7 +26,7 @@ if __name__ == '__main__':
 
     output_string = ''
     for npi_index in args.npis:
-        data.ActiveCMs[:, npi_index, :] = 0
+        data.set_active_cms((slice(None), npi_index, slice(None)), 0)
         output_string = f'{output_string}{npi_index}'
     output_string = f'{output_string}.txt'
 
@@ -0,0 +1,389 @@
+"""
+:code:`post_sampling.py`
+
+Post-sampling stage of new_custom.py: saving the trace as an arviz netcdf file, with its log likelihood and posterior
+predictive, convergence diagnostics and prior predictive sampling, over chunks of draws.
+
+Chunks are processed by a pool of forked worker processes, which share the model and trace with the parent. Their
+results are consumed in order as they arrive: draws are written straight to the run's netcdf file, and diagnostics are
+merged from per-chain statistics, so no step needs every draw of every variable at once.
+"""
+
+import multiprocessing
+import warnings
+
+import arviz as az
+import netCDF4
+import numpy as np
+import pymc3 as pm
+import theano
+from arviz.data.base import make_attrs
+from pymc3.util import get_default_varnames, get_untransformed_name, is_transformed_name
+
+# model and trace, set before the worker pool is forked
+_worker_state = {}
+
+# sampler stats renamed as by arviz.from_pymc3
+SAMPLE_STAT_NAMES = {
+    'model_logp': 'lp',
+    'mean_tree_accept': 'acceptance_rate',
+    'depth': 'tree_depth',
+    'tree_size': 'n_steps',
+}
+
+
+def _map_chunks(fn, chunks, n_workers=1):
+    """
+    Map fn over chunks, in order, in n_workers forked worker processes (or in this process, if n_workers is 1).
+    """
+    if n_workers <= 1:
+        yield from map(fn, chunks)
+        return
+
+    with multiprocessing.get_context('fork').Pool(n_workers) as pool:
+        yield from pool.imap(fn, chunks)
+
+
+def get_draw_chunks(n_chains, n_draws, chunk_size):
+    """
+    Split each chain's draws into chunks.
+
+    :return: list of (chain index, start, stop) tuples
+    """
+    return [(c, start, min(start + chunk_size, n_draws)) for c in range(n_chains)
+            for start in range(0, n_draws, chunk_size)]
+
+
+def sample_negative_binomial(mu, alpha, rng):
+    """
+    Draw from NegativeBinomial(mu, alpha), parameterised as in pymc3, in one vectorised call.
+
+    The negative binomial is drawn as a gamma-Poisson mixture: a Poisson draw with a Gamma(alpha, mu / alpha) rate.
+
+    :param mu: expected values
+    :param alpha: dispersions, broadcast against mu
+    :param rng: np.random.Generator
+    :return: integer np.ndarray of draws, shape of mu and alpha broadcast together
+    """
+    mu, alpha = np.broadcast_arrays(np.asarray(mu, dtype=np.float64), np.asarray(alpha, dtype=np.float64))
+    if not np.all(np.isfinite(mu) & (mu >= 0)):
+        raise ValueError('NegativeBinomial expected values must be finite and non-negative')
+    if not np.all(np.isfinite(alpha) & (alpha > 0)):
+        raise ValueError('NegativeBinomial dispersions must be finite and positive')
+
+    return rng.negative_binomial(alpha, alpha / (alpha + mu))
+
+
+def _merge_moments(a, b):
+    """
+    Merge (count, mean, M2) moments of two sets of draws, as in Chan et al.
+    """
+    n_a, mean_a, m2_a = a
+    n_b, mean_b, m2_b = b
+    n = n_a + n_b
+    if n_a == 0:
+        return b
+    if n_b == 0:
+        return a
+    delta = mean_b - mean_a
+    return n, mean_a + delta * (n_b / n), m2_a + m2_b + delta ** 2 * (n_a * n_b / n)
+
+
+def _moments(values):
+    if values.shape[0] == 0:
+        return 0, 0.0, 0.0
+    mean = values.mean(axis=0)
+    return values.shape[0], mean, ((values - mean) ** 2).sum(axis=0)
+
+
+class StreamedDiagnostics:
+    """
+    Split R-hat and batch means effective sample size, accumulated from chunks of draws.
+
+    Per chain, this keeps the moments (count, mean and M2) of each half of the chain, and the sum of each batch of
+    consecutive draws. R-hat is the split R-hat of Gelman et al. (without rank normalisation), and the effective sample
+    size is estimated by batch means, with batches of sqrt(n_draws) draws.
+    """
+    # the name of this R-hat in arviz.rhat
+    rhat_method = 'split'
+
+    def __init__(self, n_chains, n_draws):
+        """
+        :param n_chains: number of chains
+        :param n_draws: number of draws per chain
+        """
+        self.n_chains = n_chains
+        self.n_draws = n_draws
+        # as in arviz, the middle draw of an odd number of draws isn't in either half
+        self.half = n_draws // 2
+        self.batch_size = max(1, int(np.sqrt(n_draws)))
+        self.n_batches = n_draws // self.batch_size
+        self.moments = {}
+        self.batch_sums = {}
+
+    def chunk_statistics(self, values, start):
+        """
+        Statistics of a chunk of draws of one chain, to be merged with merge.
+
+        :param values: draws start, start + 1, ... of a variable, shape (n, ...)
+        :param start: index of the first draw
+        :return: (half moments, batch indices, batch sums) tuple
+        """
+        draws = np.arange(start, start + values.shape[0])
+        halves = [draws < self.half, draws >= self.n_draws - self.half]
+        half_moments = [_moments(values[in_half]) for in_half in halves]
+
+        in_batches = draws < self.n_batches * self.batch_size
+        batch_idx = draws[in_batches] // self.batch_size
+        batches = np.unique(batch_idx)
+        batch_sums = np.stack([values[in_batches][batch_idx == b].sum(axis=0) for b in batches]) \
+            if batches.size > 0 else None
+        return half_moments, batches, batch_sums
+
+    def merge(self, name, chain_idx, statistics):
+        """
+        Merge the statistics of a chunk of draws of variable name from chain chain_idx.
+        """
+        half_moments, batches, batch_sums = statistics
+        if name not in self.moments:
+            self.moments[name] = [[(0, 0.0, 0.0), (0, 0.0, 0.0)] for _ in range(self.n_chains)]
+            self.batch_sums[name] = None
+
+        chain_moments = self.moments[name][chain_idx]
+        for h in range(2):
+            chain_moments[h] = _merge_moments(chain_moments[h], half_moments[h])
+
+        if batch_sums is not None:
+            if self.batch_sums[name] is None:
+                self.batch_sums[name] = np.zeros((self.n_chains, self.n_batches) + batch_sums.shape[1:])
+            self.batch_sums[name][chain_idx, batches] += batch_sums
+
+    def rhat(self, name):
+        """
+        Split R-hat of each element of variable name.
+        """
+        n = self.half
+        means = np.stack([m[1] for chain in self.moments[name] for m in chain])
+        variances = np.stack([m[2] / (n - 1) for chain in self.moments[name] for m in chain])
+        within = variances.mean(axis=0)
+        between = n * means.var(axis=0, ddof=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.sqrt(((n - 1) / n * within + between / n) / within)
+
+    def ess(self, name):
+        """
+        Batch means effective sample size of each element of variable name.
+        """
+        batch_means = self.batch_sums[name] / self.batch_size
+        batch_means = batch_means.reshape((-1,) + batch_means.shape[2:])
+        n = batch_means.shape[0] * self.batch_size
+
+        moments = (0, 0.0, 0.0)
+        for chain in self.moments[name]:
+            for m in chain:
+                moments = _merge_moments(moments, m)
+        variance = moments[2] / (moments[0] - 1)
+        batch_variance = self.batch_size * batch_means.var(axis=0, ddof=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return n * variance / batch_variance
+
+
+def compile_log_likelihood(model):
+    """
+    Compile functions computing the elementwise log likelihood of each observation head (see
+    BaseCMModel.get_observation_heads) of one draw.
+
+    :param model: BaseCMModel
+    :return: dict mapping observed RV names to functions of the expected values and dispersion
+    """
+    fns = {}
+    for name, (expected_name, dispersion_name, _) in model.get_observation_heads().items():
+        expected = model.unrecorded_deterministics.get(expected_name, model.named_vars.get(expected_name))
+        # the expected values and dispersion are taken as the inputs, cutting the graph there
+        fns[name] = theano.function([expected, model.named_vars[dispersion_name]],
+                                    model.named_vars[name].logp_elemwiset)
+    return fns
+
+
+def _create_draws_group(dataset, name, n_chains, n_draws):
+    """
+    Create a group of an (arviz) netcdf file, holding variables with chain and draw dimensions.
+    """
+    group = dataset.createGroup(name)
+    group.setncatts(make_attrs(library=pm))
+    for dim, size in [('chain', n_chains), ('draw', n_draws)]:
+        group.createDimension(dim, size)
+        group.createVariable(dim, 'i8', (dim,))[:] = np.arange(size)
+    return group
+
+
+def _write_draws(group, name, values, chain_idx, start, chunk_size, dims=None, coords=None):
+    """
+    Write draws start, start + 1, ... of chain chain_idx of variable name to a group made by _create_draws_group,
+    creating the variable with its first chunk.
+
+    :param values: draws, shape (n, ...)
+    :param dims: names of the dimensions after chain and draw, by default {name}_dim_0, {name}_dim_1, ... as in arviz
+    :param coords: dictionary mapping dimension names to coordinates, by default 0, 1, ...
+    """
+    if name not in group.variables:
+        dims = list(dims or [f'{name}_dim_{i}' for i in range(values.ndim - 1)])
+        for dim, size in zip(dims, values.shape[1:]):
+            if dim not in group.dimensions:
+                group.createDimension(dim, size)
+                coord = np.asarray(coords[dim]) if coords and dim in coords else np.arange(size)
+                if coord.dtype.kind in 'OU':
+                    group.createVariable(dim, str, (dim,))[:] = coord.astype(object)
+                else:
+                    group.createVariable(dim, coord.dtype, (dim,))[:] = coord
+
+        n_draws = len(group.dimensions['draw'])
+        # netcdf has no booleans, they are stored as xarray does
+        variable = group.createVariable(name, np.int8 if values.dtype == bool else values.dtype,
+                                        ['chain', 'draw'] + dims,
+                                        chunksizes=(1, min(chunk_size, n_draws)) + values.shape[1:])
+        if values.dtype == bool:
+            variable.setncattr('dtype', 'bool')
+
+    group[name][chain_idx, start:(start + values.shape[0])] = values
+
+
+def _draws_chunk(chunk):
+    chain_idx, start, stop = chunk
+    model, trace, seed = _worker_state['model'], _worker_state['trace'], _worker_state['seed']
+    varnames, diagnostics = _worker_state['varnames'], _worker_state['diagnostics']
+    log_likelihood_fns = _worker_state['log_likelihood_fns']
+    heads = model.get_observation_heads()
+    chain_trace = trace._straces[trace.chains[chain_idx]][start:stop]
+
+    # expected values left out of the trace are recomputed from the free RVs
+    expected_names = [expected_name for expected_name, _, _ in heads.values()]
+    missing = [name for name in expected_names if name not in trace.varnames]
+    values = {name: chain_trace.get_values(name) for name in expected_names if name not in missing}
+    if missing:
+        free_RV_names = [get_untransformed_name(v.name) if is_transformed_name(v.name) else v.name
+                         for v in model.free_RVs]
+        posterior = {name: chain_trace.get_values(name)[np.newaxis] for name in free_RV_names}
+        recomputed = model.recompute_deterministics(posterior, missing, chunk_size=stop - start)
+        values.update({name: v[0] for name, v in recomputed.items()})
+
+    rng = np.random.default_rng([seed, chain_idx, start])
+    posterior_predictive = {}
+    log_likelihood = {}
+    for name, (expected_name, dispersion_name, indices) in heads.items():
+        alpha = chain_trace.get_values(dispersion_name)
+        mu = values[expected_name]
+        posterior_predictive[name] = sample_negative_binomial(mu.reshape((stop - start, -1))[:, indices],
+                                                              alpha.reshape((stop - start, 1)), rng)
+        # the likelihood Op takes a scalar dispersion, so it is evaluated draw by draw
+        log_likelihood[name] = np.stack([log_likelihood_fns[name](m, a) for m, a in zip(mu, alpha)])
+
+    statistics = {name: diagnostics.chunk_statistics(chain_trace.get_values(name), start) for name in varnames}
+    return chunk, posterior_predictive, log_likelihood, statistics
+
+
+def write_trace(model, trace, netcdf_path, coords=None, dims=None, chunk_size=100, n_workers=1, seed=0):
+    """
+    Save trace as an arviz netcdf file, with the log likelihood and posterior predictive of the observation heads (see
+    BaseCMModel.get_observation_heads), and compute convergence diagnostics of the posterior, in one pass over chunks
+    of draws.
+
+    The observed and constant data groups are written by arviz. The posterior, sample_stats, log_likelihood and
+    posterior_predictive groups are then written one chunk of draws at a time. Posterior predictive draws and the log
+    likelihood are computed from the expected values and dispersions of each chunk's draws, recomputing expected
+    values which aren't in the trace.
+
+    :param model: BaseCMModel
+    :param trace: pm.MultiTrace
+    :param netcdf_path: netcdf file to write
+    :param coords: dictionary mapping dimension names to coordinates, as for arviz.from_pymc3
+    :param dims: dictionary mapping variable names to the names of their dimensions, as for arviz.from_pymc3
+    :param chunk_size: number of draws per chunk
+    :param n_workers: number of worker processes
+    :param seed: random seed. Each chunk is sampled with its own generator seeded from it, so the draws don't depend
+                 on the number of workers.
+    :return: (rhat, ess) tuple of dictionaries mapping posterior variable names to arrays, see StreamedDiagnostics
+    """
+    coords = coords or {}
+    dims = dims or {}
+    n_chains, n_draws = trace.nchains, len(trace)
+    varnames = get_default_varnames(trace.varnames, include_transformed=False)
+    diagnostics = StreamedDiagnostics(n_chains, n_draws)
+    _worker_state.update(model=model, trace=trace, seed=seed, varnames=varnames, diagnostics=diagnostics,
+                         log_likelihood_fns=compile_log_likelihood(model))
+
+    # arviz converts the data, without the draws, of a trace with one draw (warning about it having more chains than
+    # draws)
+    with model, warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        idata = az.from_pymc3(trace=trace[:1], log_likelihood=False, coords=coords, dims=dims)
+    az.InferenceData(**{group: idata[group] for group in ['observed_data', 'constant_data']
+                        if group in idata.groups()}).to_netcdf(netcdf_path)
+
+    with netCDF4.Dataset(netcdf_path, 'a') as dataset:
+        groups = {name: _create_draws_group(dataset, name, n_chains, n_draws)
+                  for name in ['posterior', 'sample_stats', 'log_likelihood', 'posterior_predictive']}
+
+        chunks = get_draw_chunks(n_chains, n_draws, chunk_size)
+        for (chain_idx, start, stop), posterior_predictive, log_likelihood, statistics in _map_chunks(
+                _draws_chunk, chunks, n_workers):
+            chain_trace = trace._straces[trace.chains[chain_idx]][start:stop]
+            for name in varnames:
+                _write_draws(groups['posterior'], name, chain_trace.get_values(name), chain_idx, start, chunk_size,
+                             dims.get(name), coords)
+            for stat in chain_trace.stat_names:
+                if stat != 'tune':
+                    _write_draws(groups['sample_stats'], SAMPLE_STAT_NAMES.get(stat, stat),
+                                 chain_trace.get_sampler_stats(stat), chain_idx, start, chunk_size)
+            for name, values in log_likelihood.items():
+                _write_draws(groups['log_likelihood'], name, values, chain_idx, start, chunk_size)
+            for name, values in posterior_predictive.items():
+                _write_draws(groups['posterior_predictive'], name, values, chain_idx, start, chunk_size)
+            for name, s in statistics.items():
+                diagnostics.merge(name, chain_idx, s)
+            dataset.sync()
+
+    return ({name: diagnostics.rhat(name) for name in varnames},
+            {name: diagnostics.ess(name) for name in varnames})
+
+
+def _prior_predictive_chunk(chunk):
+    start, stop = chunk
+    model, seed = _worker_state['model'], _worker_state['seed']
+    random_seed = int(np.random.SeedSequence([seed, start]).generate_state(1)[0])
+    return chunk, pm.sample_prior_predictive(stop - start, model=model, random_seed=random_seed)
+
+
+def write_prior_predictive(model, netcdf_path, samples=500, coords=None, dims=None, chunk_size=100, n_workers=1,
+                           seed=0):
+    """
+    Sample the prior predictive, and write it to the prior (unobserved variables) and prior_predictive (observed RVs)
+    groups of an (arviz) netcdf file, as one chain, one chunk of draws at a time.
+
+    Groups are created with the first chunk, so nothing is written if sampling fails on it.
+
+    :param model: pm.Model
+    :param netcdf_path: netcdf file written by write_trace
+    :param samples: number of draws
+    :param coords: dictionary mapping dimension names to coordinates, as for arviz.from_pymc3
+    :param dims: dictionary mapping variable names to the names of their dimensions, as for arviz.from_pymc3
+    :param chunk_size: number of draws per chunk
+    :param n_workers: number of worker processes
+    :param seed: random seed. Each chunk is sampled with its own seed derived from it.
+    """
+    coords = coords or {}
+    dims = dims or {}
+    observed_names = {v.name for v in model.observed_RVs}
+    _worker_state.update(model=model, seed=seed)
+
+    with netCDF4.Dataset(netcdf_path, 'a') as dataset:
+        groups = {}
+        chunks = [(start, min(start + chunk_size, samples)) for start in range(0, samples, chunk_size)]
+        for (start, _), prior in _map_chunks(_prior_predictive_chunk, chunks, n_workers):
+            for name in get_default_varnames(prior.keys(), include_transformed=False):
+                group_name = 'prior_predictive' if name in observed_names else 'prior'
+                if group_name not in groups:
+                    groups[group_name] = _create_draws_group(dataset, group_name, 1, samples)
+                _write_draws(groups[group_name], name, np.asarray(prior[name]), 0, start, chunk_size,
+                             dims.get(name), coords)
+            dataset.sync()
@@ -0,0 +1,102 @@
+"""
+:code:`summaries.py`
+
+Binary run summaries, written by new_custom.py alongside the JSON summary.
+
+Posterior samples go to :code:`<output_base>_summary.npz`, one array per key, and the run metadata (everything else in
+the JSON summary, plus the keys, shapes and dtypes of the arrays) to :code:`<output_base>_summary_meta.json`. Loading
+reads only the requested arrays, and only needs NumPy.
+"""
+
+import glob
+import json
+import os
+
+import numpy as np
+
+SUMMARY_SUFFIXES = ['_summary_meta.json', '_summary.npz', '_summary.json']
+
+
+def get_output_base(path):
+    """
+    Output base of a run, given it or the path of any of its summary files.
+    """
+    for suffix in SUMMARY_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)]
+    return path
+
+
+def save_summary_arrays(output_base, metadata, arrays):
+    """
+    Save summary arrays and metadata.
+
+    :param output_base: run output path prefix
+    :param metadata: JSON serialisable dictionary of run metadata
+    :param arrays: dictionary of numpy arrays
+    """
+    npz_output = f'{output_base}_summary.npz'
+    with open(f'{npz_output}.tmp', 'wb') as f:
+        np.savez_compressed(f, **arrays)
+    os.replace(f'{npz_output}.tmp', npz_output)
+
+    meta_output = f'{output_base}_summary_meta.json'
+    metadata = dict(metadata, arrays={k: {'shape': list(v.shape), 'dtype': v.dtype.str} for k, v in arrays.items()})
+    with open(f'{meta_output}.tmp', 'w') as f:
+        json.dump(metadata, f, ensure_ascii=False, indent=4)
+    os.replace(f'{meta_output}.tmp', meta_output)
+
+
+def load_summary(path, keys=None, metadata_keys=None):
+    """
+    Load a run summary, reading only the arrays in keys.
+
+    Runs without a binary summary are loaded from their JSON summary.
+
+    :param path: run output base, or the path of one of its summary files
+    :param keys: keys of the arrays to load (e.g. ['alpha_i']). If None, all are loaded.
+    :param metadata_keys: metadata keys to load (e.g. ['exp_tag', 'exp_config']). If None, all are loaded.
+    :return: dictionary of the selected metadata and arrays
+    """
+    output_base = get_output_base(path)
+    meta_path = f'{output_base}_summary_meta.json'
+
+    if os.path.exists(meta_path):
+        with open(meta_path, 'r') as f:
+            metadata = json.load(f)
+        array_keys = list(metadata.pop('arrays').keys())
+        if keys is not None:
+            array_keys = [k for k in keys if k in array_keys]
+        with np.load(f'{output_base}_summary.npz') as npz:
+            arrays = {k: npz[k] for k in array_keys}
+    else:
+        with open(f'{output_base}_summary.json', 'r') as f:
+            metadata = json.load(f)
+        array_keys = [k for k, v in metadata.items() if isinstance(v, list) and k != 'cm_names']
+        if keys is not None:
+            array_keys = [k for k in keys if k in array_keys]
+        arrays = {k: np.asarray(metadata[k]) for k in array_keys}
+        metadata = {k: v for k, v in metadata.items() if k not in arrays}
+
+    if metadata_keys is not None:
+        metadata = {k: metadata[k] for k in metadata_keys if k in metadata}
+
+    return {**metadata, **arrays}
+
+
+def load_summaries(paths, keys=None, metadata_keys=None):
+    """
+    Load many run summaries, see load_summary.
+
+    :param paths: glob pattern matching summary files or output bases, or a list of them. A run matched by more than one
+                  of its files is loaded once.
+    :param keys: keys of the arrays to load. If None, all are loaded.
+    :param metadata_keys: metadata keys to load. If None, all are loaded.
+    :return: list of summary dictionaries, each with 'output_base' added
+    """
+    if isinstance(paths, str):
+        paths = sorted(glob.glob(paths))
+
+    output_bases = list(dict.fromkeys(get_output_base(p) for p in paths))
+    return [dict(load_summary(output_base, keys, metadata_keys), output_base=output_base)
+            for output_base in output_bases]
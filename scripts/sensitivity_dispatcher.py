@@ -1,8 +1,14 @@
+import abc
 import os
+import sys
+import json
+import time
+import shlex
+import socket
+import hashlib
 import subprocess
 import argparse
 import yaml
-import time
 
 os.environ['OMP_NUM_THREADS'] = '1'
 os.environ['MKL_NUM_THREADS'] = '1'
@@ -10,6 +16,32 @@ os.environ['OPENBLAS_NUM_THREADS'] = '1'
 
 argparser = argparse.ArgumentParser()
 argparser.add_argument('--max_processes', dest='max_processes', type=int, help='Number of processes to spawn')
+argparser.add_argument('--total_cores', dest='total_cores', type=int,
+                       help='Number of cores to use. Each run uses its category\'s n_chains cores, and runs are packed '
+                            'to keep the cores busy. Defaults to the number of CPUs if --max_processes is not given')
+argparser.add_argument('--no_pinning', default=False, action='store_true',
+                       help='Don\'t pin each run to its own set of --total_cores CPUs')
+argparser.add_argument('--queue_file', dest='queue_file', type=str,
+                       help='JSON file recording the status of each run. If it exists, runs it records as done are '
+                            'skipped, so an interrupted sweep can be resumed')
+argparser.add_argument('--skip_completed', default=False, action='store_true',
+                       help='Skip runs whose configuration has already completed (new_custom.py runs only)')
+argparser.add_argument('--executor', default='local', type=str,
+                       help='Where to run: local (this machine), or shared_queue (workers pulling from --queue_dir)')
+argparser.add_argument('--queue_dir', dest='queue_dir', type=str,
+                       help='Work queue directory for the shared_queue executor, on a filesystem shared with workers')
+argparser.add_argument('--local_workers', default=0, type=int,
+                       help='shared_queue executor: number of workers to start on this machine')
+argparser.add_argument('--ssh_hosts', nargs='+', dest='ssh_hosts', type=str,
+                       help='shared_queue executor: hosts to start a worker on over ssh, in the current directory')
+argparser.add_argument('--worker', default=False, action='store_true',
+                       help='Run as a worker, running jobs from --queue_dir on --total_cores cores')
+argparser.add_argument('--exit_when_empty', default=False, action='store_true',
+                       help='Worker: exit once the queue is empty, rather than waiting for more jobs')
+argparser.add_argument('--poll_interval', default=5.0, type=float, help='Seconds between checks of the work queue')
+argparser.add_argument('--lease_timeout', default=None, type=float,
+                       help='shared_queue executor: seconds without a heartbeat after which a worker is presumed gone, '
+                            'and its running jobs are requeued. Defaults to 12 poll intervals')
 argparser.add_argument('--categories', nargs='+', dest='categories', type=str, help='Run types to execute')
 argparser.add_argument('--dry_run', default=False, action='store_true', help='Print run types selected and exit')
 argparser.add_argument('--model_type', default='default', dest='model_type', type=str,
@@ -58,33 +90,579 @@ def run_types_to_commands(run_types, exp_options, extras):
     return commands
 
 
+def run_types_to_jobs(run_types, exp_options, extras, skip_completed=False):
+    jobs = []
+    for rt in run_types:
+        for command in run_types_to_commands([rt], exp_options, extras):
+            # new_custom.py names its outputs by configuration, and checks whether they exist
+            if skip_completed and exp_options[rt]['experiment_file'] == 'new_custom.py':
+                command = f'{command} --skip_completed'
+            jobs.append({'command': command, 'n_chains': exp_options[rt]['n_chains'], 'status': 'pending',
+                         'exit_code': None})
+    return jobs
+
+
+def load_queue(queue_file, jobs):
+    """
+    Merge jobs with those recorded in queue_file, keeping the recorded status of runs which are done.
+    """
+    if queue_file is None or not os.path.exists(queue_file):
+        return jobs
+
+    with open(queue_file, 'r') as f:
+        recorded = {job['command']: job for job in json.load(f)}
+
+    for job in jobs:
+        if job['command'] in recorded and recorded[job['command']]['status'] == 'done':
+            job.update(recorded[job['command']])
+
+    return jobs
+
+
+def save_queue(queue_file, jobs):
+    if queue_file is None:
+        return
+
+    tmp_file = f'{queue_file}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(jobs, f, indent=2)
+    os.replace(tmp_file, queue_file)
+
+
+def wait_for_job(running, block=True):
+    """
+    Wait for any running job to exit, and return it with its CPUs and exit code.
+
+    If block is False and no job has exited, return None.
+    """
+    pid, status = os.waitpid(-1, 0 if block else os.WNOHANG)
+    if pid == 0:
+        return None
+
+    job, process, cpus = running.pop(pid)
+    exit_code = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    # we've already reaped the process, so Popen mustn't try to
+    process.returncode = exit_code
+    return job, cpus, exit_code
+
+
+def start_job(job, cpus=None, log_file=None):
+    """
+    Start job in a shell, pinned to cpus if given, and writing its output to log_file if given.
+    """
+    preexec_fn = None
+    if cpus is not None:
+        def preexec_fn():
+            os.sched_setaffinity(0, cpus)
+
+    if log_file is None:
+        return subprocess.Popen(job['command'], shell=True, preexec_fn=preexec_fn)
+
+    with open(log_file, 'w') as log:
+        return subprocess.Popen(job['command'], shell=True, preexec_fn=preexec_fn, stdout=log,
+                                stderr=subprocess.STDOUT)
+
+
+def get_pinning_cpus(total_cores):
+    """
+    The first total_cores CPUs this process may run on, or None if runs can't be pinned to them.
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        print('CPU pinning is not supported on this platform')
+        return None
+
+    available_cpus = sorted(os.sched_getaffinity(0))
+    if len(available_cpus) < total_cores:
+        print(f'Not pinning runs to CPUs: only {len(available_cpus)} available')
+        return None
+
+    print(f'Pinning runs to CPUs {available_cpus[:total_cores]}')
+    return available_cpus[:total_cores]
+
+
+class CorePool:
+    """
+    Cores, and optionally the specific CPUs, available to runs.
+    """
+
+    def __init__(self, total_cores, cpus=None):
+        """
+        :param total_cores: number of cores
+        :param cpus: list of total_cores CPU ids to pin runs to, or None
+        """
+        self.total_cores = total_cores
+        self.free_cores = total_cores
+        self.free_cpus = list(cpus) if cpus is not None else None
+
+    def job_cores(self, job):
+        # a run needing more cores than we have runs on its own
+        return min(job['n_chains'], self.total_cores)
+
+    def fits(self, job):
+        return self.job_cores(job) <= self.free_cores
+
+    def take(self, job):
+        """
+        Reserve cores for job, returning the CPUs to pin it to (or None).
+        """
+        n_cores = self.job_cores(job)
+        self.free_cores -= n_cores
+        if self.free_cpus is None:
+            return None
+
+        cpus, self.free_cpus = self.free_cpus[:n_cores], self.free_cpus[n_cores:]
+        return cpus
+
+    def release(self, job, cpus):
+        self.free_cores += self.job_cores(job)
+        if cpus is not None:
+            self.free_cpus = sorted(self.free_cpus + cpus)
+
+
+def run_jobs(jobs, total_cores=None, max_processes=None, queue_file=None, cpus=None):
+    """
+    Run jobs, starting each one as soon as enough cores (and processes) are free.
+
+    With total_cores, runs are packed first-fit decreasing: whenever cores are free, the largest waiting runs which fit
+    are started. With cpus, a list of total_cores CPU ids, each run is also pinned to its own disjoint subset of them.
+    Otherwise, runs are started in order.
+
+    :return: list of failed jobs
+    """
+    pending = [job for job in jobs if job['status'] != 'done']
+    core_pool = None
+    if total_cores is not None:
+        pending.sort(key=lambda job: -job['n_chains'])
+        core_pool = CorePool(total_cores, cpus)
+
+    running = {}
+
+    try:
+        while pending or running:
+            while pending and (max_processes is None or len(running) < max_processes):
+                if core_pool is None:
+                    job = pending[0]
+                else:
+                    job = next((job for job in pending if core_pool.fits(job)), None)
+                    if job is None:
+                        break
+
+                pending.remove(job)
+                job_cpus = core_pool.take(job) if core_pool is not None else None
+                process = start_job(job, job_cpus)
+                running[process.pid] = (job, process, job_cpus)
+                job['status'] = 'running'
+                job['cpus'] = job_cpus
+                save_queue(queue_file, jobs)
+
+            job, job_cpus, exit_code = wait_for_job(running)
+            if core_pool is not None:
+                core_pool.release(job, job_cpus)
+            job['status'] = 'done' if exit_code == 0 else 'failed'
+            job['exit_code'] = exit_code
+            save_queue(queue_file, jobs)
+            print(f'Finished ({exit_code}): {job["command"]}')
+
+    except KeyboardInterrupt:
+        for job, process, job_cpus in running.values():
+            job['status'] = 'pending'
+        save_queue(queue_file, jobs)
+        raise
+
+    return [job for job in jobs if job['status'] == 'failed']
+
+
+class Executor(abc.ABC):
+    """
+    Executor interface: runs a list of jobs (dicts with 'command' and 'n_chains'), somewhere.
+    """
+
+    @abc.abstractmethod
+    def run(self, jobs):
+        """
+        Run jobs, recording their 'status' ('done' or 'failed') and 'exit_code'.
+
+        :param jobs: list of job dicts. Jobs with status 'done' are skipped.
+        :return: list of failed jobs
+        """
+
+
+class LocalExecutor(Executor):
+    """
+    Run jobs on this machine, see run_jobs.
+    """
+
+    def __init__(self, total_cores=None, max_processes=None, queue_file=None, cpus=None):
+        self.total_cores = total_cores
+        self.max_processes = max_processes
+        self.queue_file = queue_file
+        self.cpus = cpus
+
+    def run(self, jobs):
+        return run_jobs(jobs, self.total_cores, self.max_processes, self.queue_file, self.cpus)
+
+
+# subdirectories of a shared work queue. A job's file moves from pending to running to done / failed.
+QUEUE_STATES = ['pending', 'running', 'done', 'failed']
+# subdirectory of a shared work queue holding a heartbeat file for each worker
+WORKERS_DIR = 'workers'
+
+
+def get_job_id(job):
+    return hashlib.sha256(job['command'].encode('utf8')).hexdigest()[:16]
+
+
+def write_job_file(path, job):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(job, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def touch(path):
+    """
+    Update the modification time of path, creating it if needed.
+    """
+    with open(path, 'a'):
+        os.utime(path)
+
+
+def is_worker_alive(worker_name, heartbeat_path, lease_timeout):
+    """
+    Whether a worker is alive: its process exists (if it is on this machine), and it has updated its heartbeat within
+    lease_timeout seconds.
+    """
+    host, _, pid = worker_name.rpartition(':')
+    if host == socket.gethostname() and pid.isdigit():
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+
+    try:
+        return time.time() - os.path.getmtime(heartbeat_path) <= lease_timeout
+    except FileNotFoundError:
+        return False
+
+
+def get_live_workers(queue_dir, lease_timeout):
+    """
+    :return: names of the workers of queue_dir which are alive, see is_worker_alive
+    """
+    workers_dir = os.path.join(queue_dir, WORKERS_DIR)
+    return [name for name in os.listdir(workers_dir)
+            if is_worker_alive(name, os.path.join(workers_dir, name), lease_timeout)]
+
+
+def requeue_stale_jobs(queue_dir, lease_timeout):
+    """
+    Move running jobs whose worker is gone (see is_worker_alive) back to pending. The running job files of live workers
+    are touched with their heartbeat, so a job is also requeued if its file hasn't been updated within lease_timeout.
+
+    :return: number of requeued jobs
+    """
+    running_dir = os.path.join(queue_dir, 'running')
+    requeued = 0
+    for name in sorted(os.listdir(running_dir)):
+        if not name.endswith('.json'):
+            continue
+        running_path = os.path.join(running_dir, name)
+        try:
+            with open(running_path, 'r') as f:
+                job = json.load(f)
+            heartbeat_path = os.path.join(queue_dir, WORKERS_DIR, job.get('worker', ''))
+            if 'worker' in job and is_worker_alive(job['worker'], heartbeat_path, lease_timeout) and \
+                    time.time() - os.path.getmtime(running_path) <= lease_timeout:
+                continue
+            if 'worker' not in job and time.time() - os.path.getmtime(running_path) <= lease_timeout:
+                # just claimed, the worker hasn't recorded itself yet
+                continue
+
+            pending_path = os.path.join(queue_dir, 'pending', name)
+            os.rename(running_path, pending_path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            # finished, or being written
+            continue
+
+        print(f'Requeued {job["command"]}, whose worker {job.get("worker")} is gone')
+        job.pop('worker', None)
+        write_job_file(pending_path, dict(job, status='pending'))
+        requeued += 1
+
+    return requeued
+
+
+def claim_job(queue_dir, core_pool, worker_name):
+    """
+    Claim the largest pending job in queue_dir which fits in core_pool, moving it to running.
+
+    Claiming is an atomic rename, so each job is claimed by exactly one worker.
+
+    :return: (job, path of job file) tuple, or None if no pending job fits
+    """
+    pending_dir = os.path.join(queue_dir, 'pending')
+    candidates = []
+    for name in sorted(os.listdir(pending_dir)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(pending_dir, name), 'r') as f:
+                candidates.append((name, json.load(f)))
+        except (FileNotFoundError, json.JSONDecodeError):
+            # claimed by another worker, or still being written
+            continue
+
+    for name, job in sorted(candidates, key=lambda c: -c[1]['n_chains']):
+        if not core_pool.fits(job):
+            continue
+        running_path = os.path.join(queue_dir, 'running', name)
+        try:
+            # renaming keeps the modification time, which must be recent for running jobs (see requeue_stale_jobs)
+            os.utime(os.path.join(pending_dir, name))
+            os.rename(os.path.join(pending_dir, name), running_path)
+        except FileNotFoundError:
+            continue
+        job['worker'] = worker_name
+        write_job_file(running_path, job)
+        return job, running_path
+
+    return None
+
+
+def run_worker(queue_dir, total_cores, cpus=None, poll_interval=5.0, exit_when_empty=False):
+    """
+    Run jobs from a shared work queue, packing them onto this machine's cores as in run_jobs.
+
+    Each job's output goes to {queue_dir}/logs/{job id}.log, and its file is moved to done or failed when it exits.
+    While running, the worker touches its heartbeat file, {queue_dir}/workers/{worker name}, and the files of its running
+    jobs every poll_interval seconds, so the dispatcher can requeue the jobs of a worker which has died.
+
+    :param queue_dir: work queue directory, on a filesystem shared with the dispatcher
+    :param total_cores: number of cores to use
+    :param cpus: list of total_cores CPU ids to pin runs to, or None
+    :param poll_interval: seconds between checks for new jobs
+    :param exit_when_empty: if True, exit once no jobs are pending or running. Otherwise, wait for more jobs.
+    """
+    worker_name = f'{socket.gethostname()}:{os.getpid()}'
+    heartbeat_path = os.path.join(queue_dir, WORKERS_DIR, worker_name)
+    os.makedirs(os.path.dirname(heartbeat_path), exist_ok=True)
+    try:
+        _run_worker(queue_dir, worker_name, heartbeat_path, CorePool(total_cores, cpus), poll_interval, exit_when_empty)
+    finally:
+        if os.path.exists(heartbeat_path):
+            os.remove(heartbeat_path)
+
+
+def _run_worker(queue_dir, worker_name, heartbeat_path, core_pool, poll_interval, exit_when_empty):
+    running = {}
+
+    while True:
+        touch(heartbeat_path)
+        for (_, job_path), _, _ in running.values():
+            try:
+                os.utime(job_path)
+            except FileNotFoundError:
+                # requeued by the dispatcher, presuming this worker gone
+                pass
+
+        claimed = claim_job(queue_dir, core_pool, worker_name)
+        while claimed is not None:
+            job, job_path = claimed
+            job_cpus = core_pool.take(job)
+            log_file = os.path.join(queue_dir, 'logs', f'{get_job_id(job)}.log')
+            process = start_job(job, job_cpus, log_file)
+            running[process.pid] = ((job, job_path), process, job_cpus)
+            print(f'{worker_name} started: {job["command"]}')
+            claimed = claim_job(queue_dir, core_pool, worker_name)
+
+        if not running:
+            if exit_when_empty and not os.listdir(os.path.join(queue_dir, 'pending')):
+                return
+            time.sleep(poll_interval)
+            continue
+
+        # wait for a job to finish, but check for new jobs every poll_interval seconds
+        deadline = time.time() + poll_interval
+        finished = wait_for_job(running, block=False)
+        while finished is None and time.time() < deadline:
+            time.sleep(min(0.5, poll_interval))
+            finished = wait_for_job(running, block=False)
+
+        while finished is not None:
+            (job, job_path), job_cpus, exit_code = finished
+            core_pool.release(job, job_cpus)
+            job['status'] = 'done' if exit_code == 0 else 'failed'
+            job['exit_code'] = exit_code
+            write_job_file(job_path, job)
+            os.replace(job_path, os.path.join(queue_dir, job['status'], os.path.basename(job_path)))
+            print(f'{worker_name} finished ({exit_code}): {job["command"]}')
+            finished = wait_for_job(running, block=False) if running else None
+
+
+class SharedQueueExecutor(Executor):
+    """
+    Run jobs on workers pulling from a work queue directory on a shared filesystem.
+
+    Workers (sensitivity_dispatcher.py --worker --queue_dir ...) can be started on any machine which shares both the
+    queue directory and the repository (runs write their results relative to the working directory). The executor
+    can also start workers itself: locally, or on other machines over ssh. Jobs already done in the queue directory
+    are not run again, and jobs left running by a worker which has died are requeued, so an interrupted sweep can be
+    resumed.
+    """
+
+    def __init__(self, queue_dir, local_workers=0, ssh_hosts=None, worker_cores=None, poll_interval=5.0,
+                 lease_timeout=None):
+        """
+        :param queue_dir: work queue directory
+        :param local_workers: number of workers to start on this machine
+        :param ssh_hosts: hosts to start a worker on over ssh, in the same working directory as this process
+        :param worker_cores: number of cores for each started worker to use. Defaults to the number of CPUs.
+        :param poll_interval: seconds between checks of the queue
+        :param lease_timeout: seconds without a heartbeat after which a worker is presumed gone, and its running jobs
+                              are requeued. Defaults to 12 poll intervals.
+        """
+        self.queue_dir = queue_dir
+        self.local_workers = local_workers
+        self.ssh_hosts = ssh_hosts if ssh_hosts is not None else []
+        self.worker_cores = worker_cores
+        self.poll_interval = poll_interval
+        self.lease_timeout = lease_timeout if lease_timeout is not None else 12 * poll_interval
+
+        for state in QUEUE_STATES + ['logs', WORKERS_DIR]:
+            os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+
+    def worker_command(self, python=sys.executable):
+        command = [python, 'scripts/sensitivity_dispatcher.py', '--worker', '--exit_when_empty', '--queue_dir',
+                   os.path.abspath(self.queue_dir), '--poll_interval', str(self.poll_interval)]
+        if self.worker_cores is not None:
+            command.extend(['--total_cores', str(self.worker_cores)])
+        return command
+
+    def start_workers(self):
+        workers = [subprocess.Popen(self.worker_command()) for _ in range(self.local_workers)]
+        # remote workers use the python on their PATH
+        remote_command = ' '.join(shlex.quote(c) for c in self.worker_command('python'))
+        remote_command = f'cd {shlex.quote(os.getcwd())} && {remote_command}'
+        workers.extend(subprocess.Popen(['ssh', host, remote_command]) for host in self.ssh_hosts)
+        return workers
+
+    def job_path(self, state, job_id):
+        return os.path.join(self.queue_dir, state, f'{job_id}.json')
+
+    def submit(self, jobs):
+        """
+        Add jobs to the pending queue, unless they are already done, pending or running. Running jobs whose worker is
+        gone are requeued (see requeue_stale_jobs).
+
+        :return: dictionary mapping job ids to jobs, for the jobs not yet done
+        """
+        requeue_stale_jobs(self.queue_dir, self.lease_timeout)
+
+        submitted = {}
+        for job in jobs:
+            job_id = get_job_id(job)
+            if job['status'] == 'done' or os.path.exists(self.job_path('done', job_id)):
+                job['status'] = 'done'
+                continue
+
+            submitted[job_id] = job
+            if os.path.exists(self.job_path('pending', job_id)) or os.path.exists(self.job_path('running', job_id)):
+                continue
+            if os.path.exists(self.job_path('failed', job_id)):
+                os.remove(self.job_path('failed', job_id))
+            write_job_file(self.job_path('pending', job_id), dict(job, status='pending'))
+
+        return submitted
+
+    def run(self, jobs):
+        waiting = self.submit(jobs)
+        print(f'Queued {len(waiting)} runs in {self.queue_dir}')
+        workers = self.start_workers()
+        # without workers started by this process, wait up to lease_timeout for external workers
+        last_alive = time.time()
+
+        while waiting:
+            requeue_stale_jobs(self.queue_dir, self.lease_timeout)
+            # checked before collecting finished jobs, so jobs finished by workers which have since exited are collected.
+            # Workers started by this process count as alive until they exit, as they may not have written a heartbeat.
+            alive = any(worker.poll() is None for worker in workers) or get_live_workers(self.queue_dir,
+                                                                                         self.lease_timeout)
+
+            for job_id in list(waiting):
+                for state in ['done', 'failed']:
+                    if os.path.exists(self.job_path(state, job_id)):
+                        with open(self.job_path(state, job_id), 'r') as f:
+                            waiting.pop(job_id).update(json.load(f))
+                        break
+
+            if alive:
+                last_alive = time.time()
+            elif waiting and (workers or time.time() - last_alive > self.lease_timeout):
+                print(f'No workers are alive, with {len(waiting)} runs not finished')
+                break
+
+            if waiting:
+                time.sleep(self.poll_interval)
+
+        for worker in workers:
+            worker.wait()
+
+        return [job for job in jobs if job['status'] != 'done']
+
+
 if __name__ == '__main__':
 
+    total_cores = args.total_cores
+    if total_cores is None and (args.max_processes is None or args.worker):
+        total_cores = os.cpu_count()
+
+    if args.worker:
+        if args.queue_dir is None:
+            raise ValueError('--queue_dir is required by --worker')
+        cpus = get_pinning_cpus(total_cores) if not args.no_pinning else None
+        run_worker(args.queue_dir, total_cores, cpus, args.poll_interval, args.exit_when_empty)
+        sys.exit(0)
+
     with open('scripts/sensitivity_analysis/sensitivity_analysis.yaml', 'r') as stream:
         try:
             exp_options = yaml.safe_load(stream)
         except yaml.YAMLError as exc:
             print(exc)
 
-    commands = run_types_to_commands(args.categories, exp_options, extras)
+    jobs = load_queue(args.queue_file, run_types_to_jobs(args.categories, exp_options, extras, args.skip_completed))
+    n_done = len([job for job in jobs if job['status'] == 'done'])
 
     print('Running Univariate Sensitivity Analysis\n'
           '---------------------------------------\n\n'
           f'Categories: {args.categories}\n'
-          f'You have requested {len(commands)} runs')
+          f'You have requested {len(jobs)} runs, {n_done} of which are already done')
 
     if args.dry_run:
         print('Performing Dry Run')
-        for c in commands:
-            print(c)
+        for job in jobs:
+            if job['status'] != 'done':
+                print(job['command'])
     else:
-        processes = set()
-        max_processes = args.max_processes
-
-        for command in commands:
-            processes.add(subprocess.Popen(command, shell=True))
-            time.sleep(30.0)
-            if len(processes) >= max_processes:
-                os.wait()
-                processes.difference_update([
-                    p for p in processes if p.poll() is not None])
+        if args.executor == 'local':
+            cpus = None
+            if total_cores is not None and not args.no_pinning:
+                cpus = get_pinning_cpus(total_cores)
+            executor = LocalExecutor(total_cores, args.max_processes, args.queue_file, cpus)
+        elif args.executor == 'shared_queue':
+            if args.queue_dir is None:
+                raise ValueError('--queue_dir is required by the shared_queue executor')
+            executor = SharedQueueExecutor(args.queue_dir, args.local_workers, args.ssh_hosts, args.total_cores,
+                                           args.poll_interval, args.lease_timeout)
+        else:
+            raise ValueError(f'Unknown executor {args.executor}')
+
+        failed_jobs = executor.run(jobs)
+
+        print(f'{len(jobs) - len(failed_jobs)} runs done, {len(failed_jobs)} failed')
+        for job in failed_jobs:
+            print(f'Failed ({job.get("exit_code", "not finished")}): {job["command"]}')
+
+        if failed_jobs:
+            sys.exit(1)
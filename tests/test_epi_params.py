@@ -0,0 +1,27 @@
+"""
+Tests of EpidemiologicalParameters' delay discretisation.
+"""
+import numpy as np
+import pytest
+
+from epimodel import EpidemiologicalParameters
+
+
+def _negbinom(mean, disp):
+    return {'dist': 'negbinom', 'mean_mean': mean, 'mean_sd': 0., 'disp_mean': disp, 'disp_sd': 0.}
+
+
+@pytest.mark.parametrize('dists', [[_negbinom(3., 5.)], [_negbinom(3., 5.), _negbinom(6., 2.)]])
+def test_discretise_dists_matches_samples_all_negbinom(dists):
+    """
+    With only discrete delays, the exact pmf matches the histogram of samples of their sum.
+    """
+    epi_params = EpidemiologicalParameters(seed=0)
+    max_int = 16
+    # independent samples of each delay (generate_dist_samples reseeds, so would correlate them)
+    rng = np.random.RandomState(0)
+    samples = sum(rng.negative_binomial(d['disp_mean'], d['disp_mean'] / (d['disp_mean'] + d['mean_mean']),
+                                        size=int(1e6)) for d in dists)
+
+    exact = epi_params.discretise_dists(dists, max_int)
+    np.testing.assert_allclose(exact, epi_params.discretise_samples(samples, max_int), atol=3e-3)
@@ -0,0 +1,50 @@
+"""
+Tests of MaskedNegativeBinomial and its likelihood Op, against pymc3.NegativeBinomial.
+"""
+import numpy as np
+import pymc3 as pm
+import pytest
+import theano
+import theano.tensor as tt
+
+from epimodel.pymc3_distributions.masked_negative_binomial import MaskedNegativeBinomial, MaskedNegativeBinomialLogp
+
+# observed flat indices of a (3, 4) tensor of expected values, with repeated indices
+INDICES = np.array([0, 2, 2, 5, 7, 7, 7, 11])
+OBSERVED = np.array([1., 4., 2., 0., 3., 3., 8., 5.])
+
+
+@pytest.mark.parametrize('alpha', [4., 1e11])
+def test_logp_grad(alpha):
+    """
+    The Op's gradient matches finite differences, including at repeated indices.
+    """
+    rng = np.random.RandomState(0)
+    mu = rng.uniform(0.5, 5., size=(3, 4))
+    with theano.change_flags(compute_test_value='off'):
+        theano.gradient.verify_grad(lambda m, a: MaskedNegativeBinomialLogp()(m, a, INDICES, OBSERVED)[0],
+                                    [mu, np.array(alpha)], rng=rng)
+
+
+def _model(masked):
+    with pm.Model() as model:
+        mu = pm.Lognormal('mu', 0., 1., shape=(3, 4))
+        alpha = pm.Lognormal('alpha', 1., 1.)
+        if masked:
+            MaskedNegativeBinomial('observed', mu=mu, alpha=alpha, indices=INDICES, observed=OBSERVED)
+        else:
+            pm.NegativeBinomial('observed', mu=mu.flatten()[INDICES], alpha=alpha, observed=OBSERVED)
+    return model
+
+
+def test_logp_dlogp_match_negative_binomial():
+    """
+    A model observing MaskedNegativeBinomial has the logp and dlogp of one observing the gathered expected values with
+    pymc3.NegativeBinomial.
+    """
+    masked, reference = _model(True), _model(False)
+    rng = np.random.RandomState(1)
+    point = {name: value + 0.3 * rng.randn(*np.shape(value)) for name, value in reference.test_point.items()}
+
+    np.testing.assert_allclose(masked.logp(point), reference.logp(point), rtol=1e-10)
+    np.testing.assert_allclose(masked.dlogp()(point), reference.dlogp()(point), rtol=1e-8, atol=1e-10)
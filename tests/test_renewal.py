@@ -0,0 +1,44 @@
+"""
+Tests of the DiscreteRenewal Op, against a plain NumPy recursion.
+"""
+import numpy as np
+import theano
+import theano.tensor as T
+
+from epimodel.pymc3_models.renewal import DiscreteRenewal
+
+GI = np.array([0.1, 0.3, 0.4, 0.2])
+
+
+def _renewal_numpy(R, initial, gi):
+    """
+    Infections of the renewal process, day by day, for R of shape (nRs, nDs) and initial of shape (nRs, len(gi)).
+    """
+    infected = [list(region_initial) for region_initial in initial]
+    for region_R, region_infected in zip(R, infected):
+        for r in region_R:
+            region_infected.append(r * sum(g * region_infected[-(i + 1)] for i, g in enumerate(gi)))
+    return np.array(infected)
+
+
+def test_forward_matches_numpy():
+    rng = np.random.RandomState(0)
+    R = rng.uniform(0.5, 2., size=(3, 10))
+    initial = rng.uniform(1., 10., size=(3, GI.size))
+
+    with theano.change_flags(compute_test_value='off'):
+        R_var, initial_var = T.matrix(), T.matrix()
+        fn = theano.function([R_var, initial_var], DiscreteRenewal(GI)(R_var, initial_var))
+
+    np.testing.assert_allclose(fn(R, initial), _renewal_numpy(R, initial, GI), rtol=1e-12)
+
+
+def test_grad():
+    """
+    The gradients with respect to R and the initial infections match finite differences.
+    """
+    rng = np.random.RandomState(1)
+    R = rng.uniform(0.5, 2., size=(3, 10))
+    initial = rng.uniform(1., 10., size=(3, GI.size))
+    with theano.change_flags(compute_test_value='off'):
+        theano.gradient.verify_grad(DiscreteRenewal(GI), [R, initial], rng=rng)